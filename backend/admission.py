@@ -0,0 +1,155 @@
+"""
+LLM 呼び出しの受付制御（admission control）。
+上流のレート制限に当たってから全員がタイムアウトまで待つのではなく、手前で絞って、溢れた分はすぐ断る。
+
+- 同時実行数 : max_in_flight 本まで。超えた分は FIFO の待ち行列に入る
+- 待ち行列   : max_queue 件まで。満杯なら待たずに断る（queue_full）
+               max_wait 秒待っても順番が来なければ断る（timeout）
+- レート     : RPM / TPM のトークンバケット。max_wait の残りで間に合わなければ断る（rate_limit）
+
+断られた呼び出しは LLM が失敗した時と同じ扱い（空文字）にして、呼び出し側のルール判定・全文検索に落とす。
+イベントループ上でだけ使う（ロックは持たない）。
+"""
+import asyncio, time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict
+
+SHED_REASONS = ("queue_full", "timeout", "rate_limit")
+
+
+class TokenBucket:
+    """1分あたり per_minute だけ補充（容量も1分ぶん）。reserve は借り越しを許し、使えるまでの秒数を返す"""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = float(per_minute)
+        self.level = self.per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def reserve(self, n: float, now: float) -> float:
+        self._refill(now)
+        self.level -= min(n, self.per_minute)   # 容量より大きい要求も1分待てば通す
+        return 0.0 if self.level >= 0 else -self.level * 60 / self.per_minute
+
+    def refund(self, n: float) -> None:
+        self.level = min(self.per_minute, self.level + min(n, self.per_minute))
+
+
+class Admission:
+    """同時実行数・待ち行列・レートで LLM 呼び出しを通すか決める。async with admit(tokens) as ok: で使う"""
+
+    def __init__(self, max_in_flight: int, max_queue: int = 0, max_wait: float = 0.0,
+                 rpm: float = 0, tpm: float = 0):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max(0.0, max_wait)
+        self.rpm = TokenBucket(rpm) if rpm > 0 else None
+        self.tpm = TokenBucket(tpm) if tpm > 0 else None
+        self.in_flight = 0
+        self._waiters: Deque["asyncio.Future"] = deque()
+        self.counters = {"admitted": 0, "queued_total": 0, **{f"shed_{r}": 0 for r in SHED_REASONS}}
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _shed(self, reason: str) -> bool:
+        self.counters[f"shed_{reason}"] += 1
+        return False
+
+    async def _wait(self, deadline: float) -> bool:
+        """順番待ち。枠を渡されたら True（release が in_flight を減らさずにそのまま渡す）"""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self.counters["queued_total"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), max(0.0, deadline - time.monotonic()))
+            return True
+        except asyncio.TimeoutError:
+            if fut.done():
+                return True   # 期限と同時に順番が来た
+            return False
+        except BaseException:
+            if fut.done():
+                self.release()   # 受け取った枠は次の待ち手へ
+            raise
+        finally:
+            if not fut.done():
+                fut.cancel()
+                self._waiters.remove(fut)
+
+    def _reserve(self, tokens: int) -> float:
+        now = time.monotonic()
+        delay = 0.0
+        if self.rpm is not None:
+            delay = max(delay, self.rpm.reserve(1, now))
+        if self.tpm is not None:
+            delay = max(delay, self.tpm.reserve(tokens, now))
+        return delay
+
+    def _refund(self, tokens: int) -> None:
+        if self.rpm is not None:
+            self.rpm.refund(1)
+        if self.tpm is not None:
+            self.tpm.refund(tokens)
+
+    async def acquire(self, tokens: int = 0) -> bool:
+        """通すなら True（終わったら release する）。断る時は待たずに（または期限で）False"""
+        deadline = time.monotonic() + self.max_wait
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+        elif len(self._waiters) >= self.max_queue:
+            return self._shed("queue_full")
+        elif not await self._wait(deadline):
+            return self._shed("timeout")
+
+        delay = self._reserve(tokens)
+        if delay > 0:
+            if time.monotonic() + delay > deadline:
+                self._refund(tokens)
+                self.release()
+                return self._shed("rate_limit")
+            try:
+                await asyncio.sleep(delay)
+            except BaseException:
+                self.release()
+                raise
+        self.counters["admitted"] += 1
+        return True
+
+    def release(self) -> None:
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def admit(self, tokens: int = 0) -> AsyncIterator[bool]:
+        ok = await self.acquire(tokens)
+        try:
+            yield ok
+        finally:
+            if ok:
+                self.release()
+
+    def shed(self) -> int:
+        return sum(self.counters[f"shed_{r}"] for r in SHED_REASONS)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "max_wait_sec": self.max_wait,
+            "rpm": self.rpm.per_minute if self.rpm else 0,
+            "tpm": self.tpm.per_minute if self.tpm else 0,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            **self.counters,
+            "shed": self.shed(),
+        }
@@ -0,0 +1,155 @@
+"""
+classify_by_rules（aclassify_tool のルール経路）と find_calendar の条件抽出について、
+旧実装（re.search の連続＋イベントのタイトルごとの正規表現）と
+単一走査のキーワード表（intents.py）＋ロード時タグ付けの1リクエストあたり CPU 時間を比べる。
+（ルール分類だけを見ると、最初のヒットで打ち切る旧実装の方が速い。全タグを1回で集めて
+ find_calendar と共有するので、分類＋学年暦の経路全体で速くなる）
+
+使い方（backend/ で実行。main を import するので backend の依存が必要）:
+    python bench/bench_intents.py
+    python bench/bench_intents.py --repeat 2000
+"""
+import argparse, os, re, sys, time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+
+QUESTIONS = [
+    "夏休みはいつですか？",
+    "冬休みはいつから？",
+    "春休みの期間を教えて",
+    "休業期間はいつ？",
+    "後期の授業開始はいつ？",
+    "前学期の授業終了日",
+    "第3クォーターの授業終了はいつ",
+    "第２クォーターの授業開始",
+    "Q4の試験期間",
+    "今日のイベントは？",
+    "2025-08-20 は何の日？",
+    "井上先生のオフィスアワーは？",
+    "宮崎先生の研究室はどこ",
+    "サッカー部はありますか",
+    "どんなサークルがある？",
+    "那覇の天気",
+    "学生証の再発行はどこでできますか",
+    "図書館の開館時間を知りたい",
+]
+
+
+# ---- 旧実装（比較用にそのまま残す）----
+def legacy_classify(user_text: str) -> str:
+    if re.search(r"(夏休み|冬休み|春休み|休業|休暇|祝日|連休|学事暦|スケジュール)", user_text):
+        return "calendar"
+    if re.search(r"(授業開始|授業再開|授業終了|開講|閉講|授業|休講|試験|成績|学期|カレンダー|学年暦|Q[1-4１-４])", user_text):
+        return "calendar"
+    if re.search(r"(先生|教授|オフィスアワー|研究室)", user_text):
+        return "teacher"
+    if re.search(r"(サークル|部活|クラブ|同好会|団体|部員)", user_text):
+        return "clubs"
+    if "天気" in user_text:
+        return "weather"
+    return "data_qa"
+
+
+def legacy_find_calendar(text: str) -> str:
+    v = main.STORE.current
+    events = v.cal_index.events
+    z2h = str.maketrans("０１２３４５６７８９", "0123456789")
+    norm_text = text.translate(z2h)
+    span = main.parse_date_range(norm_text)
+    if span:
+        events = v.cal_index.overlapping(*span)
+
+    def fmt_line(e) -> str:
+        if e.end != e.start:
+            return f"- {e.title}: {e.start_iso} ～ {e.end_iso}"
+        return f"- {e.title}: {e.start_iso}"
+
+    kw_map = {"夏": ["夏季休業", "夏休み"], "冬": ["冬季休業", "冬休み"], "春": ["春季休業", "春休み"]}
+    season = None
+    if re.search(r"夏", norm_text): season = "夏"
+    elif re.search(r"冬", norm_text): season = "冬"
+    elif re.search(r"春", norm_text): season = "春"
+    if season or re.search(r"(休業|休暇|休み)", norm_text):
+        keys = kw_map.get(season, None)
+        hits = [e for e in events
+                if (keys and any(k in e.title for k in keys)) or (not keys and re.search(r"(休業|休暇|休み)", e.title))]
+        if hits:
+            head = f"📅 {season+'休み' if season else '休暇関連'}イベント:"
+            return "\n".join([head] + [fmt_line(e) for e in hits])
+
+    kw_start = re.search(r"(授業開始|授業再開|開講)", norm_text)
+    kw_end = re.search(r"(授業終了|閉講)", norm_text)
+    want_front = bool(re.search(r"(前学期|前期)", norm_text))
+    want_back = bool(re.search(r"(後学期|後期)", norm_text))
+    m_q = re.search(r"第\s*([1-4])\s*クォーター", norm_text)
+    want_q = m_q.group(1) if m_q else None
+
+    def match_term_filters(title: str) -> bool:
+        if want_q and (f"第{want_q}クォーター" not in title):
+            return False
+        if want_front and not (("前学期" in title) or ("第1クォーター" in title) or ("第2クォーター" in title)):
+            return False
+        if want_back and not (("後学期" in title) or ("第3クォーター" in title) or ("第4クォーター" in title)):
+            return False
+        return True
+
+    if kw_start or kw_end:
+        hits = []
+        for e in events:
+            if kw_start and re.search(r"(授業開始|授業再開|開講)", e.title):
+                if match_term_filters(e.title):
+                    hits.append(e)
+            elif kw_end and re.search(r"(授業終了|閉講)", e.title):
+                if match_term_filters(e.title):
+                    hits.append(e)
+        if hits:
+            return "\n".join(["📅 授業スケジュール:"] + [fmt_line(e) for e in hits])
+
+    lo, hi = span or (datetime.now(main.JST).date(),) * 2
+    label = lo.isoformat() if lo == hi else f"{lo.isoformat()} ～ {hi.isoformat()}"
+    day_hits = events if span else v.cal_index.at(lo)
+    if not day_hits:
+        return f"📅 {label} に該当イベントはありません。"
+    if lo == hi:
+        return "📅 " + label + " の主なイベント:\n" + "\n".join(f"- {e.title}" for e in day_hits)
+    return "📅 " + label + " の主なイベント:\n" + "\n".join(fmt_line(e) for e in day_hits)
+
+
+def per_request_us(fn, repeat: int) -> float:
+    t0 = time.process_time()
+    for _ in range(repeat):
+        for q in QUESTIONS:
+            fn(q)
+    return (time.process_time() - t0) / (repeat * len(QUESTIONS)) * 1e6
+
+
+def main_():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeat", type=int, default=500)
+    args = ap.parse_args()
+
+    # 結果が一致することを先に確認（Q◯ をクォーターとして解釈するのは新実装のみ）
+    for q in QUESTIONS:
+        assert legacy_classify(q) == main.classify_by_rules(q), q
+        if "Q" not in q:
+            assert legacy_find_calendar(q) == main.find_calendar(q), q
+
+    rows = [
+        ("classify (rules)", legacy_classify, main.classify_by_rules),
+        ("find_calendar", legacy_find_calendar, main.find_calendar),
+        ("classify + calendar",
+         lambda q: legacy_find_calendar(q) if legacy_classify(q) == "calendar" else None,
+         lambda q: main.find_calendar(q) if main.classify_by_rules(q) == "calendar" else None),
+    ]
+    print(f"{'stage':<22} {'before[us/req]':>15} {'after[us/req]':>14} {'speedup':>8}")
+    for name, old, new in rows:
+        a = per_request_us(old, args.repeat)
+        b = per_request_us(new, args.repeat)
+        print(f"{name:<22} {a:>15.2f} {b:>14.2f} {a/b:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main_()
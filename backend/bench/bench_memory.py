@@ -0,0 +1,86 @@
+"""
+教員・サークルのレコードのメモリ量（dict の配列 vs records の列指向の表）。
+
+backend/data を bench_tools と同じやり方で 1x / 10x / 100x に水増しし、
+- dict   : json.load したままの dict の配列（以前の TEACHERS / CLUBS）
+- table  : records.TeacherTable / ClubTable（dict は捨てた後）
+- store  : そのデータで作った DataStore 全体（索引を含む。参考）
+を tracemalloc で測る。dict / table は、intern 済みの文字列（3.12 では解放されない）を
+先に測ったものと共有して小さく見えないよう、main を import しない子プロセスで1つずつ測る。
+
+使い方（backend/ で実行）:
+    python bench/bench_memory.py
+    python bench/bench_memory.py --scales 100
+"""
+import argparse, gc, json, os, subprocess, sys, tempfile, tracemalloc
+from typing import Any, Callable, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+MB = 1024 * 1024
+
+
+def traced(fn: Callable[[], Any]) -> Tuple[Any, int]:
+    """fn() の戻り値と、それが保持しているバイト数（作業中の一時オブジェクトは除く）"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        obj = fn()
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return obj, size
+
+
+def load(path: str) -> Any:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def measure(kind: str, name: str, path: str) -> Tuple[int, int]:
+    """（子プロセス側）kind="dict" なら json.load の結果、"table" なら表だけのバイト数と行数"""
+    from records import ClubTable, TeacherTable
+    cls = TeacherTable if name == "ryukyu_office_hours" else ClubTable
+    fn = (lambda: load(path)) if kind == "dict" else (lambda: cls(load(path)))
+    obj, size = traced(fn)
+    return size, len(obj)
+
+
+def measure_in_child(kind: str, name: str, path: str) -> Tuple[int, int]:
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", kind, name, path],
+                         check=True, capture_output=True, text=True).stdout
+    size, n = out.split()
+    return int(size), int(n)
+
+
+def main_() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    ap.add_argument("--measure", nargs=3, metavar=("KIND", "NAME", "PATH"), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.measure:
+        print(*measure(*args.measure))
+        return 0
+
+    sys.path.insert(0, BENCH_DIR)
+    import bench_tools  # main の import と環境変数の設定を含む
+
+    print(f"{'scale':>5} {'dataset':<20} {'rows':>8} {'dict[MB]':>9} {'table[MB]':>10} {'ratio':>6} {'B/row':>11}")
+    for k in args.scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            bench_tools.scaled_store(k, tmp)   # 水増しした JSON を tmp に書く
+            for name in ("ryukyu_office_hours", "clubs"):
+                path = os.path.join(tmp, f"{name}.json")
+                dict_b, n = measure_in_child("dict", name, path)
+                table_b, _ = measure_in_child("table", name, path)
+                print(f"{k:>4}x {name:<20} {n:>8,} {dict_b / MB:>9.2f} {table_b / MB:>10.2f} "
+                      f"{table_b / dict_b:>6.2f} {dict_b // max(n, 1):>5}→{table_b // max(n, 1):<5}")
+            store, store_b = traced(lambda: bench_tools.scaled_store(k, tmp))
+            print(f"{k:>4}x {'(store total)':<20} {'':>8} {'':>9} {store_b / MB:>10.2f}")
+            del store
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
@@ -0,0 +1,114 @@
+"""
+search_data_any の旧実装（毎回 json.dumps + 部分一致の全走査）と
+n-gram 転置インデックス版の比較ベンチマーク。
+
+使い方（backend/ で実行）:
+    python bench/bench_search_index.py            # 1x / 10x / 100x
+    python bench/bench_search_index.py --scales 1 10
+"""
+import argparse, glob, json, os, re, sys, time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search_index import NgramIndex, stringify  # noqa: E402
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+QUERIES = [
+    "夏休みはいつですか",
+    "井上 オフィスアワー",
+    "サッカー 部活",
+    "工学部 研究室 メール",
+    "授業開始 第3クォーター",
+    "ダイビング サークル 土曜日",
+    "人文社会学部 火曜日",
+    "存在しない 単語 テスト",
+]
+
+
+def load_data() -> Dict[str, Any]:
+    store = {}
+    for path in glob.glob(os.path.join(DATA_DIR, "*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            store[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+    return store
+
+
+def scale_data(data: Dict[str, Any], k: int) -> Dict[str, Any]:
+    """配列データを k 倍に複製（値に連番を付けて n-gram が完全重複しないようにする）"""
+    if k <= 1:
+        return data
+    out: Dict[str, Any] = {}
+    for fname, content in data.items():
+        if not isinstance(content, list):
+            out[fname] = content
+            continue
+        rows = []
+        for r in range(k):
+            for item in content:
+                if isinstance(item, dict) and r:
+                    item = {key: (f"{v}{r}" if isinstance(v, str) else v) for key, v in item.items()}
+                rows.append(item)
+        out[fname] = rows
+    return out
+
+
+def linear_search(data: Dict[str, Any], terms: List[str]):
+    """旧 search_data_any のスコアリング部分そのまま"""
+    hits = []
+    for fname, content in data.items():
+        if isinstance(content, list):
+            for idx, item in enumerate(content):
+                blob = stringify(item)
+                score = sum(1 for t in terms if t in blob)
+                if score:
+                    hits.append((score, fname, idx, item))
+        elif isinstance(content, dict):
+            blob = stringify(content)
+            score = sum(1 for t in terms if t in blob)
+            if score:
+                hits.append((score, fname, "", content))
+    hits.sort(key=lambda x: x[0], reverse=True)
+    return hits
+
+
+def split_terms(q: str) -> List[str]:
+    return [t for t in re.split(r"[^\w一-龥ぁ-んァ-ンー]+", q) if t]
+
+
+def timeit(fn, repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    base = load_data()
+    print(f"{'scale':>5} {'records':>8} {'build[ms]':>10} {'linear[ms/q]':>13} {'index[ms/q]':>12} {'speedup':>8}")
+    for k in args.scales:
+        data = scale_data(base, k)
+        t0 = time.perf_counter()
+        index = NgramIndex(data)
+        build = time.perf_counter() - t0
+
+        term_sets = [split_terms(q) for q in QUERIES]
+        for terms in term_sets:
+            # 結果（上位5件）が旧実装と一致することを確認
+            a = [(s, f, i) for s, f, i, _ in linear_search(data, terms)[:5]]
+            b = [(s, f, i) for s, f, i, _ in index.search(terms)[:5]]
+            assert a == b, (terms, a, b)
+
+        rep = max(1, args.repeat // k) if k >= 100 else args.repeat
+        lin = timeit(lambda: [linear_search(data, t) for t in term_sets], rep) / len(term_sets)
+        idx = timeit(lambda: [index.search(t) for t in term_sets], args.repeat) / len(term_sets)
+        print(f"{k:>5} {len(index):>8} {build*1e3:>10.1f} {lin*1e3:>13.3f} {idx*1e3:>12.3f} {lin/idx:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+ローカルツール関数の CPU マイクロベンチマーク。
+
+find_calendar / find_teacher / find_club / search_data_any / classify_by_rules / parse_date を
+学生の質問コーパスで回し、関数ごとに ns/op・p50・p99・1回あたりのピークメモリ確保量を出す。
+データは同梱の backend/data（1x）と、教員・サークルを 10x / 100x に水増ししたものの両方で測る。
+
+結果は bench/baselines/tools.json に保存でき、次回以降はそれと比べて遅くなった関数に印を付ける
+（--check なら終了コード 1）。ベースラインは計測したマシン固有の値なので、同じマシン同士で比べること。
+
+使い方（backend/ で実行。main を import するので backend の依存が必要）:
+    python bench/bench_tools.py                    # 1x / 10x / 100x を計測してベースラインと比較
+    python bench/bench_tools.py --scales 1 10 --rounds 50
+    python bench/bench_tools.py --save             # 今回の結果をベースラインとして保存
+    python bench/bench_tools.py --check            # 許容幅（--tolerance）を超えて遅くなったら失敗
+"""
+import argparse, gc, glob, json, os, shutil, statistics, sys, tempfile, time, tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+os.environ["OPENAI_API_KEY"] = ""        # LLM には繋がない（ルール経路だけ測る）
+os.environ["LLM_CLASSIFY_PROVIDER"] = "openai"
+os.environ["DATA_WATCH_INTERVAL"] = "0"
+import main  # noqa: E402
+from datastore import DataStore  # noqa: E402
+
+BASELINE_PATH = os.path.join(BACKEND_DIR, "bench", "baselines", "tools.json")
+
+# 水増しするデータセットと、複製時に連番を付けるフィールド（それ以外はそのまま）
+SCALED = {"ryukyu_office_hours": "名前", "clubs": "name"}
+
+# ===== 質問コーパス =====
+CALENDAR_Q = [
+    "夏休みはいつからですか？",
+    "冬休みの期間を教えて",
+    "春休みはいつまで？",
+    "後期の授業開始日はいつ？",
+    "前学期の授業終了はいつですか",
+    "第3クォーターの授業開始",
+    "第２クォーターの授業終了日",
+    "今日は何かイベントある？",
+    "来週の予定は？",
+    "10月の行事を教えて",
+    "2025年12月24日から2026年1月5日までの休み",
+    "今年度の学年暦",
+]
+TEACHER_Q = [
+    "久高将晃先生のオフィスアワーは？",
+    "中川鉄水先生に会いたい",
+    "金城和俊先生の研究室はどこですか",
+    "井伊先生のオフィスアワー",
+    "高岡先生",
+    "福島卓也教授に質問したい",
+    "月曜の3限に会える先生は？",
+    "今空いている工学部の先生",
+    "水曜の午後に会える人文社会学部の先生",
+    "山田先生はいますか",
+]
+CLUB_Q = [
+    "サッカー部はありますか",
+    "アメフト部について教えて",
+    "競技かるたサークルの活動日",
+    "漫画研究会の場所は？",
+    "土曜日に活動しているサークル",
+    "ダイビングのサークルを探しています",
+    "ロボットを作る部活",
+    "音楽系のサークルはある？",
+    "金曜の夜に活動している団体",
+    "TRPGサークル",
+]
+GENERAL_Q = [
+    "学生証の再発行はどこでできますか",
+    "図書館の開館時間を知りたい",
+    "奨学金の申請方法",
+    "履修登録の締め切りはいつ",
+    "井上 オフィスアワー",
+    "工学部 研究室 メール",
+    "存在しない 単語 テスト",
+]
+ALL_Q = CALENDAR_Q + TEACHER_Q + CLUB_Q + GENERAL_Q
+
+CASES: Dict[str, tuple] = {
+    "find_calendar": (main.find_calendar, CALENDAR_Q),
+    "find_teacher": (main.find_teacher, TEACHER_Q),
+    "find_club": (main.find_club, CLUB_Q),
+    "search_data_any": (main.search_data_any, GENERAL_Q + TEACHER_Q[:3] + CLUB_Q[:3]),
+    "classify_by_rules": (main.classify_by_rules, ALL_Q),
+    "parse_date": (main.parse_date, CALENDAR_Q),
+}
+
+
+# ===== データの水増し =====
+def scaled_store(k: int, workdir: str) -> DataStore:
+    """backend/data を workdir に写し、SCALED のデータセットを k 倍にした DataStore を作る"""
+    for path in glob.glob(os.path.join(main.DATA_DIR, "*.json")):
+        name = os.path.splitext(os.path.basename(path))[0]
+        dst = os.path.join(workdir, os.path.basename(path))
+        if name not in SCALED or k <= 1:
+            shutil.copyfile(path, dst)
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+        field = SCALED[name]
+        out = []
+        for r in range(k):
+            for item in rows:
+                if r and isinstance(item, dict) and item.get(field):
+                    item = {**item, field: f"{item[field]}{r}"}
+                out.append(item)
+        with open(dst, "w", encoding="utf-8") as f:
+            json.dump(out, f, ensure_ascii=False)
+    store = DataStore(workdir, main.STORE.builders, provides=main.STORE.provides)
+    store.reload()
+    store.warm()
+    return store
+
+
+# ===== 計測 =====
+def measure(fn: Callable[[str], Any], queries: List[str], rounds: int) -> Dict[str, Any]:
+    for q in queries:       # ウォームアップ（遅延初期化・正規表現のコンパイルを除く）
+        fn(q)
+
+    samples: List[int] = []
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            for q in queries:
+                t0 = time.perf_counter_ns()
+                fn(q)
+                samples.append(time.perf_counter_ns() - t0)
+    finally:
+        gc.enable()
+
+    # 確保量は計測を遅くするので別パスで（1回の呼び出し中のピーク確保バイト数）
+    peaks: List[int] = []
+    tracemalloc.start()
+    try:
+        for q in queries:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            fn(q)
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    finally:
+        tracemalloc.stop()
+
+    samples.sort()
+    return {
+        "ns_op": int(statistics.fmean(samples)),
+        "p50_ns": samples[len(samples) // 2],
+        "p99_ns": samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+        "alloc_B": int(statistics.fmean(peaks)),
+        "n": len(samples),
+    }
+
+
+def report(key: str, r: Dict[str, Any], base: Dict[str, Any], tolerance: float) -> bool:
+    """1行出力。ベースラインより tolerance を超えて遅ければ True"""
+    note, regressed = "-", False
+    if base and base.get("ns_op"):
+        ratio = r["ns_op"] / base["ns_op"]
+        regressed = ratio > 1 + tolerance
+        note = f"{ratio:.2f}x" + ("  << REGRESSION" if regressed else "")
+    name = key.split("@")[0]
+    print(f"{name:<17} {r['ns_op']:>11,} {r['p50_ns']:>11,} {r['p99_ns']:>11,} {r['alloc_B']:>10,}  {note}")
+    return regressed
+
+
+def run(scales: List[int], rounds: int, only: List[str],
+        baseline: Dict[str, Dict[str, Any]], tolerance: float) -> Tuple[Dict[str, Dict[str, Any]], List[str]]:
+    results: Dict[str, Dict[str, Any]] = {}
+    regressed: List[str] = []
+    orig = main.STORE
+    for k in scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            # find_* は呼び出しごとに main.STORE.current を読むので、差し替えればそのデータで動く
+            main.STORE = scaled_store(k, tmp)
+            try:
+                v = main.STORE.current
+                print(f"\n== {k}x  (teachers={len(v.teachers)}, clubs={len(v.clubs)}, docs={len(v.search_index)})")
+                print(f"{'function':<17} {'ns/op':>11} {'p50':>11} {'p99':>11} {'alloc[B]':>10}  vs baseline")
+                for name, (fn, queries) in CASES.items():
+                    if only and name not in only:
+                        continue
+                    key = f"{name}@{k}x"
+                    results[key] = measure(fn, queries, rounds)
+                    if report(key, results[key], baseline.get(key, {}), tolerance):
+                        regressed.append(key)
+            finally:
+                main.STORE = orig
+    return results, regressed
+
+
+def main_() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    ap.add_argument("--rounds", type=int, default=20, help="コーパスを何周するか")
+    ap.add_argument("--only", nargs="*", default=[], help="計測する関数名（省略時は全部）")
+    ap.add_argument("--save", action="store_true", help="結果をベースラインとして保存する")
+    ap.add_argument("--check", action="store_true", help="遅くなった関数があれば終了コード 1")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="ns/op の許容増加率")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    args = ap.parse_args()
+
+    baseline: Dict[str, Dict[str, Any]] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    results, regressed = run(args.scales, args.rounds, args.only, baseline, args.tolerance)
+
+    if args.save:
+        merged = {**baseline, **results}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": sys.version.split()[0],
+                "platform": sys.platform,
+                "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": dict(sorted(merged.items())),
+            }, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"\nbaseline saved: {args.baseline}")
+
+    if regressed:
+        print(f"\nregressions (> +{args.tolerance:.0%} ns/op): {', '.join(regressed)}")
+        return 1 if args.check else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
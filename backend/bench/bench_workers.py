@@ -0,0 +1,114 @@
+"""
+複数ワーカー構成の常駐メモリ（ワーカー1つあたりの RSS / PSS / Private）。
+
+backend/data を bench_tools と同じやり方で水増しし（既定 100x）、data_process/compile.py でスナップショットを書いてから、
+main を import したワーカー（子プロセス）を 1 / 2 / 4 個同時に立ち上げて全データセットを読ませ、
+全員が読み終えた時点の /proc/<pid>/smaps_rollup を比べる:
+- json   : 各ワーカーが JSON から作る（DATA_SNAPSHOT=""）
+- follow : 各ワーカーがスナップショットを読む（DATA_MODE=follow。compile.py --watch の下のワーカーと同じ）
+Rss は共有ページも数える（ワーカー数を掛けると重複する）。Pss は共有ページをプロセス数で割った値で、
+合計が実際の使用量になる。data は「全データセットを読む前後の Private の差」（そのワーカーだけが持つ分）。
+
+Linux 専用（smaps_rollup を読む）。使い方（backend/ で実行）:
+    python bench/bench_workers.py
+    python bench/bench_workers.py --scale 10 --workers 1 2 4 8
+"""
+import argparse, json, os, subprocess, sys, tempfile
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+MB = 1024
+
+
+def smaps(pid: int) -> Dict[str, int]:
+    """smaps_rollup の値（kB）"""
+    out: Dict[str, int] = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                out[parts[0].rstrip(":")] = int(parts[1])
+    out["Private"] = out.get("Private_Clean", 0) + out.get("Private_Dirty", 0)
+    return out
+
+
+def worker() -> int:
+    """（子プロセス側）main を import → 全データセットを読む → 各ツールを1回ずつ通す → 親の合図まで待つ"""
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(BACKEND_DIR)
+    import gc
+    import main
+    before = smaps(os.getpid())["Private"]
+    main.STORE.current.load_all()
+    for q in ("久高将晃先生のオフィスアワーは？", "月曜の3限に会える先生は？"):
+        main.find_teacher(q)
+    for q in ("サッカー部はありますか", "土曜日に活動しているサークル"):
+        main.find_club(q)
+    main.find_calendar("夏休みはいつから？")
+    main.search_data_any("工学部 研究室")
+    main.retrieve_context("奨学金の申請方法")
+    gc.collect()
+    sources = sorted({d.source for d in main.STORE.current.datasets.values()})
+    print(json.dumps({"before": before, "sources": sources}), flush=True)
+    sys.stdin.read()   # 親が全員分を測り終えるまで生きている
+    return 0
+
+
+def run(n: int, env: Dict[str, str]) -> List[Dict[str, int]]:
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker"], env=env,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+             for _ in range(n)]
+    try:
+        ready = [json.loads(p.stdout.readline()) for p in procs]
+        rows = []
+        for p, r in zip(procs, ready):
+            m = smaps(p.pid)
+            m["data"] = m["Private"] - r["before"]
+            m["sources"] = r["sources"]
+            rows.append(m)
+        return rows
+    finally:
+        for p in procs:
+            p.stdin.close()
+            p.wait()
+
+
+def main_() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scale", type=int, default=100)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.worker:
+        return worker()
+
+    sys.path.insert(0, BENCH_DIR)
+    import bench_tools  # main の import と環境変数の設定を含む
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bench_tools.scaled_store(args.scale, tmp)
+        snap = os.path.join(tmp, "snapshot.bin")
+        base = {**os.environ, "DATA_DIR": tmp, "DATA_WATCH_INTERVAL": "0", "DATA_WARMUP": "0",
+                "OPENAI_API_KEY": "", "SESSION_SPILL_PATH": ""}
+        subprocess.run([sys.executable, os.path.join(BACKEND_DIR, "data_process", "compile.py"), "--out", snap],
+                       env={**base, "DATA_SNAPSHOT": ""}, check=True, capture_output=True)
+        print(f"scale {args.scale}x, snapshot {os.path.getsize(snap) / MB / MB:.1f} MB")
+        print(f"{'mode':<7} {'workers':>7} {'RSS/worker':>11} {'PSS/worker':>11} {'data/worker':>12} "
+              f"{'PSS total':>10}  source   (MB)")
+        modes = {
+            "json": {**base, "DATA_SNAPSHOT": "", "DATA_MODE": "local"},
+            "follow": {**base, "DATA_SNAPSHOT": snap, "DATA_MODE": "follow"},
+        }
+        for mode, env in modes.items():
+            for n in args.workers:
+                rows = run(n, env)
+                avg = {k: sum(r[k] for r in rows) / n / MB for k in ("Rss", "Pss", "data")}
+                total = sum(r["Pss"] for r in rows) / MB
+                print(f"{mode:<7} {n:>7} {avg['Rss']:>11.1f} {avg['Pss']:>11.1f} {avg['data']:>12.1f} "
+                      f"{total:>10.1f}  {','.join(rows[0]['sources'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
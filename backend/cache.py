@@ -0,0 +1,150 @@
+"""
+プロセス内キャッシュ（サイズ上限 LRU + TTL）、キャッシュキー用の質問文正規化、
+同一キーの同時実行をまとめる SingleFlight。
+"""
+import asyncio, threading, time, unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+_MISSING = object()
+
+
+_DIGIT_SEPARATORS = frozenset("-/.:,")
+
+
+def normalize_query(text: str) -> str:
+    """
+    全角/半角を畳み込み、空白と句読点を除去した比較用の文字列。
+    数字に挟まれた区切り（「2025-1-11」の - や「4/1」の /、「1.5」の .）は残す
+    （消すと「2025-1-11」と「2025-11-1」が同じになる）
+    """
+    s = unicodedata.normalize("NFKC", text or "").lower()
+    out = []
+    for i, ch in enumerate(s):
+        # P*: 句読点・括弧類 / Z*: 空白 / Cc: 改行・タブ
+        if unicodedata.category(ch).startswith(("P", "Z", "Cc")):
+            if not (ch in _DIGIT_SEPARATORS and 0 < i < len(s) - 1 and s[i - 1].isdigit() and s[i + 1].isdigit()):
+                continue
+        out.append(ch)
+    return "".join(out)
+
+
+class TTLCache:
+    """
+    サイズ上限付き LRU ＋ 有効期限（秒）。スレッドセーフ。
+    sizeof を渡すと値の推定バイト数も数え、maxbytes を超えた分も古い順に追い出す。
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0,
+                 maxbytes: int = 0, sizeof: Optional[Callable[[Any], int]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.nbytes = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires_at, value, nbytes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            ent = self._data.get(key, _MISSING)
+            if ent is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value, size = ent
+            if expires_at <= now:
+                del self._data[key]
+                self.nbytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        size = self.sizeof(value) if self.sizeof else 0
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[2]
+            self._data[key] = (expires_at, value, size)
+            self.nbytes += size
+            while len(self._data) > self.maxsize or (self.maxbytes and self.nbytes > self.maxbytes and len(self._data) > 1):
+                _, ent = self._data.popitem(last=False)
+                self.nbytes -= ent[2]
+                self.evictions += 1
+
+    def clear(self) -> int:
+        with self._lock:
+            n = len(self._data)
+            self._data.clear()
+            self.nbytes = 0
+            return n
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            **({"bytes": self.nbytes, "maxbytes": self.maxbytes} if self.sizeof else {}),
+            "ttl_sec": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def peek_keys(self, limit: int = 20) -> list:
+        """新しい順にキーを返す（管理画面用・LRU順序は変えない）"""
+        with self._lock:
+            return [k for k in reversed(self._data)][:limit]
+
+
+class SingleFlight:
+    """
+    同じキーの非同期処理を1本にまとめる（request coalescing）。
+    実行中のキーに後から来た呼び出しは、先行の Task の結果（または例外）をそのまま受け取る。
+    Task は呼び出し元のキャンセルから shield されるので、先行者が切断しても処理は最後まで走る。
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "asyncio.Task"] = {}
+        self.calls = 0        # 実際に上流を叩いた回数
+        self.coalesced = 0    # 相乗りで済んだ回数
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> "asyncio.Task":
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+        return task
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        return await asyncio.shield(self.start(key, fn))
+
+    def _done(self, key: Hashable, task: "asyncio.Task") -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # 誰も待っていない場合の "exception was never retrieved" を抑止
+
+    def running(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._calls)}
@@ -0,0 +1,206 @@
+"""
+学年暦イベントの区間インデックスと、質問文からの日付範囲の抽出。
+
+イベントはロード時に一度だけ (title, start: date, end: date) に正規化し、
+中心分割の区間木（centered interval tree）に載せる。
+点クエリ（今日）も範囲クエリ（今週・来月・10月）も O(log n + k) で引ける。
+"""
+import re
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Callable, FrozenSet, List, Optional, Tuple
+
+Span = Tuple[date, date]
+
+
+@dataclass(frozen=True)
+class CalEvent:
+    seq: int        # 元データでの並び順（出力順を保つため）
+    title: str
+    start: date
+    end: date
+    tags: FrozenSet[str] = frozenset()   # タイトルから付けたタグ（intents.tag_title）
+
+    @property
+    def start_iso(self) -> str:
+        return self.start.isoformat()
+
+    @property
+    def end_iso(self) -> str:
+        return self.end.isoformat()
+
+
+def _to_date(v: Any) -> Optional[date]:
+    if not v:
+        return None
+    try:
+        return date.fromisoformat(str(v)[:10])
+    except ValueError:
+        return None
+
+
+def normalize_events(events: Any, tagger: Optional[Callable[[str], FrozenSet[str]]] = None) -> List[CalEvent]:
+    """date/date_start と end/date_end の揺れを吸収して CalEvent 化（日付が無いものは除外）"""
+    out: List[CalEvent] = []
+    if not isinstance(events, list):
+        return out
+    for i, e in enumerate(events):
+        if not isinstance(e, dict):
+            continue
+        s = _to_date(e.get("date") or e.get("date_start"))
+        if s is None:
+            continue
+        ed = _to_date(e.get("end") or e.get("date_end")) or s
+        if ed < s:
+            s, ed = ed, s
+        title = e.get("title", "(無題)")
+        out.append(CalEvent(i, title, s, ed, tagger(title) if tagger else frozenset()))
+    return out
+
+
+class _Node:
+    __slots__ = ("center", "starts", "by_start", "ends", "by_end", "left", "right")
+
+    def __init__(self, center: date, items: List[CalEvent]):
+        self.center = center
+        self.by_start = sorted(items, key=lambda e: e.start)
+        self.starts = [e.start for e in self.by_start]
+        self.by_end = sorted(items, key=lambda e: e.end)
+        self.ends = [e.end for e in self.by_end]
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+
+
+class CalendarIndex:
+    """静的な区間木。overlapping(lo, hi) で [lo, hi] と重なるイベントを元の順序で返す"""
+
+    def __init__(self, events: Any, tagger: Optional[Callable[[str], FrozenSet[str]]] = None):
+        self.events = normalize_events(events, tagger)
+        self.root = self._build(self.events)
+
+    def _build(self, items: List[CalEvent]) -> Optional[_Node]:
+        if not items:
+            return None
+        points = sorted({e.start for e in items} | {e.end for e in items})
+        center = points[len(points) // 2]
+        here = [e for e in items if e.start <= center <= e.end]
+        node = _Node(center, here)
+        node.left = self._build([e for e in items if e.end < center])
+        node.right = self._build([e for e in items if e.start > center])
+        return node
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+    def overlapping(self, lo: date, hi: date) -> List[CalEvent]:
+        hits: List[CalEvent] = []
+        node = self.root
+        stack = [node] if node else []
+        while stack:
+            node = stack.pop()
+            if hi < node.center:
+                # このノードの区間はすべて center を含む → start <= hi のものが重なる
+                hits.extend(node.by_start[:bisect_right(node.starts, hi)])
+                if node.left:
+                    stack.append(node.left)
+            elif lo > node.center:
+                hits.extend(node.by_end[bisect_left(node.ends, lo):])
+                if node.right:
+                    stack.append(node.right)
+            else:
+                hits.extend(node.by_start)
+                if node.left:
+                    stack.append(node.left)
+                if node.right:
+                    stack.append(node.right)
+        hits.sort(key=lambda e: e.seq)
+        return hits
+
+    def at(self, d: date) -> List[CalEvent]:
+        return self.overlapping(d, d)
+
+
+# ===== 質問文 → 日付範囲 =====
+_ISO_RE = re.compile(r"(\d{4})[-/\.](\d{1,2})[-/\.](\d{1,2})")
+_YMD_RE = re.compile(r"(\d{4})年\s*(\d{1,2})月\s*(\d{1,2})日")
+_MD_RE = re.compile(r"(?<![\d年])(\d{1,2})月\s*(\d{1,2})日")
+_YM_RE = re.compile(r"(?:(\d{4})年\s*)?(\d{1,2})月(?!\s*\d{1,2}日)")
+
+
+def _month_span(y: int, m: int) -> Span:
+    first = date(y, m, 1)
+    nxt = date(y + (m == 12), m % 12 + 1, 1)
+    return first, nxt - timedelta(days=1)
+
+
+def _academic_year(m: int, today: date) -> int:
+    """年の指定が無い「◯月」は、今日を含む年度（4月始まり）の◯月とみなす"""
+    fy = today.year if today.month >= 4 else today.year - 1
+    return fy if m >= 4 else fy + 1
+
+
+def _explicit_dates(text: str, today: date) -> List[Tuple[int, date]]:
+    """文中の明示的な日付を (出現位置, date) で返す"""
+    found: List[Tuple[int, date]] = []
+    for rx in (_ISO_RE, _YMD_RE):
+        for m in rx.finditer(text):
+            try:
+                found.append((m.start(), date(*map(int, m.groups()))))
+            except ValueError:
+                pass
+    for m in _MD_RE.finditer(text):
+        mo, d = map(int, m.groups())
+        try:
+            found.append((m.start(), date(_academic_year(mo, today), mo, d)))
+        except ValueError:
+            pass
+    found.sort()
+    return found
+
+
+def parse_date_span(text: str, today: date) -> Optional[Span]:
+    """
+    質問文から対象期間を取り出す。見つからなければ None。
+    - 日付: YYYY-MM-DD / YYYY年M月D日 / M月D日（2つあれば範囲）
+    - 相対日: 今日・明日・明後日・昨日
+    - 週・月: 今週/来週/先週・今月/来月/先月・(YYYY年)M月・今年度
+    """
+    dates = _explicit_dates(text, today)
+    if len(dates) >= 2:
+        a, b = dates[0][1], dates[1][1]
+        return (a, b) if a <= b else (b, a)
+    if dates:
+        return dates[0][1], dates[0][1]
+
+    if "明後日" in text or "あさって" in text:
+        d = today + timedelta(days=2); return d, d
+    if "明日" in text or "あした" in text:
+        d = today + timedelta(days=1); return d, d
+    if "昨日" in text or "きのう" in text:
+        d = today - timedelta(days=1); return d, d
+    if re.search(r"(今日|本日|きょう)", text):
+        return today, today
+
+    m = re.search(r"(今|来|再来|先)週", text)
+    if m:
+        shift = {"今": 0, "来": 1, "再来": 2, "先": -1}[m.group(1)]
+        mon = today - timedelta(days=today.weekday()) + timedelta(weeks=shift)
+        return mon, mon + timedelta(days=6)
+
+    m = re.search(r"(今|来|先)月", text)
+    if m:
+        shift = {"今": 0, "来": 1, "先": -1}[m.group(1)]
+        idx = today.year * 12 + today.month - 1 + shift
+        return _month_span(idx // 12, idx % 12 + 1)
+
+    m = _YM_RE.search(text)
+    if m and 1 <= int(m.group(2)) <= 12:
+        mo = int(m.group(2))
+        y = int(m.group(1)) if m.group(1) else _academic_year(mo, today)
+        return _month_span(y, mo)
+
+    if "今年度" in text:
+        fy = today.year if today.month >= 4 else today.year - 1
+        return date(fy, 4, 1), date(fy + 1, 3, 31)
+    return None
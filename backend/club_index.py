@@ -0,0 +1,171 @@
+"""
+サークル・部活の検索インデックス（find_club 用）。
+
+データのロード時に一度だけ:
+- 各項目（名称・概要・活動日・場所）を文字バイグラムに分け、フィールド重み付きの BM25（BM25F）で
+  語ごとの寄与を前計算してポスティングに載せる
+- 同義語表（種目・文化系のジャンル）に当たるサークルには「#ジャンル」の擬似語を付けておく
+- 比較用の正規化名称（「琉球大学」「部」「サークル」などを除いたもの）を作っておく
+
+ポスティング（語 → (サークル番号, 重み)）と正規化名称は flat の列に詰める（スナップショットでは mmap のまま読む）。
+検索時は質問文の語のポスティングに載っているサークルだけを採点する（全件ループしない）。
+点が付いても、名称の一致・ジャンルの一致・質問の内容語の一定割合以上の一致のどれかが無いものは返さない
+（「先生のオフィスアワー」のような関係ない質問で、たまたま1語当たったサークルを出さない）。
+"""
+import math, re, unicodedata
+from typing import Any, Dict, List, Sequence, Tuple
+
+from flat import Postings, StrTable, literal
+from intents import KeywordMatcher
+from records import Club, ClubTable
+
+K1 = 1.2
+B = 0.75
+
+# フィールド → 重み。名称に当たるのが一番強い
+FIELD_WEIGHTS: Dict[str, float] = {"name": 3.0, "detail": 1.5, "day": 1.0, "location": 1.0, "tags": 2.0}
+# 正規化名称の相互包含（「サッカー部ある？」→「全学サッカー部」）に足す点
+NAME_BONUS = 6.0
+# 名称・ジャンルで当たらない時に、質問の内容語（バイグラム）のうち当たっていないといけない割合
+MIN_COVERAGE = 0.6
+
+# ジャンル → 言い換え（小文字で照合）。種目に加えて文化系も
+SYNONYMS: Dict[str, Sequence[str]] = {
+    "サッカー": ["サッカー", "soccer", "フットボール", "フットサル"],
+    "テニス": ["テニス", "tennis", "庭球"],
+    "バスケ": ["バスケ", "バスケット", "basketball", "3×3", "3x3"],
+    "バレー": ["バレー", "バレーボール", "volleyball"],
+    "野球": ["野球", "ベースボール", "baseball", "ソフトボール"],
+    "ラグビー": ["ラグビー", "rugby", "アメフト", "アメリカンフットボール"],
+    "マリン": ["ダイビング", "サーフィン", "サーフ", "surf", "ボードセイリング", "ライフセービング", "海"],
+    "武道": ["武道", "柔道", "剣道", "空手", "合気道", "弓道", "居合", "なぎなた", "躰道"],
+    "ダンス": ["ダンス", "dance", "チア", "ベリーダンス"],
+    "音楽": ["音楽", "バンド", "軽音", "ロック", "ジャズ", "jazz", "吹奏楽", "管弦楽", "オーケストラ", "アカペラ", "楽器", "演奏"],
+    "美術": ["美術", "絵画", "イラスト", "書道", "写真", "模型"],
+    "映像": ["映画", "映像", "放送", "メディア", "新聞"],
+    "演劇": ["演劇", "劇団", "舞台", "パフォーマンス"],
+    "マンガ": ["漫画", "マンガ", "漫研", "アニメ"],
+    "ゲーム": ["ゲーム", "eスポーツ", "スプラトゥーン", "trpg", "ボードゲーム", "麻雀", "将棋", "囲碁", "かるた", "ビリヤード"],
+    "手品": ["手品", "マジック", "奇術"],
+    "科学": ["科学", "天文", "宇宙", "ロボット", "robot", "プログラミング", "研究会"],
+    "文芸": ["文芸", "読書", "文学", "小説"],
+    "ボランティア": ["ボランティア", "地域貢献", "清掃", "支援", "環境"],
+    "国際交流": ["国際交流", "留学生", "異文化", "韓国", "k-pop"],
+}
+
+_ORG_WORDS = re.compile(r"(琉球大学|琉大|大学|全学|部活|部|クラブ|サークル|同好会|チーム)")
+# find_club の旧実装と同じ正規化（名称の相互包含の判定用）
+_CLUB_STOPWORDS = re.compile(r"(琉球大学|琉大|大学|全学|部|クラブ|サークル|同好会|チーム|部活|・|－|-|ー|＿|‐|—|―|\s+)")
+_SPLIT_RE = re.compile(r"[^\w一-龥ぁ-んァ-ヴー]+")
+_HIRAGANA_RE = re.compile(r"[ぁ-ん]+")
+_HAS_HIRAGANA_RE = re.compile(r"[ぁ-ん]")
+# カタカナ1文字＋長音（「カー」「ール」など）。どのカタカナ語にも出てくるので質問側では使わない
+_KANA_LONG_RE = re.compile(r"[ァ-ヴー]?ー[ァ-ヴー]?|[ァ-ヴ]")
+# 質問側だけで除く「何を聞いているか」の語（活動場所・活動日など。どのサークルの説明にも出てくる）
+_ASK_WORDS = re.compile(r"(活動場所|活動日|活動時間|活動内容|活動|場所|時間|内容|団体|について)")
+
+
+def norm_club(s: str) -> str:
+    return _CLUB_STOPWORDS.sub("", (s or "").lower())
+
+
+def _grams(text: str, keep_hiragana: bool) -> List[str]:
+    """文字バイグラム。組織名の語（部・サークル等）は区切りとして除く"""
+    s = _ORG_WORDS.sub(" ", unicodedata.normalize("NFKC", text or "").lower())
+    out: List[str] = []
+    for run in _SPLIT_RE.split(s):
+        grams = [run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)]
+        out.extend(g for g in grams if g and (keep_hiragana or not _HIRAGANA_RE.fullmatch(g)))
+    return out
+
+
+_GENRES = KeywordMatcher([("|".join(kws), (f"#{g}",)) for g, kws in SYNONYMS.items()])
+
+
+def genres_of(text: str) -> List[str]:
+    return sorted(_GENRES.scan(unicodedata.normalize("NFKC", text or "").lower()))
+
+
+class ClubIndex:
+    def __init__(self, clubs: ClubTable):
+        self.clubs = clubs
+        self.norm_names = StrTable(norm_club(c.name) for c in self.clubs)
+        # フィールドごとの語リスト（名称はひらがなの名前もあるので、ひらがなバイグラムも残す）
+        fields: List[Dict[str, List[str]]] = []
+        for c in self.clubs:
+            f = {
+                "name": _grams(c.name, keep_hiragana=True),
+                "detail": _grams(c.detail, keep_hiragana=False),
+                "day": _grams(c.day, keep_hiragana=False),
+                "location": _grams(c.location, keep_hiragana=False),
+            }
+            blob = f"{c.name} {c.detail}"
+            f["tags"] = genres_of(blob)
+            fields.append(f)
+
+        n = len(fields)
+        avg = {k: (sum(len(f[k]) for f in fields) / n if n else 0.0) or 1.0 for k in FIELD_WEIGHTS}
+        # BM25F: フィールドごとに長さ正規化した tf を重み付きで合算 → 語ごとに飽和
+        tf: Dict[str, Dict[int, float]] = {}
+        for doc, f in enumerate(fields):
+            for k, w in FIELD_WEIGHTS.items():
+                toks = f[k]
+                if not toks:
+                    continue
+                norm = 1 - B + B * len(toks) / avg[k]
+                for t in toks:
+                    d = tf.setdefault(t, {})
+                    d[doc] = d.get(doc, 0.0) + w / norm
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for t, docs in tf.items():
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            postings[t] = [(doc, idf * x * (K1 + 1) / (x + K1)) for doc, x in docs.items()]
+        self.postings = Postings(postings, "Id")
+
+    def __len__(self) -> int:
+        return len(self.clubs)
+
+    def query_terms(self, text: str) -> List[str]:
+        """
+        質問文の語＋当たったジャンルの擬似語（重複は1回）。
+        ひらがなだけのバイグラム・カタカナ1文字＋長音・「活動場所」などの聞き方の語は除く
+        """
+        terms = dict.fromkeys(g for g in _grams(_ASK_WORDS.sub(" ", text or ""), keep_hiragana=False)
+                              if not _KANA_LONG_RE.fullmatch(g))
+        terms.update(dict.fromkeys(genres_of(text)))
+        return list(terms)
+
+    def search(self, text: str) -> List[Tuple[float, Club]]:
+        terms = self.query_terms(text)
+        # 網羅率の分母はひらがなを含まない語（「曜の」「夜に」のような助詞混じりは数えない）
+        content = {t for t in terms if not t.startswith("#") and not _HAS_HIRAGANA_RE.search(t)}
+        genres = {t for t in terms if t.startswith("#")}
+        scores: Dict[int, float] = {}
+        covered: Dict[int, int] = {}
+        tagged = set()
+        for t in terms:
+            is_content = t in content
+            for doc, w in self.postings.items(t):
+                scores[doc] = scores.get(doc, 0.0) + w
+                if is_content:
+                    covered[doc] = covered.get(doc, 0) + 1
+                elif t in genres:
+                    tagged.add(doc)
+        q_norm = norm_club(text)
+        named = set()
+        if q_norm:
+            # 正規化名称は UTF-8 のまま比べる（名称 ⊂ 質問、質問 ⊂ 名称）
+            norm_names, q_bytes, q_pat = self.norm_names, q_norm.encode("utf-8", "surrogatepass"), literal(q_norm)
+            for doc in scores:
+                nn = norm_names.raw(doc)
+                if len(nn) and (nn in q_bytes or norm_names.search(q_pat, doc)):
+                    scores[doc] += NAME_BONUS
+                    named.add(doc)
+        need = MIN_COVERAGE * len(content)
+        ranked = sorted(((doc, sc) for doc, sc in scores.items()
+                         if doc in named or doc in tagged or (content and covered.get(doc, 0) >= need)),
+                        key=lambda x: (-x[1], x[0]))
+        return [(sc, self.clubs[doc]) for doc, sc in ranked]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"clubs": len(self.clubs), "terms": len(self.postings)}
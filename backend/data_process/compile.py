@@ -0,0 +1,90 @@
+"""
+data/*.json から、サーバが mmap で読むバイナリスナップショット（data/snapshot.bin）を作る。
+
+sekei.py / test.py で JSON を作って backend/data に置いたあと、最後にこれを実行する:
+    python data_process/compile.py               # backend/ で実行（main を import するので backend の依存が必要）
+    python data_process/compile.py --out /tmp/snapshot.bin
+
+中身はサーバと同じ builder で作った派生構造（正規化済みレコード・n-gram 索引・BM25・各種インデックス）。
+元の JSON の sha256 と backend/*.py のハッシュを一緒に書いておき、サーバ側はどちらかが合わなければ
+そのデータセット（またはスナップショット全体）を無視して JSON から作る。
+各セクションには HMAC を付ける。鍵は DATA_SNAPSHOT_KEY か DATA_SNAPSHOT_KEY_FILE（既定 backend/.snapshot.key。
+無ければここで作る）で、サーバ（ワーカー）にも同じ鍵を渡すこと。
+
+複数ワーカーで動かす時は、これを親プロセスとして常駐させ、ワーカーは follow モードで起動する:
+    python data_process/compile.py --watch &     # JSON が変わるたびに generation を進めて書き直す
+    DATA_MODE=follow python -m uvicorn main:app --workers 4
+JSON のパースと索引作りは親の1回だけになり、ワーカーはスナップショットを復元するだけになる
+（レコードの列・ポスティングは mmap のページのまま読むので、ワーカーを増やしても常駐メモリはほぼ増えない）。
+"""
+import argparse, os, sys, time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+os.environ["DATA_SNAPSHOT"] = ""          # 既存のスナップショットは読まずに JSON から作り直す
+os.environ["DATA_MODE"] = "local"
+os.environ["DATA_WATCH_INTERVAL"] = "0"
+import main  # noqa: E402
+from snapshot import Snapshot, create_key, next_generation, write_snapshot  # noqa: E402
+
+
+def publish(out: str, verbose: bool = True) -> bool:
+    """main.STORE の現在の版を、前回より大きい generation で書き出す"""
+    v = main.STORE.current
+    sections = {n: (d.sha256, d.payload()) for n, d in v.datasets.items() if d.raw is not None}
+    if not sections:
+        print(f"no datasets in {main.DATA_DIR}", file=sys.stderr)
+        return False
+    generation = next_generation(out)
+    key = main.SNAPSHOT_KEY or create_key(main.DATA_SNAPSHOT_KEY_FILE)
+    t0 = time.perf_counter()
+    toc = write_snapshot(out, sections, main.SNAPSHOT_FINGERPRINT, generation, key)
+    ms = (time.perf_counter() - t0) * 1000
+    if verbose:
+        for n, ent in toc["datasets"].items():
+            print(f"{n:<22} {ent['length']:>10,} B  (json build {v.datasets[n].build_ms:.1f} ms)")
+    print(f"Saved: {os.path.abspath(out)}  (generation {generation}, {os.path.getsize(out):,} B, {ms:.1f} ms)")
+
+    # 書いたものがそのまま読めるか（全データセットが snapshot から復元されるか）を確認
+    snap = Snapshot(out, main.SNAPSHOT_FINGERPRINT, key)
+    missing = [n for n, (sha, _) in sections.items() if not snap.refresh() or snap.load(n, sha) is None]
+    snap.close()
+    if missing:
+        print(f"snapshot check failed: {missing}", file=sys.stderr)
+        return False
+    return True
+
+
+def watch(out: str, interval: float) -> None:
+    """JSON の変更を監視し、版が変わるたびに書き直す（Ctrl+C で終了）"""
+    sys.stdout.reconfigure(line_buffering=True)
+    published = main.STORE.current.version
+    while True:
+        time.sleep(interval)
+        main.STORE.reload()
+        if main.STORE.current.version != published:
+            published = main.STORE.current.version
+            print(f"changed: {main.STORE.last_reload.get('changed')}")
+            publish(out, verbose=False)
+
+
+def main_() -> int:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", default=os.path.join(main.DATA_DIR, "snapshot.bin"))
+    ap.add_argument("--watch", action="store_true", help="常駐して、JSON が変わるたびに書き直す")
+    ap.add_argument("--interval", type=float, default=2.0, help="--watch の監視間隔（秒）")
+    args = ap.parse_args()
+
+    ok = publish(args.out)
+    if not args.watch:
+        return 0 if ok else 1
+    try:
+        watch(args.out, args.interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_())
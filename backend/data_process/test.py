@@ -5,12 +5,27 @@
 
 使い方:
 1) 下の raw_text に、あなたのメッセージのブロックをそのまま貼り付け。
-2) python this_script.py を実行。
+   （または大学・学部ごとの原文ファイルを引数に渡す。1行1レコード、いくつでも可。"-" は標準入力）
+2) python this_script.py [原文ファイル ...] を実行。
 3) ryukyu_office_hours.json が生成されます。
+
+2回目以降は差分だけ処理する:
+- 行の解析結果は原文のハッシュごとに状態ファイル（SQLite）に取っておき、前に見た行は解析し直さない
+  （--full で状態を捨てて全件やり直し）
+- レコードは (所属, 名前) ごとに状態ファイルに溜める。同じキーは後勝ち、変わったかどうかはレコードのハッシュで見る
+  （前の内容に戻した行もちゃんと反映される）
+- 今回の入力ファイルから消えたレコードは、取り込みの最後に状態ファイルからも消す
+  （別のファイル由来のレコードはそのまま。引数なしなら raw_text が入力ファイル扱い）
+- 解析は --workers 個のプロセスで並列に行い、入力は --chunk 行ずつ流す（全行をメモリに載せない）
+- JSON は状態ファイルから1件ずつ書き出す（書式は従来どおり indent=2）。中身が前回書いた時と同じなら書き直さない
+- 解析できなかった行は --errors に JSON Lines で出す（{"source", "line", "reason", "raw"}）
 """
 
-import re, json, sys
+import argparse, hashlib, json, os, re, sqlite3, sys, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Any, Callable, Deque, Iterable, Iterator, List, Optional, Tuple
 
 # ===== 1) ここにあなたの原文をそのまま貼り付け =====
 raw_text = r'''
@@ -482,18 +497,24 @@ def is_empty_row(obj: dict) -> bool:
     vals = "".join(str(v) for v in obj.values()).strip()
     return vals == ""
 
-records = []
-errors = []
+# ===== 並列・差分取り込み =====
+Line = Tuple[str, int, str, str, str]  # (入力元, 行番号, 原文, 原文のハッシュ, 前回の解析結果の JSON or "")
+# (入力元, 行番号, 原文, 原文のハッシュ, レコード or None, 失敗理由, レコードのJSON, そのハッシュ)
+Parsed = Tuple[str, int, str, str, Optional[dict], str, str, str]
+
+
+def sha256_of(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-for idx, raw_line in enumerate(raw_text.splitlines(), start=1):
-    line = raw_line.strip()
-    if not line:
-        continue
-    nline = normalize_line(line)
+
+def parse_record(raw_line: str) -> Tuple[Optional[dict], str]:
+    """1行 → 出力スキーマのレコード。解析できなければ (None, 理由)"""
+    nline = normalize_line(raw_line.strip())
     obj = parse_line_to_obj(nline)
-    if obj is None or is_empty_row(obj):
-        errors.append((idx, raw_line))
-        continue
+    if obj is None:
+        return None, "unparsable"
+    if is_empty_row(obj):
+        return None, "empty"
     # 出力スキーマに合わせて余計なキーは温存しつつ並びを意識
     norm = {
         "所属": obj.get("所属", "").strip(),
@@ -503,24 +524,247 @@ for idx, raw_line in enumerate(raw_text.splitlines(), start=1):
     if "リンク" in obj and obj["リンク"]:
         norm["リンク"] = obj["リンク"].strip()
     # 空の memo は None にしても良いが、ここでは空文字のまま
-    records.append(norm)
-
-# 可能なら簡単な重複除去（所属+名前 同一なら後勝ち）
-dedup = {}
-for r in records:
-    key = (r.get("所属",""), r.get("名前",""))
-    dedup[key] = r
-records = list(dedup.values())
-
-# ソート（所属→名前）
-records.sort(key=lambda x: (x.get("所属",""), x.get("名前","")))
-
-# JSON保存（日本語そのまま・整形）
-OUTFILE.write_text(json.dumps(records, ensure_ascii=False, indent=2), encoding="utf-8")
-print(f"Saved: {OUTFILE.resolve()}  ({len(records)} records)")
-if errors:
-    print("\n--- 解析できなかった行（要手直し）---")
-    for i, e in errors[:20]:
-        print(f"[{i:04d}] {e}")
-    if len(errors) > 20:
-        print(f"...and {len(errors)-20} more")
+    return norm, ""
+
+
+def parse_chunk(chunk: List[Line]) -> List[Parsed]:
+    """ワーカープロセスで実行する単位。JSON 化とハッシュもここで済ませる（前回の解析結果がある行はそれを使う）"""
+    out: List[Parsed] = []
+    for src, idx, raw_line, lh, cached in chunk:
+        if cached:
+            rec, reason, body = json.loads(cached), "", cached
+        else:
+            rec, reason = parse_record(raw_line)
+            body = json.dumps(rec, ensure_ascii=False) if rec is not None else ""
+        out.append((src, idx, raw_line, lh, rec, reason, body, sha256_of(body) if body else ""))
+    return out
+
+
+def iter_lines(inputs: List[str]) -> Iterator[Tuple[str, int, str]]:
+    """入力ファイルを1行ずつ流す。ファイル指定が無ければ raw_text"""
+    if not inputs:
+        for idx, raw_line in enumerate(raw_text.splitlines(), start=1):
+            yield "<raw_text>", idx, raw_line
+        return
+    for path in inputs:
+        f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8-sig")
+        try:
+            for idx, raw_line in enumerate(f, start=1):
+                yield path, idx, raw_line.rstrip("\r\n")
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def iter_chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    chunk: List[Any] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bounded_map(fn: Callable[[Any], Any], items: Iterable[Any], workers: int) -> Iterator[Any]:
+    """
+    入力順のまま結果を返す並列 map。Executor.map は入力を最後まで先読みしてしまうので、
+    投入済みの仕事を workers*2 個までに抑えて、入力を流しながら処理する
+    """
+    if workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        pending: Deque[Any] = deque()
+        for item in items:
+            pending.append(ex.submit(fn, item))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class StateStore:
+    """
+    前回までの取り込み状態（SQLite）。
+    - lines   : 原文のハッシュ → 解析結果の JSON（解析のやり直しを省くためのキャッシュ）
+    - records : (所属, 名前) ごとの最新レコードと、そのハッシュ・入力元・最後に出てきた回
+    - meta    : 取り込みの回数と、最後に書き出した JSON の中身のハッシュ
+    """
+    SCHEMA_VERSION = 2
+
+    def __init__(self, path: Path, reset: bool = False):
+        if reset and path.exists():
+            path.unlink()
+        self.db = sqlite3.connect(str(path))
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            # 古い形式の状態ファイルは作り直す（全件取り込み直しになるだけ）
+            self.db.executescript("DROP TABLE IF EXISTS lines; DROP TABLE IF EXISTS records; DROP TABLE IF EXISTS meta;")
+        self.db.executescript(f"""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS lines (hash TEXT PRIMARY KEY, record TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS records (
+                dept TEXT NOT NULL, name TEXT NOT NULL, hash TEXT NOT NULL,
+                record TEXT NOT NULL, source TEXT, updated REAL, run INTEGER NOT NULL,
+                PRIMARY KEY (dept, name)
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            PRAGMA user_version = {self.SCHEMA_VERSION};
+        """)
+        # 今回の回番号（消えたレコードの判定に使う）
+        self.run = int(self._meta("run") or 0) + 1
+        self._set_meta("run", str(self.run))
+        self.db.commit()
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def lookup(self, chunk: List[Tuple[str, int, str]]) -> List[Line]:
+        """空行を除き、原文のハッシュと（前に解析した行なら）その結果を付けて返す"""
+        todo = [(src, idx, raw_line, sha256_of(raw_line)) for src, idx, raw_line in chunk if raw_line.strip()]
+        cached = {}
+        for i in range(0, len(todo), 500):
+            part = [c[3] for c in todo[i:i + 500]]
+            q = f"SELECT hash, record FROM lines WHERE hash IN ({','.join('?' * len(part))})"
+            cached.update(self.db.execute(q, part))
+        return [(src, idx, raw_line, lh, cached.get(lh, "")) for src, idx, raw_line, lh in todo]
+
+    def upsert(self, parsed: List[Parsed]) -> int:
+        """
+        解析できたレコードをまとめて書き込む。中身（レコードのハッシュ）が変わった・新しい件数を返す。
+        中身が同じでも「今回も出てきた」印は付ける
+        """
+        now = time.time()
+        before = self.db.total_changes
+        self.db.executemany(
+            "INSERT INTO records (dept, name, hash, record, source, updated, run) VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (dept, name) DO UPDATE SET hash = excluded.hash, record = excluded.record, "
+            "source = excluded.source, updated = excluded.updated, run = excluded.run "
+            "WHERE records.hash != excluded.hash",
+            [(rec.get("所属", ""), rec.get("名前", ""), rh, body, src, now, self.run)
+             for src, _, _, _, rec, _, body, rh in parsed],
+        )
+        changed = self.db.total_changes - before
+        self.db.executemany(
+            "UPDATE records SET source = ?, run = ? WHERE dept = ? AND name = ?",
+            [(src, self.run, rec.get("所属", ""), rec.get("名前", "")) for src, _, _, _, rec, _, _, _ in parsed],
+        )
+        self.db.executemany("INSERT OR IGNORE INTO lines (hash, record) VALUES (?, ?)",
+                            [(p[3], p[6]) for p in parsed])
+        self.db.commit()   # チャンクごとに確定（途中で落ちても次回は解析済みの行を使い回す）
+        return changed
+
+    def sweep(self, sources: List[str]) -> int:
+        """今回の入力元に由来するのに、今回出てこなかったレコードを消す。消した件数を返す"""
+        removed = 0
+        for src in sources:
+            removed += self.db.execute("DELETE FROM records WHERE source = ? AND run != ?",
+                                       (src, self.run)).rowcount
+        self.db.commit()
+        return removed
+
+    def count(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def digest(self) -> str:
+        """書き出す中身のハッシュ（キーとレコードのハッシュを並べたもの）"""
+        h = hashlib.sha256()
+        for dept, name, rh in self.db.execute("SELECT dept, name, hash FROM records ORDER BY dept, name"):
+            h.update(f"{dept}\t{name}\t{rh}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    def is_written(self, digest: str) -> bool:
+        return self._meta("written") == digest
+
+    def write_json(self, out: Path, digest: str) -> int:
+        """
+        所属→名前 の順に1件ずつ書き出す（一時ファイルに書いてから置き換え）。
+        書式は json.dumps(全件, ensure_ascii=False, indent=2) と同じ
+        """
+        tmp = out.with_name(out.name + ".tmp")
+        n = 0
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("[")
+            for (body,) in self.db.execute("SELECT record FROM records ORDER BY dept, name"):
+                rec = json.dumps(json.loads(body), ensure_ascii=False, indent=2)
+                f.write(("," if n else "") + "\n  " + rec.replace("\n", "\n  "))
+                n += 1
+            f.write("\n]" if n else "]")
+        os.replace(tmp, out)
+        self._set_meta("written", digest)
+        self.db.commit()
+        return n
+
+    def close(self) -> None:
+        self.db.commit()
+        self.db.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="オフィスアワー原文 → ryukyu_office_hours.json")
+    ap.add_argument("inputs", nargs="*", help="原文ファイル（省略時は raw_text、'-' は標準入力）")
+    ap.add_argument("--out", type=Path, default=OUTFILE)
+    ap.add_argument("--state", type=Path, default=None, help="状態ファイル（既定: <出力名>.state.sqlite3）")
+    ap.add_argument("--errors", type=Path, default=None, help="エラーレポート（既定: <出力名>.errors.jsonl）")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunk", type=int, default=2000, help="1回にワーカーへ渡す行数")
+    ap.add_argument("--full", action="store_true", help="状態を捨てて全件取り込み直す")
+    args = ap.parse_args(argv)
+
+    state_path = args.state or args.out.with_name(f"{args.out.stem}.state.sqlite3")
+    errors_path = args.errors or args.out.with_name(f"{args.out.stem}.errors.jsonl")
+    store = StateStore(state_path, reset=args.full)
+    stats = {"lines": 0, "parsed": 0, "cached": 0, "changed": 0, "removed": 0, "errors": 0}
+    errors: List[Tuple[int, str]] = []   # 画面に出す先頭の数件だけ（全件はエラーレポートへ）
+
+    def todo() -> Iterator[List[Line]]:
+        for chunk in iter_chunks(iter_lines(args.inputs), args.chunk):
+            stats["lines"] += len(chunk)
+            lines = store.lookup(chunk)
+            stats["cached"] += sum(1 for ln in lines if ln[4])
+            yield lines
+
+    try:
+        with open(errors_path, "w", encoding="utf-8") as ef:
+            for results in bounded_map(parse_chunk, todo(), args.workers):
+                ok = [r for r in results if r[4] is not None]
+                for src, idx, raw_line, _, _, reason, _, _ in (r for r in results if r[4] is None):
+                    stats["errors"] += 1
+                    if len(errors) < 20:
+                        errors.append((idx, raw_line))
+                    ef.write(json.dumps({"source": src, "line": idx, "reason": reason, "raw": raw_line},
+                                        ensure_ascii=False) + "\n")
+                stats["parsed"] += len(ok)
+                stats["changed"] += store.upsert(ok)
+        stats["removed"] = store.sweep(args.inputs or ["<raw_text>"])
+
+        # JSON保存（日本語そのまま・整形）
+        digest = store.digest()
+        if args.full or not args.out.exists() or not store.is_written(digest):
+            n = store.write_json(args.out, digest)
+            print(f"Saved: {args.out.resolve()}  ({n} records)")
+        else:
+            print(f"Unchanged: {args.out.resolve()}  ({store.count()} records)")
+    finally:
+        store.close()
+
+    print(f"lines={stats['lines']} parsed={stats['parsed']} cached={stats['cached']} "
+          f"changed={stats['changed']} removed={stats['removed']} errors={stats['errors']} ({errors_path})")
+    if errors:
+        print("\n--- 解析できなかった行（要手直し）---")
+        for i, e in errors:
+            print(f"[{i:04d}] {e}")
+        if stats["errors"] > len(errors):
+            print(f"...and {stats['errors']-len(errors)} more")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,463 @@
+"""
+./data/*.json と、そこから作る派生構造（正規化済みレコード・各種インデックス）の保持とホットリロード。
+
+- データセット（= JSON ファイル1つ）ごとに、登録された builder で派生構造を作る
+- ファイルの mtime を監視し、変わったデータセットだけを作り直す（リクエスト処理の外で）
+- 出来上がったら DataVersion を丸ごと差し替える。参照の代入は原子的なので、
+  リクエスト側は `v = STORE.current` を1回読めば、処理中ずっと一貫した版を見られる
+- スナップショット（snapshot.py）があれば、JSON と中身が同じデータセットはそこから復元する
+- follow=True（複数ワーカー構成）では JSON を見ず、親プロセスが書き出すスナップショットだけを読む。
+  スナップショットが書き直されたら（ファイルの同一性で判定）中身の変わったデータセットを読み直し、
+  版番号にも generation を使う（全ワーカーで同じ番号になる）。
+  レコードの列・ポスティング（flat.py）は mmap のページをそのまま読むので全ワーカーで共有される。
+  ワーカーごとに持つのは pickle から作る小さなオブジェクト（表の枠・カレンダー・学部など）だけ
+- 各データセットは最初に使われた時に作る（LazyDataset）。reload() 自体は mtime を見るだけなので、
+  import や --reload のたびに全 JSON をパースしない。warm() で裏から先に全部作っておくこともできる
+- async のハンドラは aload() を待ってから読む（まだ作っていなければスレッドで作る。イベントループの上で
+  パース・索引作りをしない）。全部作ってある版を差し替える時は、新しい版もリロードのスレッドで作ってから公開する
+"""
+import asyncio, glob, json, logging, os, threading, time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from retrieval import BM25Index, CompositeRetriever
+from search_index import CompositeIndex, NgramIndex
+from snapshot import Snapshot, sha256_of
+
+# 生データ（ファイルが無ければ None）→ 派生構造の dict
+# 派生構造に "raw" があれば、以後は元の JSON の代わりにそれを生データとして持つ（索引もそれで作る）
+Builder = Callable[[Any], Dict[str, Any]]
+
+
+@dataclass(frozen=True)
+class Dataset:
+    name: str
+    mtime: float
+    raw: Any
+    derived: Dict[str, Any]
+    index: NgramIndex
+    retrieval: BM25Index
+    build_ms: float = 0.0
+    sha256: str = ""
+    source: str = "json"     # json / snapshot / published（follow で親のスナップショットから）
+
+    def payload(self) -> tuple:
+        """スナップショットに入れる部分"""
+        return (self.raw, self.derived, self.index, self.retrieval)
+
+
+class LazyDataset:
+    """
+    データセット1つ分の once-initializer。最初に get() した時に loader で作る（スレッドセーフ・1回だけ）。
+    loader が None を返すか例外を投げたら、空のデータセット（fallback）で埋めて state を failed にする
+    （次の reload で作り直す）。
+    """
+
+    def __init__(self, name: str, mtime: float, loader: Callable[[], Optional[Dataset]],
+                 fallback: Callable[[], Dataset], sha256: str = "",
+                 on_ready: Optional[Callable[[Dataset], None]] = None):
+        self.name = name
+        self.mtime = mtime
+        self.sha256 = sha256
+        self._loader: Optional[Callable[[], Optional[Dataset]]] = loader
+        self._fallback = fallback
+        self._on_ready = on_ready
+        self._lock = threading.Lock()
+        self._ds: Optional[Dataset] = None
+        self.state = "pending"    # pending / loading / ready / failed
+        self.error = ""
+        self.load_ms = 0.0
+
+    @classmethod
+    def of(cls, ds: Dataset) -> "LazyDataset":
+        """作り終えたデータセットをそのまま包む"""
+        slot = cls(ds.name, ds.mtime, lambda: ds, lambda: ds, ds.sha256)
+        slot._ds, slot._loader, slot.state, slot.load_ms = ds, None, "ready", ds.build_ms
+        return slot
+
+    @property
+    def loaded(self) -> bool:
+        return self._ds is not None
+
+    def get(self) -> Dataset:
+        ds = self._ds
+        if ds is not None:
+            return ds
+        with self._lock:
+            if self._ds is not None:
+                return self._ds
+            self.state = "loading"
+            t0 = time.perf_counter()
+            try:
+                ds = self._loader()
+            except Exception as e:
+                logging.warning(f"Failed to build dataset {self.name}: {e}")
+                self.error = str(e)
+                ds = None
+            if ds is None:
+                ds = self._fallback()
+                self.state = "failed"
+                self.error = self.error or "unreadable"
+            else:
+                self.state = "ready"
+            self.load_ms = (time.perf_counter() - t0) * 1000
+            self._loader = self._fallback = None
+            self._ds = ds
+        logging.info(f"dataset {self.name} loaded in {self.load_ms:.1f} ms ({ds.source})")
+        if self._on_ready is not None:
+            self._on_ready(ds)
+        return ds
+
+    def info(self) -> Dict[str, Any]:
+        ds = self._ds
+        out: Dict[str, Any] = {
+            "state": self.state,
+            "mtime": self.mtime,
+            "loaded": ds is not None and ds.raw is not None,
+            "load_ms": round(self.load_ms, 1),
+            "build_ms": round(ds.build_ms, 1) if ds is not None else None,
+            "source": ds.source if ds is not None else None,
+        }
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+@dataclass(frozen=True)
+class DataVersion:
+    """
+    ある時点のデータ一式（不変）。派生構造は属性として読める（例: v.teachers）。
+    属性を読んだ時に、そのキーを持つデータセットだけを作る。全データセットにまたがるもの
+    （datasets / data / search_index / retriever）を読むと全部作る
+    """
+    version: int
+    slots: Dict[str, LazyDataset]
+    keys: Dict[str, str] = field(default_factory=dict)     # 派生構造のキー → データセット名
+    _merged: Dict[str, Any] = field(default_factory=dict, repr=False)
+    _lock: Any = field(default_factory=threading.Lock, repr=False)
+
+    def __getattr__(self, key: str) -> Any:
+        d = self.__dict__
+        if key.startswith("_") or "slots" not in d:
+            raise AttributeError(key)
+        name = d["keys"].get(key)
+        if name in d["slots"]:
+            derived = d["slots"][name].get().derived
+            if key in derived:
+                return derived[key]
+        # どのデータセットのキーか分からない → 全部作って探す（作ったものは keys に覚える）
+        for slot in d["slots"].values():
+            derived = slot.get().derived
+            if key in derived:
+                return derived[key]
+        raise AttributeError(key)
+
+    @property
+    def datasets(self) -> Dict[str, Dataset]:
+        return {n: s.get() for n, s in self.slots.items()}
+
+    @property
+    def data(self) -> Dict[str, Any]:
+        """従来の DATA 相当（ファイル名 → 生データ）。存在するファイルのみ"""
+        return {n: d.raw for n, d in self.datasets.items() if d.raw is not None}
+
+    def _merge(self) -> Tuple[CompositeIndex, CompositeRetriever]:
+        merged = self._merged.get("indexes")
+        if merged is None:
+            with self._lock:
+                merged = self._merged.get("indexes")
+                if merged is None:
+                    datasets = self.datasets
+                    order = [n for n in sorted(datasets) if datasets[n].raw is not None]
+                    merged = self._merged["indexes"] = (
+                        CompositeIndex([datasets[n].index for n in order]),
+                        CompositeRetriever([datasets[n].retrieval for n in order]),
+                    )
+        return merged
+
+    @property
+    def search_index(self) -> CompositeIndex:
+        return self._merge()[0]
+
+    @property
+    def retriever(self) -> CompositeRetriever:
+        return self._merge()[1]
+
+    @property
+    def loaded(self) -> bool:
+        """全データセットと横断索引まで作り終えているか（読んでもブロックしない）"""
+        return "indexes" in self._merged
+
+    def load_all(self) -> None:
+        self._merge()
+
+
+class DataStore:
+    def __init__(self, data_dir: str, builders: Dict[str, Builder], snapshot: Optional[Snapshot] = None,
+                 follow: bool = False, provides: Optional[Dict[str, Sequence[str]]] = None):
+        """provides: データセット名 → その builder が返すキー（v.teachers でそのデータセットだけ作るため）"""
+        self.data_dir = data_dir
+        self.builders = builders
+        self.provides = provides or {}
+        self.keys: Dict[str, str] = {k: n for n, ks in self.provides.items() for k in ks}
+        self.snapshot = snapshot
+        self.follow = follow and snapshot is not None
+        self.generation = 0      # follow 時に読み込んだスナップショットの generation
+        self._attached = (0, 0, 0)   # follow 時に読み込んだスナップショットファイルの Snapshot.stamp
+        self._lock = threading.Lock()         # 書き込み（リロード）同士の直列化のみ
+        self._snap_lock = threading.Lock()    # スナップショットの開き直しと読み出し（mmap）の直列化
+        self._watch_task: Optional["asyncio.Task"] = None
+        self._warm_task: Optional["asyncio.Task"] = None
+        self.current = DataVersion(version=0, slots={}, keys=self.keys)
+        self.last_reload: Dict[str, Any] = {}
+        self.warmup: Dict[str, Any] = {"state": "off"}
+
+    # ---- 読み込み ----
+    def _scan(self) -> Dict[str, float]:
+        out = {}
+        for path in glob.glob(os.path.join(self.data_dir, "*.json")):
+            name = os.path.splitext(os.path.basename(path))[0]
+            try:
+                out[name] = os.stat(path).st_mtime
+            except OSError:
+                pass
+        return out
+
+    def _build(self, name: str, mtime: float) -> Optional[Dataset]:
+        t0 = time.perf_counter()
+        raw = None
+        sha = ""
+        if mtime:
+            path = os.path.join(self.data_dir, f"{name}.json")
+            try:
+                with open(path, "rb") as f:
+                    body = f.read()
+                sha = sha256_of(body)
+                # 中身が同じならスナップショットから（パースも索引作りもしない）
+                hit = self._snap_load(name, sha)
+                if hit is not None:
+                    raw, derived, index, retrieval = hit
+                    return Dataset(name, mtime, raw, derived, index, retrieval,
+                                   (time.perf_counter() - t0) * 1000, sha, "snapshot")
+                raw = json.loads(body.decode("utf-8"))
+            except Exception as e:
+                logging.warning(f"Failed to load {path}: {e}")
+                return None
+        builder = self.builders.get(name)
+        derived = builder(raw) if builder else {}
+        if raw is not None:
+            raw = derived.pop("raw", raw)
+        else:
+            derived.pop("raw", None)
+        index = NgramIndex({name: raw} if raw is not None else {})
+        retrieval = BM25Index(name, raw)
+        return Dataset(name, mtime, raw, derived, index, retrieval, (time.perf_counter() - t0) * 1000, sha)
+
+    def _snap_load(self, name: str, sha: str) -> Optional[tuple]:
+        if self.snapshot is None:
+            return None
+        with self._snap_lock:
+            return self.snapshot.load(name, sha)
+
+    def _snap_refresh(self) -> bool:
+        with self._snap_lock:
+            return self.snapshot.refresh()
+
+    def _load_published(self, name: str, sha: str, mtime: float) -> Optional[Dataset]:
+        t0 = time.perf_counter()
+        hit = self._snap_load(name, sha)
+        if hit is None:
+            # 読む前にスナップショットが書き直された → 次の attach で入れ替わるまでは JSON から
+            return self._build(name, self._scan().get(name, 0.0))
+        raw, derived, index, retrieval = hit
+        return Dataset(name, mtime, raw, derived, index, retrieval, (time.perf_counter() - t0) * 1000, sha, "published")
+
+    def _learn(self, ds: Dataset) -> None:
+        for k in ds.derived:
+            self.keys.setdefault(k, ds.name)
+
+    def _lazy(self, name: str, mtime: float, loader: Optional[Callable[[], Optional[Dataset]]] = None,
+              sha: str = "") -> LazyDataset:
+        return LazyDataset(name, mtime, loader or (lambda: self._build(name, mtime)),
+                           lambda: self._build(name, 0.0), sha, self._learn)
+
+    @staticmethod
+    def _keep(prev: Optional[LazyDataset], force: bool) -> bool:
+        # 読めずに空で埋めたものは、変更が無くても次のリロードで作り直す
+        return prev is not None and prev.state != "failed" and not force
+
+    def _attach(self, force: bool) -> Optional[List[str]]:
+        """
+        follow 時: スナップショットが書き直されていれば、sha256 が変わったデータセットをそこから読む。
+        generation だけで比べると、ファイルを消して作り直した時に同じ番号を見落とすので、ファイルの同一性で見る。
+        読み直したデータセット名を返す。スナップショットがまだ無い（使えない）なら None（JSON から作る）
+        """
+        snap = self.snapshot
+        if not self._snap_refresh():
+            return None
+        if snap.stamp == self._attached and not force:
+            return []
+        old = self.current.slots
+        slots: Dict[str, LazyDataset] = {}
+        changed: List[str] = []
+        for name, sha in snap.names().items():
+            prev = old.get(name)
+            if self._keep(prev, force) and prev.sha256 == sha:
+                slots[name] = prev     # 中身が同じデータセットは読み直さない
+                continue
+            changed.append(name)
+            slots[name] = self._lazy(name, snap.mtime, lambda n=name, s=sha, m=snap.mtime: self._load_published(n, s, m), sha)
+            if prev is not None and prev.loaded:
+                slots[name].get()      # 使われていたものは今読む（mmap からなので軽い）
+        for name in self.builders:
+            if name not in slots:
+                # ファイルが無いデータセット（空の派生構造）
+                prev = old.get(name)
+                slots[name] = prev if prev is not None and not prev.mtime else self._lazy(name, 0.0)
+        # 版番号は generation に揃える（JSON から作った版を既に持っていれば、それより大きくする）
+        self._publish(max(snap.generation, self.current.version + 1), slots)
+        self.generation = snap.generation
+        self._attached = snap.stamp
+        return changed
+
+    def _publish(self, version: int, slots: Dict[str, LazyDataset]) -> None:
+        v = DataVersion(version=version, slots=slots, keys=self.keys)
+        if self.current.loaded:
+            # 旧版は全部作ってあった → 新版もここ（リロードのスレッド）で作ってから差し替える。
+            # 差し替えた直後のリクエストが、未構築のデータセットや横断索引を作ることにならないように
+            v.load_all()
+        self.current = v
+
+    def reload(self, force: bool = False) -> Dict[str, Any]:
+        """変更のあったデータセットだけ作り直して新しい版を公開する"""
+        with self._lock:
+            old = self.current
+            if self.follow:
+                attached = self._attach(force)
+                if attached is not None:
+                    if self.current is not old:
+                        logging.info(f"data generation {self.generation} attached: changed={attached}")
+                    self.last_reload = {"version": self.current.version, "changed": attached,
+                                        "removed": [n for n in old.slots if n not in self.current.slots],
+                                        "at": time.time()}
+                    return self.last_reload
+                if old.version:
+                    # 公開済みの版を持っているなら、スナップショットが一時的に無くてもそのまま使う
+                    return self.last_reload
+                logging.warning(f"no published snapshot at {self.snapshot.path} yet; building from JSON")
+            elif self.snapshot is not None:
+                self._snap_refresh()
+            on_disk = self._scan()
+            names = sorted(set(on_disk) | set(self.builders))
+            slots: Dict[str, LazyDataset] = {}
+            changed: List[str] = []
+            for name in names:
+                mtime = on_disk.get(name, 0.0)
+                prev = old.slots.get(name)
+                if self._keep(prev, force) and prev.mtime == mtime:
+                    slots[name] = prev
+                    continue
+                if prev is None or not prev.loaded:
+                    slots[name] = self._lazy(name, mtime)    # まだ誰も使っていない → 使われた時に作る
+                    changed.append(name)
+                    continue
+                # 使われていたものはここで作り直す（リクエストに初回の読み込みを待たせない）
+                ds = self._build(name, mtime)
+                if ds is None:
+                    # 読めなかった（書き込み途中など）→ 旧版を維持して次回に再試行
+                    slots[name] = prev
+                    continue
+                slots[name] = LazyDataset.of(ds)
+                changed.append(name)
+            removed = [n for n in old.slots if n not in slots]
+
+            if changed or removed or old.version == 0:
+                self._publish(old.version + 1, slots)
+                logging.info(f"data version {self.current.version}: changed={changed} removed={removed}")
+            self.last_reload = {
+                "version": self.current.version,
+                "changed": changed,
+                "removed": removed,
+                "at": time.time(),
+            }
+            return self.last_reload
+
+    async def aload(self) -> DataVersion:
+        """
+        async のハンドラ用の current。まだ作っていないデータセットがあれば、スレッドで全部作ってから返す
+        （LazyDataset.get はロックを取ってパース・索引作りをするので、イベントループの上では呼ばない）
+        """
+        v = self.current
+        if not v.loaded:
+            await asyncio.get_running_loop().run_in_executor(None, v.load_all)
+        return v
+
+    # ---- 監視（mtime ポーリング）----
+    async def _watch(self, interval: float) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # 再構築はスレッドで（イベントループ＝リクエスト処理を止めない）
+                await loop.run_in_executor(None, self.reload)
+            except Exception as e:
+                logging.warning(f"data reload failed: {e}")
+
+    def start_watching(self, interval: float) -> None:
+        if interval > 0 and self._watch_task is None:
+            self._watch_task = asyncio.get_running_loop().create_task(self._watch(interval))
+
+    async def stop_watching(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+    # ---- 先読み（起動時に裏で全データセットを作る）----
+    def warm(self) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        self.warmup = {"state": "running", "started": time.time()}
+        try:
+            self.current.load_all()
+        except Exception as e:
+            self.warmup = {"state": "failed", "error": str(e)}
+            raise
+        self.warmup = {"state": "done", "ms": round((time.perf_counter() - t0) * 1000, 1)}
+        logging.info(f"data warm-up done in {self.warmup['ms']} ms")
+        return self.warmup
+
+    def start_warmup(self) -> None:
+        if self._warm_task is None:
+            self.warmup = {"state": "running", "started": time.time()}
+            self._warm_task = asyncio.get_running_loop().create_task(self._warm())
+
+    async def _warm(self) -> None:
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.warm)
+        except Exception as e:
+            logging.warning(f"data warm-up failed: {e}")
+
+    def readiness(self) -> Dict[str, Any]:
+        """
+        /readyz 用。先読み中（または失敗）と、読めずに空で埋めたデータセットがある間は not ready。
+        先読みしない構成では、まだ作っていない（pending）データセットがあっても ready（使われた時に作る）
+        """
+        v = self.current
+        datasets = {n: s.info() for n, s in v.slots.items()}
+        failed = [n for n, d in datasets.items() if d["state"] == "failed"]
+        ready = v.version > 0 and self.warmup["state"] in ("off", "done") and not failed
+        return {"ready": ready, "version": v.version, "warmup": self.warmup, "failed": failed, "datasets": datasets}
+
+    def info(self) -> Dict[str, Any]:
+        v = self.current
+        return {
+            "version": v.version,
+            "datasets": {n: s.info() for n, s in v.slots.items()},
+            "mode": "follow" if self.follow else "local",
+            "generation": self.generation,
+            "snapshot": self.snapshot.info() if self.snapshot is not None else None,
+            "last_reload": self.last_reload,
+        }
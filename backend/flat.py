@@ -0,0 +1,227 @@
+"""
+ポインタを持たない（平らな）列。スナップショットの mmap の上にそのまま載る。
+
+- StrTable : 文字列の列。UTF-8 を連結した blob と、各要素の開始位置 offsets（n+1 個の u64）だけを持つ。
+             table[i] はその都度デコードした str を返す
+- Column   : 数値の列（array の typecode）
+- Postings : 語 → 値の並び。語は StrTable、語ごとの範囲は starts、値は Column。
+             語は crc32 のオープンアドレス法の表（u32、語番号 + 1）で引き、UTF-8 のバイト列のまま比べる
+             （str の hash はプロセスごとに変わるので使えない）。get(語) は値の列の切り出し（memoryview）を返す
+
+pickle（protocol 5）では中身を PickleBuffer で出す。snapshot.py はそれを out-of-band でセクションに並べ、
+読む時は mmap の memoryview を渡すので、復元した列はヒープにコピーせずファイルのページ
+（ページキャッシュ＝全ワーカーで共有）を直接読む。JSON から作った時は bytes / array を同じ読み方で持つ。
+"""
+import re, zlib
+from array import array
+from collections.abc import Sequence
+from pickle import PickleBuffer
+from typing import Any, Dict, Iterable, Iterator, Tuple
+
+
+def _view(buf: Any, code: str) -> memoryview:
+    """bytes / array / 復元したバッファを typecode の1次元の memoryview として読む"""
+    mv = memoryview(buf)
+    if mv.format != "B":
+        mv = mv.cast("B")
+    return mv if code == "B" else mv.cast(code)
+
+
+def _out(mv: memoryview, protocol: int) -> Any:
+    return PickleBuffer(mv) if protocol >= 5 else mv.tobytes()
+
+
+def literal(s: str) -> "re.Pattern[bytes]":
+    """StrTable.search 用。s をそのまま（UTF-8 のバイト列で）探すパターン"""
+    return re.compile(re.escape(s.encode("utf-8", "surrogatepass")))
+
+
+class Column(Sequence):
+    """数値の列。スライスは memoryview（コピーしない）"""
+    __slots__ = ("_v",)
+
+    def __init__(self, values: Any = (), code: str = "I"):
+        self._v = _view(values if isinstance(values, (array, memoryview, bytes)) else array(code, values), code)
+
+    @property
+    def view(self) -> memoryview:
+        """中身の memoryview（ループの中で添字を引く時はこちらを使う）"""
+        return self._v
+
+    def __len__(self) -> int:
+        return len(self._v)
+
+    def __getitem__(self, i):
+        return self._v[i]
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._v)
+
+    def __eq__(self, other: Any) -> bool:
+        return list(self) == list(other) if isinstance(other, (Sequence, memoryview)) else NotImplemented
+
+    def __repr__(self) -> str:
+        return f"<Column {self._v.format} n={len(self._v)}>"
+
+    def __reduce_ex__(self, protocol: int):
+        return Column, (_out(self._v, protocol), self._v.format)
+
+
+class StrTable(Sequence):
+    """文字列の列（UTF-8 の blob ＋ 開始位置）。スライスは str のリスト"""
+    __slots__ = ("_b", "_o")
+
+    def __init__(self, items: Iterable[str] = ()):
+        offsets = array("Q", [0])
+        parts = []
+        pos = 0
+        for s in items:
+            b = s.encode("utf-8", "surrogatepass")
+            parts.append(b)
+            pos += len(b)
+            offsets.append(pos)
+        self._b = memoryview(b"".join(parts))
+        self._o = _view(offsets, "Q")
+
+    @classmethod
+    def _load(cls, blob: Any, offsets: Any) -> "StrTable":
+        t = cls.__new__(cls)
+        t._b, t._o = _view(blob, "B"), _view(offsets, "Q")
+        return t
+
+    def __len__(self) -> int:
+        return len(self._o) - 1
+
+    def __getitem__(self, i):
+        o = self._o
+        if type(i) is int and 0 <= i:
+            # i == len(self) は o[i + 1] が IndexError になる
+            return str(self._b[o[i]:o[i + 1]], "utf-8", "surrogatepass")
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = i + len(self) if i < 0 else i
+        if not 0 <= i < len(o) - 1:
+            raise IndexError(i)
+        return str(self._b[o[i]:o[i + 1]], "utf-8", "surrogatepass")
+
+    def __iter__(self) -> Iterator[str]:
+        b, o = self._b, self._o
+        return (str(b[o[i]:o[i + 1]], "utf-8", "surrogatepass") for i in range(len(o) - 1))
+
+    def __eq__(self, other: Any) -> bool:
+        return list(self) == list(other) if isinstance(other, Sequence) else NotImplemented
+
+    def __repr__(self) -> str:
+        return f"<StrTable n={len(self)} bytes={self._b.nbytes}>"
+
+    @property
+    def nbytes(self) -> int:
+        return self._b.nbytes + self._o.nbytes
+
+    def raw(self, i: int) -> memoryview:
+        """i 番目の UTF-8 のバイト列（コピーしない）"""
+        o = self._o
+        return self._b[o[i]:o[i + 1]]
+
+    def search(self, pattern: "re.Pattern[bytes]", i: int) -> bool:
+        """
+        i 番目に pattern（literal() で作ったもの）が当たるか。str にデコードせず UTF-8 のまま照合する
+        （UTF-8 は文字の途中から一致しないので、部分文字列の判定は str と同じ結果になる）
+        """
+        o = self._o
+        return pattern.search(self._b, o[i], o[i + 1]) is not None
+
+    def __reduce_ex__(self, protocol: int):
+        return StrTable._load, (_out(self._b, protocol), _out(self._o, protocol))
+
+
+class Postings:
+    """
+    語 → 値の並び（転置索引のポスティング）。codes は値の列の typecode:
+    1文字なら値は数値、2文字以上なら値はその数のタプル（例: "Id" は (文書 ID, 重み)）。
+    get(語) は先頭の列の切り出し、items(語) は全列を組にしたイテレータ、df(語) は件数
+    """
+    __slots__ = ("terms", "starts", "cols", "table")
+
+    def __init__(self, postings: Dict[str, Sequence], codes: str = "I"):
+        terms = sorted(postings)
+        starts = array("Q", [0])
+        cols = [array(c) for c in codes]
+        for t in terms:
+            vals = postings[t]
+            if len(cols) == 1:
+                cols[0].extend(vals)
+            else:
+                for col, xs in zip(cols, zip(*vals)):
+                    col.extend(xs)
+            starts.append(len(cols[0]))
+        # 語の表は語数の2倍以上の2のべき乗（線形探索が短くて済むように半分以上は空ける）
+        size = 8
+        while size < 2 * len(terms):
+            size *= 2
+        table = array("I", bytes(4 * size))
+        for i, t in enumerate(terms):
+            h = zlib.crc32(t.encode("utf-8", "surrogatepass")) & (size - 1)
+            while table[h]:
+                h = (h + 1) & (size - 1)
+            table[h] = i + 1
+        self.terms = StrTable(terms)
+        self.starts = Column(starts, "Q")
+        self.cols = tuple(Column(col, c) for col, c in zip(cols, codes))
+        self.table = Column(table)
+
+    def _range(self, term: str) -> Tuple[int, int]:
+        key = term.encode("utf-8", "surrogatepass")
+        table = self.table.view
+        mask = len(table) - 1
+        blob, offsets = self.terms._b, self.terms._o
+        h = zlib.crc32(key) & mask
+        while True:
+            j = table[h]
+            if not j:
+                return 0, 0
+            j -= 1
+            if blob[offsets[j]:offsets[j + 1]] == key:
+                starts = self.starts.view
+                return starts[j], starts[j + 1]
+            h = (h + 1) & mask
+
+    def get(self, term: str, default: Any = ()) -> Any:
+        a, b = self._range(term)
+        return self.cols[0][a:b] if b > a else default
+
+    def items(self, term: str) -> Iterator[Tuple[Any, ...]]:
+        a, b = self._range(term)
+        return zip(*(col[a:b] for col in self.cols))
+
+    def df(self, term: str) -> int:
+        a, b = self._range(term)
+        return b - a
+
+    def __contains__(self, term: str) -> bool:
+        return self.df(term) > 0
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def __repr__(self) -> str:
+        return f"<Postings terms={len(self.terms)} values={len(self.cols[0])}>"
+
+    def __reduce_ex__(self, protocol: int):
+        return _postings, (self.terms, self.starts, self.cols, self.table)
+
+
+def csr(lists: Iterable[Iterable[int]], code: str = "I") -> Tuple[Column, Column]:
+    """リストのリスト → (各リストの開始位置 n+1 個, 連結した値)。i 番目は vals[starts[i]:starts[i + 1]]"""
+    starts = array("Q", [0])
+    vals = array(code)
+    for xs in lists:
+        vals.extend(xs)
+        starts.append(len(vals))
+    return Column(starts, "Q"), Column(vals, code)
+
+
+def _postings(terms: StrTable, starts: Column, cols: Tuple[Column, ...], table: Column) -> Postings:
+    p = Postings.__new__(Postings)
+    p.terms, p.starts, p.cols, p.table = terms, starts, cols, table
+    return p
@@ -0,0 +1,151 @@
+"""
+キーワード → 意図/スロットの表を1本の正規表現にまとめた、単一走査のマッチャ。
+
+aclassify_tool のフォールバック（re.search の連続）と find_calendar の条件抽出
+（季節・休業・授業開始/終了・前期/後期・クォーター）を、入力を1回なめるだけで済ませる。
+学年暦イベントのタイトルも同じ仕組みでロード時にタグ付けしておき、検索時は集合演算だけにする。
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+# (パターン, 付与するタグ)。パターンは語の選言。正規表現を含む語は照合後に個別に判定する
+Table = Sequence[Tuple[str, Tuple[str, ...]]]
+
+QUERY_TABLE: Table = [
+    # 休暇（季節つき）
+    ("夏休み", ("tool:calendar", "season:夏", "vacation")),
+    ("冬休み", ("tool:calendar", "season:冬", "vacation")),
+    ("春休み", ("tool:calendar", "season:春", "vacation")),
+    ("休業", ("tool:calendar", "vacation")),
+    ("休暇", ("tool:calendar", "vacation")),
+    ("休み", ("vacation",)),
+    ("夏", ("season:夏",)),
+    ("冬", ("season:冬",)),
+    ("春", ("season:春",)),
+    ("祝日|連休|学事暦|スケジュール", ("tool:calendar",)),
+    # 授業
+    ("授業開始|授業再開", ("tool:calendar", "start")),
+    ("開講", ("tool:calendar", "start")),
+    ("授業終了", ("tool:calendar", "end")),
+    ("閉講", ("tool:calendar", "end")),
+    ("授業|休講|試験|成績|学期|カレンダー|学年暦", ("tool:calendar",)),
+    ("前学期", ("tool:calendar", "term:front")),
+    ("後学期", ("tool:calendar", "term:back")),
+    ("前期", ("term:front",)),
+    ("後期", ("term:back",)),
+    (r"第\s*[1-4１-４]\s*クォーター", ("quarter",)),
+    (r"[QＱ][1-4１-４]", ("tool:calendar", "quarter")),
+    # 教員・サークル・天気
+    ("先生|教授|オフィスアワー|研究室", ("tool:teacher",)),
+    ("サークル|部活|クラブ|同好会|団体|部員", ("tool:clubs",)),
+    ("天気", ("tool:weather",)),
+]
+
+TITLE_TABLE: Table = [
+    ("夏季休業|夏休み", ("season:夏", "vacation")),
+    ("冬季休業|冬休み", ("season:冬", "vacation")),
+    ("春季休業|春休み", ("season:春", "vacation")),
+    ("休業|休暇|休み", ("vacation",)),
+    ("授業開始|授業再開|開講", ("start",)),
+    ("授業終了|閉講", ("end",)),
+    ("前学期", ("term:front",)),
+    ("後学期", ("term:back",)),
+    ("第1クォーター", ("q:1", "term:front")),
+    ("第2クォーター", ("q:2", "term:front")),
+    ("第3クォーター", ("q:3", "term:back")),
+    ("第4クォーター", ("q:4", "term:back")),
+]
+
+TOOL_PRIORITY = ("calendar", "teacher", "clubs", "weather")
+SEASON_PRIORITY = ("夏", "冬", "春")
+
+_Z2H = str.maketrans("１２３４", "1234")
+_REGEX_META = re.compile(r"[\\\[\](){}.*+?^$|]")
+
+
+class KeywordMatcher:
+    """
+    表の全語を1本の選言にコンパイルし、findall 1回で出現語を集めてタグに引き直す。
+    グループを使わない素の選言にしておくと、re が先頭文字の集合で走査位置を読み飛ばせるので速い。
+    """
+
+    def __init__(self, table: Table):
+        self._literal: Dict[str, Tuple[str, ...]] = {}
+        self._patterns: List[Tuple["re.Pattern", Tuple[str, ...]]] = []
+        alts: List[str] = []
+        for pat, tags in table:
+            for alt in pat.split("|"):
+                if _REGEX_META.search(alt):
+                    self._patterns.append((re.compile(alt), tags))
+                    alts.append(alt)
+                elif alt not in self._literal:
+                    self._literal[alt] = tags
+                    alts.append(alt)
+        # 長い語を先に並べる（同じ位置で「授業開始」が「授業」に食われないように）
+        alts.sort(key=lambda a: -len(a))
+        self._re = re.compile("|".join(alts))
+
+    def _pattern_tags(self, word: str) -> List[str]:
+        for rx, tags in self._patterns:
+            if rx.fullmatch(word):
+                # "quarter" は語中の数字（全角も可）から q:N に置き換える
+                q = "q:" + re.sub(r"\D", "", word).translate(_Z2H)
+                return [q if t == "quarter" else t for t in tags]
+        return []
+
+    def scan(self, text: str) -> FrozenSet[str]:
+        found = set()
+        for word in self._re.findall(text):
+            tags = self._literal.get(word)
+            found.update(tags if tags is not None else self._pattern_tags(word))
+        return frozenset(found)
+
+
+@dataclass
+class Intent:
+    tool: str
+    season: Optional[str] = None
+    vacation: bool = False
+    class_start: bool = False
+    class_end: bool = False
+    term_front: bool = False
+    term_back: bool = False
+    quarter: Optional[str] = None     # "1".."4"
+    tags: FrozenSet[str] = frozenset()
+
+
+_QUERY = KeywordMatcher(QUERY_TABLE)
+_TITLE = KeywordMatcher(TITLE_TABLE)
+_TOOL_TAGS = [(f"tool:{t}", t) for t in TOOL_PRIORITY]
+_SEASON_TAGS = [(f"season:{s}", s) for s in SEASON_PRIORITY]
+_QUARTER_TAGS = [(f"q:{q}", q) for q in "1234"]
+
+
+def _first(tags: FrozenSet[str], pairs: List[Tuple[str, str]], default: Optional[str]) -> Optional[str]:
+    for tag, val in pairs:
+        if tag in tags:
+            return val
+    return default
+
+
+def match_intent(text: str) -> Intent:
+    tags = _QUERY.scan(text)
+    if not tags:
+        return Intent("data_qa")
+    return Intent(
+        _first(tags, _TOOL_TAGS, "data_qa"),
+        _first(tags, _SEASON_TAGS, None),
+        "vacation" in tags,
+        "start" in tags,
+        "end" in tags,
+        "term:front" in tags,
+        "term:back" in tags,
+        _first(tags, _QUARTER_TAGS, None),
+        tags,
+    )
+
+
+def tag_title(title: str) -> FrozenSet[str]:
+    """学年暦イベントのタイトルに付けるタグ（ロード時に1回だけ）"""
+    return _TITLE.scan(title)
@@ -0,0 +1,280 @@
+"""
+LLM プロバイダの抽象化。ツール分類（aclassify_tool）と回答生成は、タスクごとに選んだプロバイダを通して呼ぶ。
+
+- OpenAIProvider : Responses API（main の常駐 AsyncClient を共有）
+- OllamaProvider : ローカルの Ollama（/api/chat）。専用の常駐クライアント、stream、keep_alive、同時実行数の上限
+
+どのプロバイダも失敗時は例外を投げずに空文字を返す（呼び出し側が全文検索やルール判定に落とす）。
+"""
+import asyncio, json, logging
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import requests
+
+from metrics import fail
+
+# httpx（未インストールでも動くフォールバック）
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+Messages = List[Dict[str, str]]
+
+
+class LLMProvider(ABC):
+    name = ""
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    async def acomplete(self, messages: Messages, timeout: float = 12, model: Optional[str] = None) -> str:
+        """messages への応答テキスト。失敗時は空文字"""
+
+    async def astream(self, messages: Messages, timeout: float = 12, model: Optional[str] = None) -> AsyncIterator[str]:
+        """既定は一括で取ってから1回だけ返す"""
+        out = await self.acomplete(messages, timeout, model)
+        if out:
+            yield out
+
+    async def open(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"provider": self.name, "available": self.available()}
+
+
+# ===== OpenAI (Responses API) =====
+def _extract_output_text(data: dict) -> str:
+    """Responses APIのレスポンスから最初のテキストを取り出す"""
+    for item in data.get("output", []):
+        if item.get("type") == "message":
+            cont = item.get("content") or []
+            if cont and isinstance(cont, list):
+                first = cont[0]
+                if first.get("type") == "output_text":
+                    return (first.get("text") or "").strip()
+        if item.get("type") == "output_text":
+            return (item.get("text") or "").strip()
+    return (data.get("text") or "").strip()
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, api_key: Optional[str], model: str, url: str,
+                 client: Callable[[], Optional["httpx.AsyncClient"]]):
+        self.api_key = api_key
+        self.model = model
+        self.url = url
+        self._client = client   # lifespan で開閉される共有 AsyncClient（天気取得と共用）
+
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    def _request(self, messages: Messages, model: Optional[str], stream: bool = False):
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        payload = {"model": model or self.model, "input": messages, "store": False}
+        if stream:
+            payload["stream"] = True
+        return headers, payload
+
+    def _complete_sync(self, messages: Messages, timeout: float, model: Optional[str]) -> str:
+        """常駐 AsyncClient が無い時（httpx 未インストール・lifespan の外）の同期版。httpx が無ければ requests"""
+        headers, payload = self._request(messages, model)
+        try:
+            if httpx is not None:
+                with httpx.Client(timeout=timeout) as client:
+                    r = client.post(self.url, headers=headers, json=payload)
+                    r.raise_for_status()
+                    data = r.json()
+            else:
+                r = requests.post(self.url, headers=headers, json=payload, timeout=timeout)
+                r.raise_for_status()
+                data = r.json()
+            return _extract_output_text(data)
+        except Exception as e:
+            fail(e)
+            logging.warning(f"OpenAI error: {e}")
+            return ""
+
+    async def acomplete(self, messages: Messages, timeout: float = 12, model: Optional[str] = None) -> str:
+        """OpenAI Responses APIを叩いてテキストを返す。AsyncClient が無い環境ではスレッドで同期版を呼ぶ"""
+        if not self.api_key:
+            return ""
+        client = self._client()
+        if client is None:
+            return await asyncio.to_thread(self._complete_sync, messages, timeout, model)
+        headers, payload = self._request(messages, model)
+        try:
+            r = await client.post(self.url, headers=headers, json=payload, timeout=timeout)
+            r.raise_for_status()
+            return _extract_output_text(r.json())
+        except Exception as e:
+            fail(e)
+            logging.warning(f"OpenAI error: {e}")
+            return ""
+
+    async def astream(self, messages: Messages, timeout: float = 12, model: Optional[str] = None) -> AsyncIterator[str]:
+        """Responses API の stream モードでテキスト差分を順に返す（失敗時はそこで打ち切り）"""
+        if not self.api_key:
+            return
+        client = self._client()
+        if client is None:
+            out = await self.acomplete(messages, timeout, model)
+            if out:
+                yield out
+            return
+        headers, payload = self._request(messages, model, stream=True)
+        try:
+            async with client.stream("POST", self.url, headers=headers, json=payload, timeout=timeout) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    body = line[5:].strip()
+                    if body == "[DONE]":
+                        break
+                    ev = json.loads(body)
+                    typ = ev.get("type")
+                    if typ == "response.output_text.delta":
+                        if ev.get("delta"):
+                            yield ev["delta"]
+                    elif typ == "response.completed":
+                        break
+                    elif typ in ("error", "response.failed", "response.incomplete"):
+                        fail(RuntimeError(typ))
+                        logging.warning(f"OpenAI stream error: {ev}")
+                        break
+        except Exception as e:
+            fail(e)
+            logging.warning(f"OpenAI stream error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "model": self.model}
+
+
+# ===== Ollama (/api/chat) =====
+class OllamaProvider(LLMProvider):
+    """
+    ローカル Ollama。モデルは keep_alive の間メモリに常駐させ、起動時に warm() で先読みする。
+    同時リクエストは max_concurrency 本までに絞り、超えた分はここで待たせる
+    （Ollama 側の並列数を超えて投げても、向こうのキューで待つうえにタイムアウトしやすいだけなので）。
+    """
+    name = "ollama"
+
+    def __init__(self, url: str, model: str, keep_alive: str = "30m", max_concurrency: int = 4):
+        self.url = url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.max_concurrency = max(1, max_concurrency)
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+        self._client: Optional["httpx.AsyncClient"] = None
+        self.counters = {"requests": 0, "errors": 0, "in_flight": 0, "waiting": 0}
+
+    def _payload(self, messages: Messages, model: Optional[str], stream: bool) -> Dict[str, Any]:
+        return {"model": model or self.model, "messages": messages, "stream": stream, "keep_alive": self.keep_alive}
+
+    def available(self) -> bool:
+        """常駐クライアント（open() で開く。httpx が必要）がある時だけ"""
+        return self._client is not None
+
+    async def open(self) -> None:
+        if httpx is None or self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            base_url=self.url,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+            timeout=60,
+        )
+        logging.info(f"Ollama client opened ({self.url}, model={self.model}, max_concurrency={self.max_concurrency})")
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def warm(self, model: Optional[str] = None) -> None:
+        """空のメッセージで呼ぶとモデルをロードだけして keep_alive の間常駐させる"""
+        if self._client is None:
+            return
+        try:
+            r = await self._client.post("/api/chat", json=self._payload([], model, False), timeout=120)
+            r.raise_for_status()
+            logging.info(f"Ollama model loaded: {model or self.model}")
+        except Exception as e:
+            logging.warning(f"Ollama warm-up failed: {e}")
+
+    def _failed(self, e: Exception) -> str:
+        self.counters["errors"] += 1
+        fail(e)
+        logging.warning(f"Ollama error: {e}")
+        return ""
+
+    async def _acquire(self) -> None:
+        self.counters["waiting"] += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.counters["waiting"] -= 1
+        self.counters["in_flight"] += 1
+        self.counters["requests"] += 1
+
+    def _release(self) -> None:
+        self.counters["in_flight"] -= 1
+        self._sem.release()
+
+    async def acomplete(self, messages: Messages, timeout: float = 12, model: Optional[str] = None) -> str:
+        if self._client is None:
+            return ""
+        await self._acquire()
+        try:
+            r = await self._client.post("/api/chat", json=self._payload(messages, model, False), timeout=timeout)
+            r.raise_for_status()
+            return ((r.json().get("message") or {}).get("content") or "").strip()
+        except Exception as e:
+            return self._failed(e)
+        finally:
+            self._release()
+
+    async def astream(self, messages: Messages, timeout: float = 12, model: Optional[str] = None) -> AsyncIterator[str]:
+        """stream: true の応答（1行1JSON）から message.content の差分を順に返す"""
+        if self._client is None:
+            out = await self.acomplete(messages, timeout, model)
+            if out:
+                yield out
+            return
+        await self._acquire()
+        try:
+            async with self._client.stream("POST", "/api/chat", json=self._payload(messages, model, True), timeout=timeout) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if not line.strip():
+                        continue
+                    ev = json.loads(line)
+                    if ev.get("error"):
+                        self._failed(RuntimeError(ev["error"]))
+                        break
+                    delta = (ev.get("message") or {}).get("content")
+                    if delta:
+                        yield delta
+                    if ev.get("done"):
+                        break
+        except Exception as e:
+            self._failed(e)
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(), "model": self.model, "url": self.url,
+            "keep_alive": self.keep_alive, "max_concurrency": self.max_concurrency, **self.counters,
+        }
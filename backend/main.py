@@ -1,10 +1,29 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager, nullcontext
+from datetime import date, datetime, timedelta
 from zoneinfo import ZoneInfo
-import logging, os, re, json, requests, glob
-from typing import List, Dict, Any
+import asyncio, glob, logging, os, re, json, requests, sys
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 from fastapi.middleware.cors import CORSMiddleware
+from search_index import stringify
+from datastore import DataStore
+from snapshot import Snapshot, code_fingerprint, read_key
+from cache import SingleFlight, TTLCache, normalize_query
+from calendar_index import CalendarIndex, parse_date_span
+from teacher_index import TeacherIndex
+from club_index import ClubIndex
+from records import Club, ClubTable, Teacher, TeacherTable
+from office_hours import OfficeHoursIndex, parse_availability_query, WEEKDAYS
+from weather import WeatherService
+from intents import match_intent, tag_title
+from metrics import REGISTRY, Sampled, TimingMiddleware, fail, render as render_metrics, set_tool, stage
+from llm import LLMProvider, OllamaProvider, OpenAIProvider
+from retrieval import estimate_tokens, pack_context
+from admission import SHED_REASONS, Admission
+from sessions import Session, SessionStore
 
 # httpx（未インストールでも動くフォールバック）
 try:
@@ -12,371 +31,475 @@ try:
 except ImportError:
     httpx = None
 
+# HTTP/2 は h2 パッケージがある時だけ有効化
+try:
+    import h2  # noqa: F401
+    HAS_H2 = True
+except ImportError:
+    HAS_H2 = False
+
 # ===== 基本設定 =====
 logging.basicConfig(level=logging.INFO)
-app = FastAPI()
 JST = ZoneInfo("Asia/Tokyo")
 
 # ===== ChatGPT (OpenAI API) 設定 =====
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL   = os.getenv("OPENAI_MODEL", "gpt-5-nano")
+OPENAI_URL     = "https://api.openai.com/v1/responses"
+
+# 非同期クライアントの接続プール設定（プロセスにつき1つを使い回す）
+OPENAI_MAX_CONNECTIONS  = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+OPENAI_MAX_KEEPALIVE    = int(os.getenv("OPENAI_MAX_KEEPALIVE", "50"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_HTTP2            = os.getenv("OPENAI_HTTP2", "1") == "1"
+
+# 受付制御（admission.py）。同時実行数・待ち行列（件数と最大待ち秒）・RPM/TPM（0 は無制限）
+# 溢れた呼び出しは上流を叩かずに空で返し、ルール判定・全文検索（search_data_any）に落とす
+OPENAI_MAX_IN_FLIGHT      = int(os.getenv("OPENAI_MAX_IN_FLIGHT", "32"))
+OPENAI_QUEUE_SIZE         = int(os.getenv("OPENAI_QUEUE_SIZE", "64"))
+OPENAI_QUEUE_TIMEOUT      = float(os.getenv("OPENAI_QUEUE_TIMEOUT", "2"))
+OPENAI_RPM                = float(os.getenv("OPENAI_RPM", "0"))
+OPENAI_TPM                = float(os.getenv("OPENAI_TPM", "0"))
+OPENAI_EST_OUTPUT_TOKENS  = int(os.getenv("OPENAI_EST_OUTPUT_TOKENS", "300"))   # TPM の見積もりに足す出力分
 
 # ===== モデル定義 =====
 class ChatRequest(BaseModel):
     content: str
     category: str
     type: str = "text"
+    # 会話セッション。None（省略）は1問ごとに独立、"" は新しく始める、それ以外は続き
+    session_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     content: str
     sender: str = "bot"
     timestamp: str
     category: str
+    session_id: Optional[str] = None
 
 # ===== ユーティリティ =====
-def parse_date(text: str) -> str:
-    dt = datetime.now(JST)
-    if "明後日" in text: dt += timedelta(days=2)
-    elif "明日" in text: dt += timedelta(days=1)
-    elif re.search(r"(今日|本日|きょう)", text): pass
-    else:
-        m = re.search(r"(\d{4})[-/\.](\d{1,2})[-/\.](\d{1,2})", text)
-        if m:
-            y, mo, d = map(int, m.groups())
-            return datetime(y, mo, d, tzinfo=JST).date().isoformat()
-    return dt.date().isoformat()
+def parse_date_range(text: str) -> Optional[tuple]:
+    """質問文の対象期間 (start: date, end: date)。「今日」基準は JST"""
+    return parse_date_span(text, datetime.now(JST).date())
 
-def stringify(val: Any) -> str:
-    try:
-        if isinstance(val, (dict, list)):
-            return json.dumps(val, ensure_ascii=False)
-        return str(val)
-    except Exception:
-        return str(val)
+def parse_date(text: str) -> str:
+    span = parse_date_range(text)
+    return (span[0] if span else datetime.now(JST).date()).isoformat()
 
 # ===== データ読み込み（./data/*.json）=====
-def load_all_jsons(data_dir: str = "./data") -> Dict[str, Any]:
-    store: Dict[str, Any] = {}
-    for path in glob.glob(os.path.join(data_dir, "*.json")):
-        name = os.path.splitext(os.path.basename(path))[0]
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                store[name] = json.load(f)
-        except Exception as e:
-            logging.warning(f"Failed to load {path}: {e}")
-    return store
-
-DATA = load_all_jsons()
-CAL = DATA.get("academic_calendar", {"events": []})
-
-# ---- 教員: faculty形式 or 日本語配列の両対応（名前/所属/memo に正規化）----
-_raw_teachers = DATA.get("ryukyu_office_hours", [])
-TEACHERS: List[dict] = []
-if isinstance(_raw_teachers, list):
-    TEACHERS = _raw_teachers
-elif isinstance(_raw_teachers, dict) and isinstance(_raw_teachers.get("faculty"), list):
-    for fac in _raw_teachers["faculty"]:
-        name = fac.get("name_ja") or fac.get("name") or fac.get("name_en") or ""
-        dept = fac.get("department") or ""
-        ohs = fac.get("office_hours", [])
-        if isinstance(ohs, list) and ohs:
-            memo = " / ".join(
-                f"{o.get('weekday','')} {o.get('start','')}-{o.get('end','')}"
-                for o in ohs
-            )
-        else:
-            memo = fac.get("memo", "（情報なし）")
-        TEACHERS.append({"名前": name, "所属": dept, "memo": memo})
+# データセット（ファイル名）ごとの派生構造。ファイルが無い時は raw=None で呼ばれる
+def build_calendar(raw: Any) -> Dict[str, Any]:
+    cal = raw if isinstance(raw, dict) else {"events": []}
+    # 学年暦イベントは start/end を date に正規化して区間木へ
+    return {"cal": cal, "cal_index": CalendarIndex(cal.get("events", []), tagger=tag_title)}
+
+def normalize_teachers(raw: Any) -> TeacherTable:
+    """教員: faculty形式 or 日本語配列の両対応（名前/所属/memo に正規化し、列指向の表にする）"""
+    teachers: List[dict] = []
+    if isinstance(raw, list):
+        teachers = raw
+    elif isinstance(raw, dict) and isinstance(raw.get("faculty"), list):
+        for fac in raw["faculty"]:
+            name = fac.get("name_ja") or fac.get("name") or fac.get("name_en") or ""
+            dept = fac.get("department") or ""
+            ohs = fac.get("office_hours", [])
+            if isinstance(ohs, list) and ohs:
+                memo = " / ".join(
+                    f"{o.get('weekday','')} {o.get('start','')}-{o.get('end','')}"
+                    for o in ohs
+                )
+            else:
+                memo = fac.get("memo", "（情報なし）")
+            teachers.append({"名前": name, "所属": dept, "memo": memo})
+    return TeacherTable(teachers)
+
+def build_teachers(raw: Any) -> Dict[str, Any]:
+    teachers = normalize_teachers(raw)
+    # memo を曜日×時刻スロットに構造化（「今会える先生」用）
+    office_hours = OfficeHoursIndex(teachers)
+    st = office_hours.stats()
+    logging.info(f"office hours: parsed {st.get('parsed', 0)}/{st['total']}, unparsed {st.get('unparsed', 0)}")
+    return {
+        "teachers": teachers,
+        # 氏名の Aho–Corasick ＋ n-gram インデックス
+        "teacher_index": TeacherIndex(teachers),
+        "office_hours": office_hours,
+        # 元の dict の配列は捨て、全文検索もこの表の上で作る
+        "raw": teachers,
+    }
 
-CLUBS: List[dict] = DATA.get("clubs", []) or []
+def build_clubs(raw: Any) -> Dict[str, Any]:
+    clubs = ClubTable(raw if isinstance(raw, list) else [])
+    # 名称・概要などの BM25F 統計と同義語タグをロード時に前計算
+    return {"clubs": clubs, "club_index": ClubIndex(clubs), "raw": clubs}
+
+DATA_DIR = os.getenv("DATA_DIR", "./data")
+# 変更監視の間隔（秒）。0 で無効
+DATA_WATCH_INTERVAL = float(os.getenv("DATA_WATCH_INTERVAL", "2"))
+# data_process/compile.py が書くスナップショット。空文字で使わない（常に JSON から作る）
+DATA_SNAPSHOT = os.getenv("DATA_SNAPSHOT", os.path.join(DATA_DIR, "snapshot.bin"))
+# local : 各プロセスが JSON から作る（スナップショットは中身が同じデータセットだけ使う）
+# follow: 複数ワーカー用。親の `compile.py --watch` が公開するスナップショットだけを読む
+DATA_MODE = os.getenv("DATA_MODE", "local")
+# 起動時（lifespan）に裏で全データセットを作っておくか。0 なら各データセットは最初に使われた時に作る
+DATA_WARMUP = os.getenv("DATA_WARMUP", "1") == "1"
+# 派生構造を作るコード。どれかが変わったら既存のスナップショットは使わない
+SNAPSHOT_FINGERPRINT = code_fingerprint(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py")))
+# スナップショットの各セクションの HMAC 鍵（unpickle する前に照合する）。データとは別に置くこと:
+# DATA_SNAPSHOT_KEY（文字列）か、DATA_SNAPSHOT_KEY_FILE の中身。鍵ファイルは compile.py が無ければ作る（0600）
+DATA_SNAPSHOT_KEY_FILE = os.getenv("DATA_SNAPSHOT_KEY_FILE",
+                                   os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshot.key"))
+SNAPSHOT_KEY = os.getenv("DATA_SNAPSHOT_KEY", "").encode() or read_key(DATA_SNAPSHOT_KEY_FILE)
+
+# 全データセットの派生構造（＋全文検索用の n-gram 索引）を版として保持し、更新時は丸ごと差し替える。
+# 各データセットは最初に使われた時に作る（import 時は mtime を見るだけ）
+STORE = DataStore(
+    DATA_DIR,
+    {
+        "academic_calendar": build_calendar,
+        "ryukyu_office_hours": build_teachers,
+        "clubs": build_clubs,
+    },
+    snapshot=Snapshot(DATA_SNAPSHOT, SNAPSHOT_FINGERPRINT, SNAPSHOT_KEY) if DATA_SNAPSHOT else None,
+    follow=DATA_MODE == "follow",
+    # v.teachers などを読んだ時に、そのデータセットだけを作るための対応表
+    provides={
+        "academic_calendar": ("cal", "cal_index"),
+        "ryukyu_office_hours": ("teachers", "teacher_index", "office_hours"),
+        "clubs": ("clubs", "club_index"),
+    },
+)
+STORE.reload()
+
+# ===== HTTP クライアント（lifespan で開閉。OpenAI と open-meteo で共用）=====
+_async_client: Optional["httpx.AsyncClient"] = None
+
+def open_async_client() -> None:
+    global _async_client
+    if httpx is None or _async_client is not None:
+        return
+    _async_client = httpx.AsyncClient(
+        http2=OPENAI_HTTP2 and HAS_H2,
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        timeout=12,
+    )
+    logging.info(f"OpenAI AsyncClient opened (http2={OPENAI_HTTP2 and HAS_H2}, max_connections={OPENAI_MAX_CONNECTIONS})")
+
+async def close_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+# ===== LLM プロバイダ（タスクごとに選択）=====
+OLLAMA_URL             = os.getenv("OLLAMA_URL", "http://localhost:11434")
+OLLAMA_MODEL           = os.getenv("OLLAMA_MODEL", "mistral")
+OLLAMA_KEEP_ALIVE      = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4"))
+
+PROVIDERS: Dict[str, LLMProvider] = {
+    "openai": OpenAIProvider(OPENAI_API_KEY, OPENAI_MODEL, OPENAI_URL, client=lambda: _async_client),
+    "ollama": OllamaProvider(OLLAMA_URL, OLLAMA_MODEL, OLLAMA_KEEP_ALIVE, OLLAMA_MAX_CONCURRENCY),
+}
 
-# ===== ChatGPTユーティリティ =====
-def call_openai(messages: List[Dict[str, str]], timeout: int = 12) -> str:
-    """OpenAI Responses APIを叩いてテキストを返す（httpxが無ければrequests）"""
-    if not OPENAI_API_KEY:
-        return ""
-    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}"}
-    payload = {"model": OPENAI_MODEL, "input": messages, "store": False}
-    url = "https://api.openai.com/v1/responses"
-    try:
-        if httpx is not None:
-            with httpx.Client(timeout=timeout) as client:
-                r = client.post(url, headers=headers, json=payload)
-                r.raise_for_status()
-                data = r.json()
-        else:
-            r = requests.post(url, headers=headers, json=payload, timeout=timeout)
-            r.raise_for_status()
-            data = r.json()
-
-        for item in data.get("output", []):
-            if item.get("type") == "message":
-                cont = item.get("content") or []
-                if cont and isinstance(cont, list):
-                    first = cont[0]
-                    if first.get("type") == "output_text":
-                        return (first.get("text") or "").strip()
-            if item.get("type") == "output_text":
-                return (item.get("text") or "").strip()
-        return (data.get("text") or "").strip()
-    except Exception as e:
-        logging.warning(f"OpenAI error: {e}")
+# タスク → (プロバイダ名, モデル上書き)
+# 例: LLM_CLASSIFY_PROVIDER=ollama LLM_CLASSIFY_MODEL=qwen2.5:1.5b（分類はローカル、回答はクラウド）
+LLM_TASKS: Dict[str, Tuple[str, Optional[str]]] = {
+    "classify": (os.getenv("LLM_CLASSIFY_PROVIDER", "openai"), os.getenv("LLM_CLASSIFY_MODEL") or None),
+    "answer":   (os.getenv("LLM_ANSWER_PROVIDER", "openai"), os.getenv("LLM_ANSWER_MODEL") or None),
+}
+for _task, (_name, _) in LLM_TASKS.items():
+    if _name not in PROVIDERS:
+        logging.warning(f"unknown LLM provider for {_task}: {_name!r} (falling back to openai)")
+
+# プロバイダ名 → 受付制御（Ollama は OllamaProvider の同時実行数の上限で待たせるので対象外）
+ADMISSION: Dict[str, Admission] = {
+    "openai": Admission(OPENAI_MAX_IN_FLIGHT, OPENAI_QUEUE_SIZE, OPENAI_QUEUE_TIMEOUT, OPENAI_RPM, OPENAI_TPM),
+}
+
+def llm_admission(provider: LLMProvider, messages: List[Dict[str, str]]):
+    """async with で使う。as で受けた値が False なら断られた（呼ばずに空で返す）"""
+    adm = ADMISSION.get(provider.name)
+    if adm is None:
+        return nullcontext(True)
+    tokens = sum(estimate_tokens(m.get("content") or "") for m in messages) + OPENAI_EST_OUTPUT_TOKENS
+    return adm.admit(tokens)
+
+REGISTRY.append(Sampled(
+    "llm_queue_depth", "LLM calls waiting for admission.", "gauge", ("provider",),
+    lambda: [((n,), a.queued) for n, a in ADMISSION.items()],
+))
+REGISTRY.append(Sampled(
+    "llm_in_flight", "LLM calls admitted and not yet finished.", "gauge", ("provider",),
+    lambda: [((n,), a.in_flight) for n, a in ADMISSION.items()],
+))
+REGISTRY.append(Sampled(
+    "llm_shed_total", "LLM calls refused by admission control (answered by local search instead).", "counter",
+    ("provider", "reason"),
+    lambda: [((n, r), a.counters[f"shed_{r}"]) for n, a in ADMISSION.items() for r in SHED_REASONS],
+))
+
+def llm_for(task: str) -> Tuple[LLMProvider, Optional[str]]:
+    name, model = LLM_TASKS[task]
+    return PROVIDERS.get(name, PROVIDERS["openai"]), model
+
+# 実行中の同じ呼び出し（プロバイダ・モデル・メッセージが同じ）は上流 1 本に相乗りさせる。
+# 告知の直後に同じ質問が一斉に来ても、分類・回答とも LLM を叩くのは先頭の1回だけになる
+LLM_FLIGHT = SingleFlight()
+REGISTRY.append(Sampled(
+    "llm_coalesced_total", "LLM calls that shared an identical in-flight call instead of going upstream.", "counter", (),
+    lambda: [((), LLM_FLIGHT.coalesced)],
+))
+
+def llm_flight_key(provider: LLMProvider, model: Optional[str], messages: List[Dict[str, str]]) -> Tuple[Any, ...]:
+    """相乗りのキー。メッセージは前後・連続する空白の違いを無視する"""
+    return (provider.name, model or getattr(provider, "model", ""),
+            tuple((m.get("role", ""), " ".join((m.get("content") or "").split())) for m in messages))
+
+async def acall_llm(task: str, messages: List[Dict[str, str]], timeout: int = 12) -> str:
+    provider, model = llm_for(task)
+    if not provider.available():
         return ""
 
+    async def call() -> str:
+        async with llm_admission(provider, messages) as admitted:
+            return await provider.acomplete(messages, timeout, model) if admitted else ""
+
+    # 後から来た呼び出しは先頭の結果（例外ならその例外）をそのまま受け取る。受付制御を通るのも先頭だけ
+    return await LLM_FLIGHT.do(llm_flight_key(provider, model, messages), call)
+
+async def astream_llm(task: str, messages: List[Dict[str, str]], timeout: int = 12) -> AsyncIterator[str]:
+    provider, model = llm_for(task)
+    async with llm_admission(provider, messages) as admitted:
+        if admitted:
+            async for delta in provider.astream(messages, timeout, model):
+                yield delta
+
 # ===== ツール分類 =====
-def classify_tool(user_text: str) -> str:
-    # まずはOpenAIで分類（あれば）
-    if OPENAI_API_KEY:
-        sys = (
-            "あなたは大学に関する質問を分類します。"
-            "必ずJSONのみを返してください。"
-            ' 出力例: {"tool":"teacher"}'
-            ' 候補: ["calendar","teacher","clubs","weather","data_qa","other"]'
-        )
-        out = call_openai(
-            [{"role": "system", "content": sys},
-             {"role": "user", "content": user_text}],
-            timeout=8,
-        )
-        if out:
-            try:
-                tool = json.loads(out).get("tool")
-                if tool in {"calendar","teacher","clubs","weather","data_qa","other"}:
-                    return tool
-            except Exception:
-                pass
-
-    # ---- 正規表現フォールバック（休暇＆授業ワードを強化）----
-    if re.search(r"(夏休み|冬休み|春休み|休業|休暇|祝日|連休|学事暦|スケジュール)", user_text):
-        return "calendar"
-    if re.search(r"(授業開始|授業再開|授業終了|開講|閉講|授業|休講|試験|成績|学期|カレンダー|学年暦|Q[1-4１-４])", user_text):
-        return "calendar"
-    if re.search(r"(先生|教授|オフィスアワー|研究室)", user_text):
-        return "teacher"
-    if re.search(r"(サークル|部活|クラブ|同好会|団体|部員)", user_text):
-        return "clubs"
-    if "天気" in user_text:
-        return "weather"
-    return "data_qa"
+TOOLS = {"calendar","teacher","clubs","weather","data_qa","other"}
+# LLM を使わずローカルで答える tool（run_local_tool）
+LOCAL_TOOLS = {"calendar","teacher","clubs","weather"}
+
+CLASSIFY_SYSTEM = (
+    "あなたは大学に関する質問を分類します。"
+    "必ずJSONのみを返してください。"
+    ' 出力例: {"tool":"teacher"}'
+    ' 候補: ["calendar","teacher","clubs","weather","data_qa","other"]'
+)
+
+def _parse_tool(out: str) -> Optional[str]:
+    if out:
+        try:
+            tool = json.loads(out).get("tool")
+            if tool in TOOLS:
+                return tool
+        except Exception:
+            pass
+    return None
+
+def classify_by_rules(user_text: str) -> str:
+    # ---- キーワード表による単一走査のフォールバック（intents.QUERY_TABLE）----
+    return match_intent(user_text).tool
+
+# LLM分類結果のキャッシュ（正規化した質問文 → tool）。ヒット時はLLMを呼ばない
+CLASSIFY_CACHE = TTLCache(
+    maxsize=int(os.getenv("CLASSIFY_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("CLASSIFY_CACHE_TTL", "21600")),
+)
+
+async def aclassify_tool(user_text: str) -> str:
+    """LLM で分類（結果はキャッシュ）。使えない・失敗した時はルール判定"""
+    with stage("classify") as st:
+        if llm_for("classify")[0].available():
+            key = normalize_query(user_text)
+            tool = CLASSIFY_CACHE.get(key)
+            if tool:
+                st.tool = tool
+                return tool
+            out = await acall_llm(
+                "classify",
+                [{"role": "system", "content": CLASSIFY_SYSTEM},
+                 {"role": "user", "content": user_text}],
+                timeout=8,
+            )
+            tool = _parse_tool(out)
+            if tool:
+                # LLMが失敗してルール判定に落ちた場合はキャッシュしない
+                CLASSIFY_CACHE.set(key, tool)
+                st.tool = tool
+                return tool
+        # ルール判定（キー未設定・LLM 失敗時）
+        st.tool = classify_by_rules(user_text)
+        st.outcome = st.outcome or "fallback"
+        return st.tool
 
 # ===== カレンダー検索（キーワード優先 → 日付ヒット）=====
+Z2H_DIGITS = str.maketrans("０１２３４５６７８９", "0123456789")
+
+def calendar_query(text: str, today: date) -> Tuple[Any, ...]:
+    """find_calendar の答えを決める要素（解釈した期間＋意図）。応答キャッシュのキーに使う"""
+    norm_text = text.translate(Z2H_DIGITS)
+    it = match_intent(norm_text)
+    return (parse_date_span(norm_text, today) or today,
+            it.season, it.vacation, it.class_start, it.class_end, it.term_front, it.term_back, it.quarter)
+
 def find_calendar(text: str) -> str:
-    events = CAL.get("events", [])
-    if not isinstance(events, list):
+    v = STORE.current
+    if not isinstance(v.cal.get("events", []), list):
         return "学年暦データの形式が不正です。"
+    events = v.cal_index.events
 
     # 正規化（全角数字→半角）
-    z2h = str.maketrans("０１２３４５６７８９", "0123456789")
-    norm_text = text.translate(z2h)
-
-    def fmt_line(title: str, s: str, ed: str) -> str:
-        if s and ed and ed != s:
-            return f"- {title}: {s} ～ {ed}"
-        elif s:
-            return f"- {title}: {s}"
-        return f"- {title}"
-
-    # 1) 休暇系キーワード
-    kw_map = {
-        "夏": ["夏季休業", "夏休み"],
-        "冬": ["冬季休業", "冬休み"],
-        "春": ["春季休業", "春休み"],
-    }
-    season = None
-    if re.search(r"夏", norm_text): season = "夏"
-    elif re.search(r"冬", norm_text): season = "冬"
-    elif re.search(r"春", norm_text): season = "春"
-
-    if season or re.search(r"(休業|休暇|休み)", norm_text):
-        keys = kw_map.get(season, None)
-        hits = []
-        for e in events:
-            title = e.get("title", "")
-            if (keys and any(k in title for k in keys)) or (not keys and re.search(r"(休業|休暇|休み)", title)):
-                s = e.get("date") or e.get("date_start")
-                ed = e.get("end")  or e.get("date_end") or s
-                hits.append((title, s, ed))
+    norm_text = text.translate(Z2H_DIGITS)
+    # 季節・休業・授業開始/終了・学期・クォーターを1回の走査で取り出す
+    it = match_intent(norm_text)
+
+    # 質問に期間（今週・来月・10月 など）があればキーワード検索もその期間に絞る
+    span = parse_date_range(norm_text)
+    if span:
+        events = v.cal_index.overlapping(*span)
+
+    def fmt_line(e) -> str:
+        if e.end != e.start:
+            return f"- {e.title}: {e.start_iso} ～ {e.end_iso}"
+        return f"- {e.title}: {e.start_iso}"
+
+    # 1) 休暇系キーワード（タイトルのタグはロード時に付与済み）
+    if it.season or it.vacation:
+        want = f"season:{it.season}" if it.season else "vacation"
+        hits = [e for e in events if want in e.tags]
         if hits:
-            head = f"📅 {season+'休み' if season else '休暇関連'}イベント:"
-            return "\n".join([head] + [fmt_line(t, s, ed) for (t, s, ed) in hits])
-
-    # 2) 授業開始/終了・開講/閉講 のキーワード検索
-    kw_start = re.search(r"(授業開始|授業再開|開講)", norm_text)
-    kw_end   = re.search(r"(授業終了|閉講)", norm_text)
-
-    # 学期やクォーターの条件抽出
-    want_front = bool(re.search(r"(前学期|前期)", norm_text))
-    want_back  = bool(re.search(r"(後学期|後期)", norm_text))
-    m_q = re.search(r"第\s*([1-4])\s*クォーター", norm_text)
-    want_q = m_q.group(1) if m_q else None  # "1".."4"
-
-    def match_term_filters(title: str) -> bool:
-        # 前学期⇔第1/2Q、後学期⇔第3/4Q のゆるい対応
-        if want_q and (f"第{want_q}クォーター" not in title):
+            head = f"📅 {it.season+'休み' if it.season else '休暇関連'}イベント:"
+            return "\n".join([head] + [fmt_line(e) for e in hits])
+
+    # 2) 授業開始/終了・開講/閉講 ＋ 学期やクォーターの条件
+    def match_term_filters(tags) -> bool:
+        # 前学期⇔第1/2Q、後学期⇔第3/4Q のゆるい対応（tag_title で term:* を付与済み）
+        if it.quarter and f"q:{it.quarter}" not in tags:
             return False
-        if want_front and not (("前学期" in title) or ("第1クォーター" in title) or ("第2クォーター" in title)):
+        if it.term_front and "term:front" not in tags:
             return False
-        if want_back and not (("後学期" in title) or ("第3クォーター" in title) or ("第4クォーター" in title)):
+        if it.term_back and "term:back" not in tags:
             return False
         return True
 
-    if kw_start or kw_end:
-        hits = []
-        for e in events:
-            title = e.get("title", "")
-            if kw_start and re.search(r"(授業開始|授業再開|開講)", title):
-                if match_term_filters(title):
-                    s = e.get("date") or e.get("date_start")
-                    ed = e.get("end")  or e.get("date_end") or s
-                    hits.append((title, s, ed))
-            elif kw_end and re.search(r"(授業終了|閉講)", title):
-                if match_term_filters(title):
-                    s = e.get("date") or e.get("date_start")
-                    ed = e.get("end")  or e.get("date_end") or s
-                    hits.append((title, s, ed))
+    if it.class_start or it.class_end:
+        hits = [
+            e for e in events
+            if ((it.class_start and "start" in e.tags) or (it.class_end and "end" in e.tags))
+            and match_term_filters(e.tags)
+        ]
         if hits:
             head = "📅 授業スケジュール:"
-            return "\n".join([head] + [fmt_line(t, s, ed) for (t, s, ed) in hits])
-
-    # 3) 日付でのヒット（「今日/明日/YYYY-MM-DD」など）
-    target = parse_date(norm_text)
-    day_hits = []
-    for e in events:
-        s = e.get("date") or e.get("date_start")
-        ed = e.get("end")  or e.get("date_end") or s
-        if s and ed and s <= target <= ed:
-            day_hits.append(e.get("title", "(無題)"))
+            return "\n".join([head] + [fmt_line(e) for e in hits])
+
+    # 3) 日付でのヒット（「今日/明日/YYYY-MM-DD/今週/来月/10月」など）
+    lo, hi = span or (datetime.now(JST).date(),) * 2
+    label = lo.isoformat() if lo == hi else f"{lo.isoformat()} ～ {hi.isoformat()}"
+    day_hits = events if span else v.cal_index.at(lo)
     if not day_hits:
-        return f"📅 {target} に該当イベントはありません。"
-    return "📅 " + target + " の主なイベント:\n" + "\n".join(f"- {h}" for h in day_hits)
+        return f"📅 {label} に該当イベントはありません。"
+    if lo == hi:
+        return "📅 " + label + " の主なイベント:\n" + "\n".join(f"- {e.title}" for e in day_hits)
+    return "📅 " + label + " の主なイベント:\n" + "\n".join(fmt_line(e) for e in day_hits)
 
 # ===== 教員検索 =====
 NAME_JA_RE = re.compile(r"[一-龥々〆ヵヶぁ-んァ-ヴーA-Za-z・\s]+")
 CUT_TAIL_RE = re.compile(r"(の.*|に?ついて.*|って.*|とは.*|は\??|を\??|に\??|で\??|、.*|。.*)$")
 
-def find_teacher(text: str) -> str:
-    if not TEACHERS:
-        return "教員データが読み込まれていません。/admin/debug-data を確認してください。"
-
+def match_teachers(v: Any, text: str) -> Tuple[str, List[Teacher]]:
+    """質問文から (氏名の断片, 該当する先生)。断片が取れなければ ("", [])"""
     # 敬称除去 → 文末ノイズ除去 → 氏名断片抽出
     t = re.sub(r"(先生|教授|さん|氏|様)", "", text)
     t = CUT_TAIL_RE.sub("", t)
     m = NAME_JA_RE.search(t)
     key = (m.group(0).strip() if m else "")[:20]
+    if not key:
+        return "", []
+    # 完全一致優先 → 部分一致
+    return key, v.teacher_index.names_in(text) or v.teacher_index.contains(key)
+
+def memo_text(t: Teacher) -> str:
+    """表示用の memo。元データに memo が無い先生は「情報なし」"""
+    return t.memo if t.has("memo") else "情報なし"
 
+def find_teacher(text: str) -> str:
+    v = STORE.current
+    if not v.teachers:
+        return "教員データが読み込まれていません。/admin/debug-data を確認してください。"
+
+    key, matches = match_teachers(v, text)
     if not key:
         return "先生のお名前を含めて聞いてください（例：井上先生のオフィスアワーは？）。"
 
-    # 完全一致優先 → 部分一致
-    matches = [x for x in TEACHERS if x.get("名前") and x["名前"] in text]
+    # 氏名が無く「会える」「空いて」などと曜日・時限・「今」がある → 空き時間の問い合わせ
     if not matches:
-        matches = [x for x in TEACHERS if key in (x.get("名前") or "")]
+        q = parse_availability_query(text, datetime.now(JST))
+        if q:
+            return find_available_teachers(v.office_hours, *q)
 
     if not matches:
-        # 候補トップ5（頭文字ざっくり）
-        cands = [x.get("名前") for x in TEACHERS if key and key[0] in (x.get("名前") or "")]
-        cands = [c for c in cands if c]
-        seen, top = set(), []
-        for c in cands:
-            if c not in seen:
-                seen.add(c); top.append(c)
-            if len(top) >= 5: break
+        # 候補トップ5（共有する文字・2-gram の多い順）
+        top = v.teacher_index.candidates(key)
         if top:
             return f"「{key}」に一致する先生は見つかりませんでした。\n候補: " + " / ".join(top)
         return f"「{key}」に一致する先生の情報は見つかりませんでした。"
 
     if len(matches) == 1:
         t = matches[0]
-        return f"{t.get('所属','')}の{t.get('名前','')}先生のオフィスアワー：{t.get('memo','情報なし')}"
+        return f"{t.dept}の{t.name}先生のオフィスアワー：{memo_text(t)}"
 
     lines = ["複数の先生が見つかりました："]
     for t in matches[:20]:
-        lines.append(f"- {t.get('所属','')} {t.get('名前','')}：{t.get('memo','情報なし')}")
+        lines.append(f"- {t.dept} {t.name}：{memo_text(t)}")
     if len(matches) > 20:
         lines.append(f"...ほか {len(matches)-20} 件")
     return "\n".join(lines)
 
-# ===== サークル検索（強化版）=====
-_CLUB_STOPWORDS = re.compile(r"(琉球大学|琉大|大学|全学|部|クラブ|サークル|同好会|チーム|部活|・|－|-|ー|＿|‐|—|―|\s+)")
-
-def _norm_club(s: str) -> str:
-    s = s or ""
-    s = s.lower()
-    s = _CLUB_STOPWORDS.sub("", s)
-    return s
-
-def _tokenize(s: str) -> List[str]:
-    return [w for w in re.findall(r"[一-龥ぁ-んァ-ヴーa-z0-9]+", s.lower()) if w]
-
-# 種目→キーワードのマッピング（必要に応じて拡張）
-SPORT_KEYWORDS = {
-    "サッカー": ["サッカー", "soccer", "フットボール", "フットサル"],
-    "テニス": ["テニス", "tennis", "庭球"],
-    "バスケ": ["バスケ", "バスケット", "basketball", "3×3", "3x3"],
-    "バレー": ["バレー", "バレーボール", "volleyball"],
-    "野球": ["野球", "ベースボール", "baseball"],
-    "ラグビー": ["ラグビー", "rugby"],
-}
+def find_available_teachers(office_hours: OfficeHoursIndex, weekday: int, start: int, end: int, dept: str = "") -> str:
+    label = f"{WEEKDAYS[weekday]}曜 {start // 60}:{start % 60:02d}"
+    if end - start > 1:
+        label += f"-{end // 60}:{end % 60:02d}"
+    if dept:
+        label += f"（{dept}）"
+    hits = office_hours.available(weekday, start, end, dept)
+    if not hits:
+        return f"🕒 {label} にオフィスアワーを設定している先生は見つかりませんでした。"
+    lines = [f"🕒 {label} にオフィスアワーの先生（{len(hits)}件）:"]
+    for t, sl in hits[:20]:
+        lines.append(f"- {t.dept} {t.name}：{memo_text(t)}")
+    if len(hits) > 20:
+        lines.append(f"...ほか {len(hits)-20} 件")
+    return "\n".join(lines)
 
+# ===== サークル検索（BM25F ＋ 同義語。索引は club_index.ClubIndex、ロード時に構築）=====
 def find_club(text: str) -> str:
     """
     自然文に対応したサークル/部活検索。
-    - 曖昧一致（名称の正規化 & トークン照合）
-    - 種目キーワード（例: サッカー→サッカー/フットサル/フットボール）
+    - 名称・概要・活動日・場所の BM25F ＋ 正規化名称の相互包含
+    - 同義語（例: サッカー→サッカー/フットサル/フットボール、音楽→ジャズ/吹奏楽/アカペラ…）
     - 一覧質問（どんな部活/サークルがある？）に簡易対応
     """
-    if not CLUBS:
+    v = STORE.current
+    clubs = v.clubs
+    if not clubs:
         return "サークル・部活データが読み込まれていません。"
 
-    q_raw = text
-    q = q_raw.lower()
-    q_norm = _norm_club(q_raw)
-    q_tokens = _tokenize(q_raw)
+    q = text.lower()
 
     # 一覧系の質問
     if re.search(r"(どんな|一覧|全部|全て|なにが|何が).*(部|クラブ|サークル)", q) or q.strip() in {"部活","サークル","クラブ"}:
-        names = [c.get("name") for c in CLUBS if c.get("name")]
+        names = [n for n in clubs.cols["name"] if n]
         if not names:
             return "サークル情報が空のようです。"
         head = f"🏷 サークル/部活の例（{min(len(names), 20)}件表示 / 全{len(names)}件）:"
         return "\n".join([head] + [f"- {n}" for n in names[:20]])
 
-    # 種目キーワード抽出（例: サッカー部ある？ → サッカー群を検索）
-    wanted_keywords = set()
-    for group, kws in SPORT_KEYWORDS.items():
-        if any(k.lower() in q for k in kws):
-            wanted_keywords.update([k.lower() for k in kws])
-
-    def score_item(it: dict) -> int:
-        s = 0
-        name = it.get("name") or ""
-        detail = it.get("detail") or ""
-        location = it.get("location") or ""
-        day = it.get("day") or ""
-        blob = (name + " " + detail + " " + location + " " + day).lower()
-
-        # 1) 正規化名称の相互包含（強）
-        nn = _norm_club(name)
-        if nn and (nn in q_norm or q_norm in nn):
-            s += 8
-
-        # 2) トークン一致（中）
-        s += sum(1 for t in q_tokens if t and t in blob)
-
-        # 3) 種目キーワード（強）
-        if wanted_keywords:
-            s += sum(2 for wk in wanted_keywords if wk in blob)
-
-        # 4) クエリが短い時の救済：代表語（部/クラブ/サークル）だけなら名前ヒント
-        if not q_tokens and ("部" in q or "クラブ" in q or "サークル" in q):
-            if "部" in name or "クラブ" in name or "サークル" in name:
-                s += 1
-
-        return s
-
-    scored = [(score_item(it), it) for it in CLUBS]
-    scored = [x for x in scored if x[0] > 0]
-    scored.sort(key=lambda x: x[0], reverse=True)
+    scored = v.club_index.search(text)
 
     if not scored:
         return "該当するサークル情報が見つかりませんでした。"
@@ -384,17 +507,17 @@ def find_club(text: str) -> str:
     # 上位を返す（最大3件）
     top = [it for (_, it) in scored[:3]]
 
-    def fmt(c: dict) -> str:
+    def fmt(c: Club) -> str:
         return (
-            f"🏷 {c.get('name','(名称不明)')}\n"
-            f"- 活動日: {c.get('day','未記載')}\n"
-            f"- 場所: {c.get('location','未記載')}\n"
-            f"{('- 概要: ' + c['detail']) if c.get('detail') else ''}"
-            f"{('\n- SNS: ' + c['sns']) if c.get('sns') else ''}"
+            f"🏷 {c.name or '(名称不明)'}\n"
+            f"- 活動日: {c.day or '未記載'}\n"
+            f"- 場所: {c.location or '未記載'}\n"
+            f"{('- 概要: ' + c.detail) if c.detail else ''}"
+            f"{('\n- SNS: ' + c.sns) if c.sns else ''}"
         ).rstrip()
 
     if len(scored) > 3:
-        alt_names = [it.get("name") for (_, it) in scored[3:8] if it.get("name")]
+        alt_names = [it.name for (_, it) in scored[3:8] if it.name]
         alt_line = "\nほかの候補: " + " / ".join(alt_names) if alt_names else ""
     else:
         alt_line = ""
@@ -402,49 +525,43 @@ def find_club(text: str) -> str:
     return "\n\n".join([fmt(c) for c in top]) + alt_line
 
 # ===== 天気 =====
-def get_weather(text: str) -> str:
+async def fetch_json(url: str, params: Dict[str, Any], timeout: int = 6) -> dict:
+    """常駐 AsyncClient で GET（無ければスレッドプールで requests）"""
+    with stage("open_meteo", "weather"):
+        if _async_client is not None:
+            r = await _async_client.get(url, params=params, timeout=timeout)
+            r.raise_for_status()
+            return r.json()
+        return await run_in_threadpool(lambda: requests.get(url, params=params, timeout=timeout).json())
+
+# 地名→座標は永続メモ化、現在の天気は地点ごとに TTL キャッシュ＋同時リクエストの集約
+WEATHER = WeatherService(
+    fetch_json,
+    ttl=float(os.getenv("WEATHER_TTL", "600")),
+    refresh_ahead=float(os.getenv("WEATHER_REFRESH_AHEAD", "120")),
+)
+
+async def get_weather(text: str) -> str:
     try:
         loc = "那覇"
         m = re.search(r"(札幌|仙台|東京|横浜|名古屋|京都|大阪|神戸|広島|福岡|那覇|沖縄)", text)
         if m: loc = m.group(1)
-        g = requests.get(
-            "https://geocoding-api.open-meteo.com/v1/search",
-            params={"name": loc, "count": 1, "language": "ja"},
-            timeout=6,
-        ).json()
-        if not g.get("results"):
+        coord = await WEATHER.locate(loc)
+        if coord is None:
             return f"{loc} の天気情報が見つかりませんでした。"
-        lat, lon = g["results"][0]["latitude"], g["results"][0]["longitude"]
-        f = requests.get(
-            "https://api.open-meteo.com/v1/forecast",
-            params={"latitude": lat, "longitude": lon, "current": "temperature_2m,weathercode"},
-            timeout=6,
-        ).json()
-        cur = f.get("current", {})
+        cur = await WEATHER.current(coord)
         t = cur.get("temperature_2m")
         if t is None:
             return f"{loc} の現在気温を取得できませんでした。"
         return f"{loc} の現在の気温は {t}℃ です。"
     except Exception as e:
+        fail(e)
         return f"天気情報の取得に失敗しました：{e}"
 
 # ===== ローカル全文検索 =====
 def search_data_any(user_text: str, topk=5) -> str:
     terms = [t for t in re.split(r"[^\w一-龥ぁ-んァ-ンー]+", user_text) if t]
-    hits = []
-    for fname, content in DATA.items():
-        if isinstance(content, list):
-            for idx, item in enumerate(content):
-                blob = stringify(item)
-                score = sum(1 for t in terms if t in blob)
-                if score:
-                    hits.append((score, fname, idx, item))
-        elif isinstance(content, dict):
-            blob = stringify(content)
-            score = sum(1 for t in terms if t in blob)
-            if score:
-                hits.append((score, fname, "", content))
-    hits.sort(key=lambda x: x[0], reverse=True)
+    hits = STORE.current.search_index.search(terms)
     if not hits:
         return "該当する情報は見つかりませんでした。"
     out = ["🔍 検索結果:"]
@@ -452,59 +569,419 @@ def search_data_any(user_text: str, topk=5) -> str:
         out.append(f"- {fn}[{idx}] ({sc}): {stringify(item)[:300]}")
     return "\n".join(out)
 
-# ===== APIルーティング =====
-@app.post("/api/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
-    text = req.content.strip()
-    # フロント指定カテゴリを優先
-    valid = {"calendar","teacher","clubs","weather","data_qa","other"}
-    tool = req.category if req.category in valid else classify_tool(text)
+# ===== アプリ本体（lifespan で HTTP クライアントとデータ監視を開閉）=====
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    open_async_client()
+    in_use = {llm_for(t)[0] for t in LLM_TASKS}
+    for provider in in_use:
+        await provider.open()
+    # ローカルモデルは起動直後に読み込んでおく（初回の分類が数秒待たされないように）
+    warmups = [
+        asyncio.create_task(provider.warm(model))
+        for provider, model in {llm_for(t) for t in LLM_TASKS} if isinstance(provider, OllamaProvider)
+    ]
+    if DATA_WARMUP:
+        STORE.start_warmup()
+    STORE.start_watching(DATA_WATCH_INTERVAL)
+    try:
+        yield
+    finally:
+        await run_in_threadpool(SESSIONS.close)
+        await STORE.stop_watching()
+        for w in warmups:
+            w.cancel()
+        for provider in in_use:
+            await provider.aclose()
+        await close_async_client()
+
+app = FastAPI(lifespan=lifespan)
 
+# ===== APIルーティング =====
+ANSWER_SYSTEM = "あなたは大学の自動応答アシスタントです。"
+ANSWER_RAG_SYSTEM = (
+    ANSWER_SYSTEM
+    + "次の資料に書かれている内容だけを根拠に、日本語で簡潔に答えてください。"
+    + "資料に無いことは推測せず「分かりません」と答えてください。\n資料:\n"
+)
+# 資料として渡すレコード数の上限と、資料部分のトークン予算（見積もり）
+RAG_TOP_K        = int(os.getenv("RAG_TOP_K", "8"))
+RAG_TOKEN_BUDGET = int(os.getenv("RAG_TOKEN_BUDGET", "600"))
+
+def retrieve_context(text: str) -> Tuple[str, List[Any], int]:
+    """BM25 で関連レコードを引き、トークン予算内の資料テキストにする"""
+    retriever = STORE.current.retriever
+    if retriever is None:
+        return "", [], 0
+    with stage("retrieve"):
+        return pack_context(retriever.search(text, RAG_TOP_K), RAG_TOKEN_BUDGET)
+
+def answer_messages(text: str, history: Optional[List[Dict[str, str]]] = None) -> List[Dict[str, str]]:
+    """history はセッションの履歴（Session.history でトークン予算内に切り詰め済み）"""
+    context, _, _ = retrieve_context(text)
+    system = ANSWER_RAG_SYSTEM + context if context else ANSWER_SYSTEM
+    return [{"role": "system", "content": system},
+            *(history or []),
+            {"role": "user", "content": text}]
+
+async def run_local_tool(tool: str, text: str) -> Optional[str]:
+    """ローカルで完結するツールの応答。LLM で答えるべき tool なら None"""
+    if tool not in LOCAL_TOOLS:
+        return None
+    with stage("tool", tool):
+        if tool == "calendar":
+            return find_calendar(text)
+        if tool == "teacher":
+            return find_teacher(text)
+        if tool == "clubs":
+            return find_club(text)
+        return await get_weather(text)
+
+async def answer_by_llm(tool: str, text: str, history: Optional[List[Dict[str, str]]] = None) -> Optional[str]:
+    """LLM で回答。失敗・空なら None（呼び出し側で全文検索にフォールバック）"""
+    with stage("answer", tool) as st:
+        out = await acall_llm("answer", answer_messages(text, history))
+        if not out:
+            st.outcome = st.outcome or "fallback"
+        return out or None
+
+# ---- 応答キャッシュ（tool × 正規化した質問文 × データ版 × JST日付）----
+# tool ごとの TTL（秒）。0 はキャッシュしない（天気は WeatherService 側で短期キャッシュ済み）
+RESPONSE_CACHE_TTLS: Dict[str, float] = {
+    "calendar": 21600, "teacher": 3600, "clubs": 3600, "weather": 0, "data_qa": 600, "other": 600,
+}
+# 上書き例: RESPONSE_CACHE_TTLS="teacher=600,data_qa=0"
+for _item in filter(None, os.getenv("RESPONSE_CACHE_TTLS", "").split(",")):
+    _tool, _, _sec = _item.partition("=")
+    if _tool.strip() in RESPONSE_CACHE_TTLS:
+        RESPONSE_CACHE_TTLS[_tool.strip()] = float(_sec)
+
+RESPONSE_CACHE = TTLCache(
+    maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "8192")),
+    maxbytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    sizeof=sys.getsizeof,
+)
+
+def _depends_on_today(text: str, today: date) -> bool:
+    """学年暦の答えが「今日」で変わるか（相対日付・年の無い月・日付指定なし＝今日のイベント）"""
+    span = parse_date_span(text, today)
+    return (span is None
+            or span != parse_date_span(text, today + timedelta(days=1))
+            or span != parse_date_span(text, today + timedelta(days=366)))
+
+def response_cache_key(tool: str, text: str) -> Optional[Tuple[Any, ...]]:
+    """
+    キャッシュしない tool なら None。日付依存の学年暦は JST の日付もキーに含める。
+    学年暦は質問文ではなく、解釈した期間と意図で引く（言い回しが違っても同じ答えなら同じキー）
+    """
+    if RESPONSE_CACHE_TTLS.get(tool, 0) <= 0:
+        return None
+    day = ""
     if tool == "calendar":
-        reply = find_calendar(text)
-    elif tool == "teacher":
-        reply = find_teacher(text)
+        today = datetime.now(JST).date()
+        if _depends_on_today(text, today):
+            day = today.isoformat()
+        return (tool, calendar_query(text, today), STORE.current.version, day)
+    return (tool, normalize_query(text), STORE.current.version, day)
+
+def response_cache_set(key: Tuple[Any, ...], reply: str) -> None:
+    ttl = RESPONSE_CACHE_TTLS[key[0]]
+    if key[3]:
+        # 日付をキーに含むものは JST の日付が変わるまで
+        now = datetime.now(JST)
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), JST)
+        ttl = min(ttl, (midnight - now).total_seconds())
+    RESPONSE_CACHE.set(key, reply, ttl)
+
+# ---- 会話セッション（sessions.py）----
+SESSION_MAX            = int(os.getenv("SESSION_MAX", "10000"))
+SESSION_TTL            = float(os.getenv("SESSION_TTL", "1800"))       # アイドル秒数
+SESSION_MAX_BYTES      = int(os.getenv("SESSION_MAX_BYTES", "16384"))   # 超えた古いターンは要約に畳む
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "400"))  # LLM に渡す履歴の予算（見積もり）
+# 追い出した／終了時に残っていたセッションの退避先（SQLite）。空なら退避しない
+SESSION_SPILL_PATH     = os.getenv("SESSION_SPILL_PATH", "")
+
+SESSIONS = SessionStore(SESSION_MAX, SESSION_TTL, SESSION_MAX_BYTES, SESSION_SPILL_PATH or None)
+
+# 直前に特定した先生・サークルを指す言い方（「その先生の研究室は？」「このサークルの活動日は？」）。
+# 後ろに助詞・句読点か文末が来る時だけ（「その方法」「この部屋」「その部分」「この教員免許」は指示語ではない）
+_REF_END = r"(?=[のはがにをもとへで、。,.？?！!\s]|$)"
+TEACHER_REF_RE = re.compile(rf"(その|この|あの|同じ)\s*(先生|教授|教員){_REF_END}")
+CLUB_REF_RE    = re.compile(rf"(その|この|あの|同じ)\s*(サークル|部活|部|クラブ|団体){_REF_END}")
+
+async def open_session(req: ChatRequest) -> Optional[Session]:
+    # 退避先（SQLite）からの復元・追い出しの書き込みはスレッドで
+    return await SESSIONS.aget(req.session_id) if req.session_id is not None else None
+
+def resolve_followup(session: Optional[Session], text: str) -> Optional[Tuple[str, str]]:
+    """指示語を覚えている名前に置き換えた (質問文, tool)。当てはまらなければ None"""
+    if session is None:
+        return None
+    ents = session.entities
+    if ents.get("teacher") and TEACHER_REF_RE.search(text):
+        return TEACHER_REF_RE.sub(f"{ents['teacher']}先生", text, count=1), "teacher"
+    if ents.get("club") and CLUB_REF_RE.search(text):
+        return CLUB_REF_RE.sub(ents["club"], text, count=1), "clubs"
+    return None
+
+def remember(session: Session, tool: str, text: str, asked: str, reply: str) -> None:
+    """1往復を履歴に足し、1件に絞れた先生・いちばん近いサークルを次の追質問用に覚える"""
+    v = STORE.current
+    if tool == "teacher":
+        _, matches = match_teachers(v, text)
+        if len(matches) == 1:
+            session.entities["teacher"] = matches[0].name
     elif tool == "clubs":
-        reply = find_club(text)
-    elif tool == "weather":
-        reply = get_weather(text)
+        top = v.club_index.search(text)[:1]
+        if top:
+            session.entities["club"] = top[0][1].name
+    SESSIONS.record(session, asked, reply)
+
+async def route(text: str, category: str, session: Optional[Session], gate: Any = nullcontext()) -> Tuple[str, str, List[Dict[str, str]]]:
+    """(質問文, tool, LLM に渡す履歴)。追質問は指示語を置き換えた質問文になる"""
+    followup = resolve_followup(session, text)
+    if followup is not None:
+        # 直前の先生・サークルについての追質問 → 分類せず、そのままローカルのツールで
+        text, tool = followup
+    elif category in TOOLS:
+        # フロント指定カテゴリを優先
+        tool = category
+    elif llm_for("classify")[0].available():
+        async with gate:
+            tool = await aclassify_tool(text)
     else:
-        out = call_openai(
-            [{"role": "system", "content": "あなたは大学の自動応答アシスタントです。"},
-             {"role": "user", "content": text}]
-        )
-        reply = out or search_data_any(text)
-    return ChatResponse(content=reply, timestamp=datetime.now(JST).isoformat(), category=req.category)
+        tool = await aclassify_tool(text)
+    history = session.history(SESSION_HISTORY_TOKENS) if session is not None and tool not in LOCAL_TOOLS else []
+    return text, tool, history
+
+async def respond(text: str, category: str, llm_gate: Optional[asyncio.Semaphore] = None,
+                  session: Optional[Session] = None) -> Tuple[str, str]:
+    """
+    1問分の (tool, 回答)。llm_gate を渡すと LLM を呼ぶ区間（分類・回答）だけその上限の中で実行する
+    （ローカルツールとキャッシュヒットは待たせない）。session を渡すと履歴を踏まえ、やり取りを記録する
+    """
+    gate = llm_gate or nullcontext()
+    # 以下のツール・検索・remember は STORE を同期で読むので、データは先にスレッドで作っておく
+    await STORE.aload()
+    q, tool, history = await route(text, category, session, gate)
+
+    # 履歴を踏まえた回答は会話ごとに違うのでキャッシュしない
+    key = None if history else response_cache_key(tool, q)
+    reply = RESPONSE_CACHE.get(key) if key else None
+    if reply is None:
+        reply = await run_local_tool(tool, q)
+        if reply is None:
+            async with gate:
+                reply = await answer_by_llm(tool, q, history)
+        if reply is None:
+            # LLM 失敗時の全文検索はキャッシュしない（復旧したら LLM の回答に戻す）
+            reply = search_data_any(q)
+        elif key:
+            response_cache_set(key, reply)
+    if session is not None:
+        remember(session, tool, q, text, reply)
+    return tool, reply
+
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest):
+    session = await open_session(req)
+    tool, reply = await respond(req.content.strip(), req.category, session=session)
+    set_tool(tool)
+    return ChatResponse(content=reply, timestamp=datetime.now(JST).isoformat(), category=req.category,
+                        session_id=session.id if session is not None else None)
+
+# ---- まとめて問い合わせ（FAQ の事前生成・クイックアクション）----
+# 1リクエストあたりの質問数の上限と、その中で同時に走らせる LLM 呼び出しの数
+CHAT_BATCH_MAX_ITEMS   = int(os.getenv("CHAT_BATCH_MAX_ITEMS", "100"))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+
+@app.post("/api/chat/batch")
+async def chat_batch(reqs: List[ChatRequest], ordered: bool = Query(True, description="false なら終わった順に返す")):
+    """
+    複数の質問を1回で。応答は NDJSON（1行 = {"index": 入力での位置, ...ChatResponse}、失敗時は {"index", "error"}）。
+    ordered=true は入力順（前の問いが終わるまで後ろの行は出さない）、false は終わった順。
+    session_id は見ない（1問ずつ独立に答える）。
+    """
+    if len(reqs) > CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(413, f"too many items: {len(reqs)} > {CHAT_BATCH_MAX_ITEMS}")
+    set_tool("batch")
+    gate = asyncio.Semaphore(max(1, CHAT_BATCH_CONCURRENCY))
+
+    async def one(i: int, req: ChatRequest) -> Tuple[int, str]:
+        try:
+            _, reply = await respond(req.content.strip(), req.category, gate)
+            row: Dict[str, Any] = {
+                "index": i,
+                **ChatResponse(content=reply, timestamp=datetime.now(JST).isoformat(), category=req.category).model_dump(),
+            }
+        except Exception as e:
+            logging.warning(f"batch item {i} failed: {e}")
+            row = {"index": i, "error": str(e)}
+        return i, json.dumps(row, ensure_ascii=False) + "\n"
+
+    async def lines() -> AsyncIterator[str]:
+        tasks = [asyncio.create_task(one(i, r)) for i, r in enumerate(reqs)]
+        try:
+            for fut in (tasks if ordered else asyncio.as_completed(tasks)):
+                _, line = await fut
+                yield line
+        finally:
+            # クライアントが切断したら残りは止める
+            for t in tasks:
+                t.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    /api/chat のストリーミング版（Server-Sent Events）。
+    - event: delta … {"content": "<差分テキスト>"}（LLM 経路のみ・複数回）
+    - event: done  … ChatResponse と同じ形（content は全文）。ローカルツールはこの1件のみ
+    """
+    text = req.content.strip()
+    session = await open_session(req)
+
+    async def events() -> AsyncIterator[str]:
+        await STORE.aload()
+        q, tool, history = await route(text, req.category, session)
+        set_tool(tool)
+        key = None if history else response_cache_key(tool, q)
+        reply = RESPONSE_CACHE.get(key) if key else None
+        if reply is None:
+            reply = await run_local_tool(tool, q)
+            if reply is None:
+                parts: List[str] = []
+                with stage("answer", tool) as st:
+                    async for delta in astream_llm("answer", answer_messages(q, history)):
+                        parts.append(delta)
+                        yield _sse("delta", {"content": delta})
+                    reply = "".join(parts).strip()
+                    if not reply:
+                        st.outcome = st.outcome or "fallback"
+            if not reply:
+                reply = search_data_any(q)
+            elif key:
+                response_cache_set(key, reply)
+        if session is not None:
+            remember(session, tool, q, text, reply)
+        done = ChatResponse(content=reply, timestamp=datetime.now(JST).isoformat(), category=req.category,
+                            session_id=session.id if session is not None else None)
+        yield _sse("done", done.model_dump())
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # ===== 管理系エンドポイント =====
 @app.get("/admin/debug-data")
 def debug_data():
+    v = STORE.current
     return {
         "cwd": os.getcwd(),
-        "loaded_keys": list(DATA.keys()),
-        "teachers_count": len(TEACHERS),
-        "clubs_count": len(CLUBS),
-        "calendar_events": len(CAL.get("events", []))
+        "data_version": v.version,
+        "loaded_keys": list(v.data.keys()),
+        "teachers_count": len(v.teachers),
+        "clubs_count": len(v.clubs),
+        "calendar_events": len(v.cal.get("events", [])),
+        "office_hours": v.office_hours.stats(),
+        "datasets": STORE.info()["datasets"],
+        "response_cache": {**RESPONSE_CACHE.stats(), "ttl_by_tool": RESPONSE_CACHE_TTLS},
     }
 
+@app.post("/admin/reload")
+async def admin_reload(force: bool = Query(False, description="変更が無くても全データセットを作り直す")):
+    # 再構築はスレッドプールで。完了後に新しい版へ差し替わる
+    return await run_in_threadpool(STORE.reload, force)
+
 @app.get("/admin/teachers")
 def admin_teachers(like: str = Query("", description="部分一致する氏名を検索")):
-    if not TEACHERS:
+    v = STORE.current
+    if not v.teachers:
         return {"count": 0, "samples": []}
     if not like:
         # 先頭20件のサンプル名を返す
-        return {"count": len(TEACHERS), "samples": [t.get("名前") for t in TEACHERS[:20]]}
-    hits = [t for t in TEACHERS if like in (t.get("名前") or "")]
+        return {"count": len(v.teachers), "samples": v.teachers.names[:20]}
+    hits = v.teacher_index.contains(like)
     return {
         "like": like,
         "count": len(hits),
-        "names": [t.get("名前") for t in hits[:50]],
+        "names": [t.name for t in hits[:50]],
+    }
+
+@app.get("/admin/office-hours")
+def admin_office_hours(limit: int = Query(20, description="表示する未解析 memo の件数")):
+    office_hours = STORE.current.office_hours
+    return {**office_hours.stats(), "unparsed_samples": office_hours.unparsed(limit)}
+
+@app.get("/admin/weather-cache")
+def admin_weather_cache():
+    return WEATHER.stats()
+
+@app.get("/admin/retrieve")
+def admin_retrieve(q: str = Query(..., description="質問文")):
+    # LLM に渡す資料の中身を確認する
+    context, used, tokens = retrieve_context(q)
+    return {
+        "tokens": tokens,
+        "budget": RAG_TOKEN_BUDGET,
+        "hits": [{"score": round(sc, 3), "dataset": ds, "idx": idx} for sc, ds, idx, _ in used],
+        "context": context,
+    }
+
+@app.get("/admin/llm")
+def admin_llm():
+    return {
+        "tasks": {t: {"provider": llm_for(t)[0].name, "model": m or llm_for(t)[0].model} for t, (_, m) in LLM_TASKS.items()},
+        "providers": {n: p.stats() for n, p in PROVIDERS.items()},
+        "coalescing": LLM_FLIGHT.stats(),
+        "admission": {n: a.stats() for n, a in ADMISSION.items()},
     }
 
+@app.get("/admin/classify-cache")
+def admin_classify_cache(limit: int = Query(20, description="表示するキーの件数")):
+    return {**CLASSIFY_CACHE.stats(), "recent_keys": CLASSIFY_CACHE.peek_keys(limit)}
+
+@app.post("/admin/classify-cache/flush")
+def admin_classify_cache_flush():
+    return {"flushed": CLASSIFY_CACHE.clear()}
+
+@app.get("/admin/sessions")
+def admin_sessions():
+    return SESSIONS.stats()
+
+@app.delete("/api/session/{session_id}")
+def end_session(session_id: str):
+    # 会話のリセット（フロントの「新しい会話」など）
+    return {"dropped": SESSIONS.drop(session_id)}
+
+@app.post("/admin/response-cache/flush")
+def admin_response_cache_flush():
+    return {"flushed": RESPONSE_CACHE.clear()}
+
 @app.get("/healthz")
 def health():
     return {"status": "ok"}
 
+@app.get("/readyz")
+def ready():
+    # データセットごとの状態（pending / loading / ready / failed）と読み込み時間。先読み中は 503
+    st = STORE.readiness()
+    return JSONResponse(st, status_code=200 if st["ready"] else 503)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    # 段階別レイテンシ（chat_stage_seconds）を Prometheus テキスト形式で
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# ===== 計測（Server-Timing ヘッダ）=====
+app.add_middleware(TimingMiddleware)
+
 # ===== CORS =====
 app.add_middleware(
     CORSMiddleware,
@@ -0,0 +1,208 @@
+"""
+段階ごとのレイテンシ計測（Prometheus テキスト形式の /metrics と Server-Timing ヘッダ）。
+
+- Histogram    : ラベル付きヒストグラム。prometheus_client には依存せず、exposition 形式だけ自前で出す
+- Sampled      : 出力時にコールバックで値を集める gauge / counter（キュー長や破棄数など、持ち主が数えている値）
+- stage(...)   : with ブロックの所要時間を STAGE_SECONDS に記録し、同時にリクエスト内の内訳にも積む
+- fail(e)      : 例外を握りつぶす箇所（call_openai など）から、いま計測中の段階を error/timeout にする
+- TimingMiddleware : リクエストごとの内訳を用意し、レスポンスヘッダに Server-Timing として付ける
+
+outcome ラベルは hit（期待どおり）/ fallback（代替経路に落ちた）/ error / timeout のいずれか。
+"""
+import contextvars, math, threading, time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+OUTCOMES = ("hit", "fallback", "error", "timeout")
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf"
+    return repr(float(v)) if v != int(v) else f"{int(v)}.0"
+
+
+class Histogram:
+    """累積バケットのヒストグラム。スレッドプール上のツール関数からも呼ばれるのでロックで守る"""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str], buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}   # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        for key, s in series:
+            base = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key))
+            sep = "," if base else ""
+            for b, c in zip(self.buckets, s):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{_fmt(b)}"}} {int(c)}')
+            lines.append(f"{self.name}_sum{{{base}}} {s[-2]!r}")
+            lines.append(f"{self.name}_count{{{base}}} {int(s[-1])}")
+        return lines
+
+
+class Sampled:
+    """値を持たず、出力時に fn() から (ラベル値のタプル, 値) の並びを取ってくる gauge / counter"""
+
+    def __init__(self, name: str, doc: str, kind: str, labelnames: Sequence[str],
+                 fn: Callable[[], Iterable[Tuple[Tuple[str, ...], float]]]):
+        self.name = name
+        self.doc = doc
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.fn()):
+            base = ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(self.labelnames, key))
+            lines.append(f"{self.name}{{{base}}} {_fmt(value)}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "chat_stage_seconds",
+    "Latency of each stage of a chat request (classify, tool, answer, open_meteo, total).",
+    ("stage", "tool", "outcome"),
+)
+REGISTRY: List[Any] = [STAGE_SECONDS]   # render() を持つもの（Histogram / Sampled）
+
+
+def render() -> str:
+    lines: List[str] = []
+    for m in REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# ===== リクエスト内の内訳 =====
+class Timings:
+    """1リクエスト分の (段階, ミリ秒, 説明) の並び。Server-Timing ヘッダの元"""
+
+    def __init__(self) -> None:
+        self.entries: List[Tuple[str, float, str]] = []
+        self.tool = ""
+
+    def header(self, total_ms: Optional[float] = None) -> str:
+        parts = []
+        for name, ms, desc in self.entries:
+            parts.append(f'{name};dur={ms:.1f}' + (f';desc="{desc}"' if desc else ""))
+        if total_ms is not None:
+            parts.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(parts)
+
+
+_timings: contextvars.ContextVar[Optional[Timings]] = contextvars.ContextVar("timings", default=None)
+_current: contextvars.ContextVar[Optional["Stage"]] = contextvars.ContextVar("stage", default=None)
+
+
+class Stage:
+    __slots__ = ("name", "tool", "outcome")
+
+    def __init__(self, name: str, tool: str):
+        self.name = name
+        self.tool = tool
+        self.outcome: Optional[str] = None   # 未設定のまま抜けたら hit
+
+
+def _is_timeout(e: BaseException) -> bool:
+    # asyncio.TimeoutError / httpx.TimeoutException / requests.Timeout をまとめて判定
+    return isinstance(e, TimeoutError) or "Timeout" in type(e).__name__
+
+
+@contextmanager
+def stage(name: str, tool: str = "") -> Iterator[Stage]:
+    st = Stage(name, tool)
+    token = _current.set(st)
+    t0 = time.perf_counter()
+    try:
+        yield st
+    except BaseException as e:
+        if st.outcome is None:
+            st.outcome = "timeout" if _is_timeout(e) else "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - t0
+        _current.reset(token)
+        outcome = st.outcome or "hit"
+        STAGE_SECONDS.observe(elapsed, stage=name, tool=st.tool, outcome=outcome)
+        t = _timings.get()
+        if t is not None:
+            desc = " ".join(x for x in (st.tool, "" if outcome == "hit" else outcome) if x)
+            t.entries.append((name, elapsed * 1000, desc))
+
+
+def fail(e: BaseException) -> None:
+    """例外を握りつぶして空の結果を返す関数用。計測中の段階に error/timeout を付ける"""
+    st = _current.get()
+    if st is not None and st.outcome is None:
+        st.outcome = "timeout" if _is_timeout(e) else "error"
+
+
+def set_tool(tool: str) -> None:
+    """このリクエストで選ばれた tool（total のラベルに使う）"""
+    t = _timings.get()
+    if t is not None:
+        t.tool = tool
+
+
+# ===== ASGI ミドルウェア =====
+class TimingMiddleware:
+    """
+    リクエストごとに Timings を用意し、レスポンス開始時点までの内訳を Server-Timing ヘッダで返す。
+    prefixes に一致するパスは total も STAGE_SECONDS に記録する。
+    （SSE はヘッダ送信がツール実行より先なので、内訳はヘッダに載らない。/metrics 側で見る）
+    """
+
+    def __init__(self, app: Any, prefixes: Sequence[str] = ("/api/",)):
+        self.app = app
+        self.prefixes = tuple(prefixes)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = Timings()
+        token = _timings.set(timings)
+        t0 = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                total_ms = (time.perf_counter() - t0) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header(total_ms).encode("latin-1", "replace")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _timings.reset(token)
+            if scope.get("path", "").startswith(self.prefixes):
+                outcome = "hit" if status[0] < 500 else "error"
+                STAGE_SECONDS.observe(time.perf_counter() - t0, stage="total", tool=timings.tool, outcome=outcome)
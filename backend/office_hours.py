@@ -0,0 +1,289 @@
+"""
+教員 memo（オフィスアワーの自由記述）の構造化と「いま会える先生」インデックス。
+
+ロード時に memo を1回だけ解析して、曜日 × 時刻区間のスロット・部屋・原文を保持する。
+  "火曜日 15:00-16:00 研究室…"      → [(火, 15:00, 16:00)]
+  "月曜日4時限目"                    → [(月, 14:30, 16:00)]   ※時限は PERIODS で時刻に変換
+  "毎週月曜日・火曜日 12:50-14:20"   → [(月, 12:50, 14:20), (火, 12:50, 14:20)]
+  "月〜金 13時〜"                    → [(月, 13:00, 18:00, approx), …]   ※終わりが無ければ DEFAULT_HOURS の終わりまで
+その上に 曜日 × 30分バケットの索引を作り、空き時間の問い合わせはバケット参照で答える。
+索引には解析結果（状態・スロット）とバケットだけを flat の列で持つ（原文は教員表の memo 列を読む）。
+"""
+import re, unicodedata
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from flat import Column, csr
+from records import Teacher, TeacherTable
+
+WEEKDAYS = "月火水木金土日"
+
+# 琉球大学の時限 → 時刻（分）
+PERIODS: Dict[int, Tuple[int, int]] = {
+    1: (8 * 60 + 30, 10 * 60),
+    2: (10 * 60 + 20, 11 * 60 + 50),
+    3: (12 * 60 + 50, 14 * 60 + 20),
+    4: (14 * 60 + 30, 16 * 60),
+    5: (16 * 60 + 20, 17 * 60 + 50),
+    6: (18 * 60, 19 * 60 + 30),
+    7: (19 * 60 + 40, 21 * 60 + 10),
+}
+# 「午前」「午後」「昼休み」などのざっくりした時間帯
+DAYPARTS: Dict[str, Tuple[int, int]] = {
+    "午前": (9 * 60, 12 * 60),
+    "昼休み": (11 * 60 + 50, 12 * 60 + 50),
+    "昼": (11 * 60 + 50, 12 * 60 + 50),
+    "午後": (13 * 60, 18 * 60),
+}
+# 曜日だけで時間の記載が無い場合に仮定する時間帯
+DEFAULT_HOURS = (8 * 60 + 30, 18 * 60)
+
+BUCKET_MIN = 30
+N_BUCKETS = 24 * 60 // BUCKET_MIN
+
+# 曜日: 「月曜日」「月曜」「(月)」「月・火」「月〜金」。「10月」「毎月」「日時」などは除外
+_DAY = r"(?:[月火水木金土日]曜日?|(?<![\d毎今来先年ヶか数個])[月火水木金土](?=[・、,/\s〜~\-)\d]|$))"
+_DAY_GROUP_RE = re.compile(rf"{_DAY}(?:\s*(?:[・、,/]|と|及び|および|〜|~|-)\s*{_DAY})*")
+_DAY_RE = re.compile(_DAY)
+_HHMM = r"(\d{1,2})(?::(\d{2})|時(?:(\d{1,2})分?)?)"
+_TIME_RANGE_RE = re.compile(rf"{_HHMM}\s*(?:〜|~|-|から)\s*{_HHMM}")
+# 終わりの無い「13時〜」「13:00から」「15時以降」
+_TIME_FROM_RE = re.compile(rf"{_HHMM}\s*(?:〜|~|-|から|以降)(?!\s*\d)")
+_PERIOD_RE = re.compile(r"(\d)(?:\s*([-〜~・、])\s*(\d))?\s*(?:時限|限)目?")
+_DAYPART_RE = re.compile("|".join(DAYPARTS))
+_ROOM_RE = re.compile(
+    r"[一-龥A-Za-z]*\d[\w\-]*号?室"
+    r"|[一-龥]+(?:棟|館)\s*[A-Za-z]?\d[\d\-]*"
+    r"|[一-龥]{1,4}[A-Z]?\d{3}(?:-\d+)?"
+)
+_URL_RE = re.compile(r"https?://\S+")
+
+
+@dataclass(frozen=True)
+class Slot:
+    weekday: int     # 0=月 … 6=日
+    start: int       # 0:00 からの分
+    end: int
+    approx: bool = False   # 時刻（または終わりの時刻）の記載が無く DEFAULT_HOURS で補った
+
+    def label(self) -> str:
+        return f"{WEEKDAYS[self.weekday]} {self.start // 60}:{self.start % 60:02d}-{self.end // 60}:{self.end % 60:02d}"
+
+
+STATUSES = ("parsed", "anytime", "appointment", "link", "none", "unparsed")
+
+
+@dataclass
+class OfficeHours:
+    raw: str
+    status: str                      # STATUSES のどれか
+    slots: List[Slot] = field(default_factory=list)
+    rooms: List[str] = field(default_factory=list)
+
+
+def _minutes(h: str, m1: Optional[str], m2: Optional[str]) -> int:
+    return int(h) * 60 + int(m1 or m2 or 0)
+
+
+def _expand_days(group: str) -> List[int]:
+    """「月〜金」は範囲、「月・水」は列挙として曜日番号に展開"""
+    days: List[int] = []
+    marks = [(m.start(), WEEKDAYS.index(m.group(0)[0])) for m in _DAY_RE.finditer(group)]
+    for i, (pos, d) in enumerate(marks):
+        if i and re.search(r"[〜~\-]", group[marks[i - 1][0]:pos]):
+            prev = days[-1]
+            days.extend(range(prev + 1, d + 1) if d > prev else [])
+        elif d not in days:
+            days.append(d)
+    return days
+
+
+def _times(chunk: str) -> List[Tuple[int, int, bool]]:
+    """
+    区間テキスト中の時刻範囲 (開始, 終了, 終了を仮定したか)。
+    HH:MM-HH:MM / ◯時〜◯時 / ◯限 / ◯時〜（終わりは DEFAULT_HOURS の終わり、過ぎていれば 24時）/ 午後 など
+    """
+    spans: List[Tuple[int, int, bool]] = []
+    for m in _TIME_RANGE_RE.finditer(chunk):
+        g = m.groups()
+        s, e = _minutes(g[0], g[1], g[2]), _minutes(g[3], g[4], g[5])
+        if 0 <= s < e <= 24 * 60:
+            spans.append((s, e, False))
+    if spans:
+        return spans
+    for m in _PERIOD_RE.finditer(chunk):
+        a, sep, b = int(m.group(1)), m.group(2), int(m.group(3) or m.group(1))
+        # 「2-5限」は範囲、「3・4限」は列挙
+        for p in (range(a, b + 1) if sep in ("-", "〜", "~") else (a, b)):
+            if p in PERIODS:
+                spans.append((*PERIODS[p], False))
+    if spans:
+        return sorted(set(spans))
+    for m in _TIME_FROM_RE.finditer(chunk):
+        s = _minutes(*m.groups())
+        if s < 24 * 60:
+            spans.append((s, DEFAULT_HOURS[1] if s < DEFAULT_HOURS[1] else 24 * 60, True))
+    if spans:
+        return spans
+    return [(*DAYPARTS[m.group(0)], False) for m in _DAYPART_RE.finditer(chunk)]
+
+
+def parse_memo(memo: str) -> OfficeHours:
+    raw = memo or ""
+    s = unicodedata.normalize("NFKC", raw).replace("～", "〜")
+    s = re.sub(r"(?<=\d)\s*[ー−–—]\s*(?=\d)", "-", s)
+    s = s.replace("平日", "月〜金 ")
+    rooms = [r.strip() for r in _ROOM_RE.findall(s)]
+
+    # 曜日グループごとに、次の曜日グループまでを「その曜日の時間帯」とみなす
+    groups = list(_DAY_GROUP_RE.finditer(s))
+    slots: List[Slot] = []
+    for i, g in enumerate(groups):
+        days = _expand_days(g.group(0))
+        chunk_end = groups[i + 1].start() if i + 1 < len(groups) else len(s)
+        chunk = s[g.end():chunk_end]
+        # 「金〜土曜は原則不在」のような否定は除外
+        if re.match(r"\s*[はも]?\s*(?:原則|基本的に)?\s*(?:不在|休み|不可|対応しない)", chunk):
+            continue
+        # 先頭の曜日より前に時刻だけ書かれている場合（「12:00〜 月曜」）も拾う
+        if i == 0:
+            chunk = s[:g.start()] + " " + chunk
+        spans = _times(chunk)
+        for d in days:
+            if spans:
+                slots.extend(Slot(d, a, b, approx) for a, b, approx in spans)
+            else:
+                slots.append(Slot(d, *DEFAULT_HOURS, approx=True))
+
+    if slots:
+        status = "parsed"
+    elif not raw.strip() or re.search(r"(情報なし|特になし|なし$)", raw):
+        status = "none"
+    elif _URL_RE.fullmatch(raw.strip()) or "リンク" in raw:
+        status = "link"
+    elif re.search(r"(随時|いつでも|在室)", raw):
+        status = "anytime"
+    elif re.search(r"(メール|アポ|予約|連絡|相談|appointment|Email)", raw, re.I):
+        status = "appointment"
+    else:
+        status = "unparsed"
+    return OfficeHours(raw=raw, status=status, slots=slots, rooms=rooms)
+
+
+class OfficeHoursIndex:
+    """
+    TEACHERS と同じ並びの解析結果と、曜日 × 30分バケットの逆引き表。
+    - status                   : 行ごとの STATUSES の番号
+    - slot_starts / slot_*     : 行 i のスロットは slot_*[slot_starts[i]:slot_starts[i + 1]]
+    - bucket_starts / bucket_ids: 曜日 d・バケット b の教員は bucket_ids[範囲]（範囲は d * N_BUCKETS + b 番目）
+    """
+
+    def __init__(self, teachers: TeacherTable):
+        self.teachers = teachers
+        status = array("B")
+        starts = array("Q", [0])
+        days, begins, ends, approx = array("B"), array("H"), array("H"), array("B")
+        buckets: List[List[int]] = [[] for _ in range(7 * N_BUCKETS)]
+        for i, memo in enumerate(teachers.memos):
+            oh = parse_memo(memo)
+            status.append(STATUSES.index(oh.status))
+            for sl in oh.slots:
+                days.append(sl.weekday)
+                begins.append(sl.start)
+                ends.append(sl.end)
+                approx.append(sl.approx)
+                for b in range(sl.start // BUCKET_MIN, (sl.end - 1) // BUCKET_MIN + 1):
+                    row = buckets[sl.weekday * N_BUCKETS + b]
+                    if not row or row[-1] != i:
+                        row.append(i)
+            starts.append(len(days))
+        self.status = Column(status, "B")
+        self.slot_starts = Column(starts, "Q")
+        self.slot_days, self.slot_begins = Column(days, "B"), Column(begins, "H")
+        self.slot_ends, self.slot_approx = Column(ends, "H"), Column(approx, "B")
+        self.bucket_starts, self.bucket_ids = csr(buckets)
+
+    def slots(self, i: int) -> List[Slot]:
+        """行 i の教員のスロット"""
+        a, b = self.slot_starts[i], self.slot_starts[i + 1]
+        return [Slot(d, s, e, bool(x)) for d, s, e, x in
+                zip(self.slot_days[a:b], self.slot_begins[a:b], self.slot_ends[a:b], self.slot_approx[a:b])]
+
+    def parsed(self, i: int) -> OfficeHours:
+        """行 i の memo の解析結果（部屋は持っていないので、要る時は parse_memo を呼ぶこと）"""
+        return OfficeHours(raw=self.teachers.memos[i], status=STATUSES[self.status[i]], slots=self.slots(i))
+
+    def stats(self) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        for c in self.status:
+            out[STATUSES[c]] = out.get(STATUSES[c], 0) + 1
+        out["total"] = len(self.status)
+        return out
+
+    def unparsed(self, limit: int = 20) -> List[str]:
+        code = STATUSES.index("unparsed")
+        memos = self.teachers.memos
+        return [memos[i] for i, c in enumerate(self.status) if c == code][:limit]
+
+    def available(self, weekday: int, start: int, end: Optional[int] = None,
+                  dept: str = "") -> List[Tuple[Teacher, Slot]]:
+        """[start, end) にオフィスアワーが重なる教員（end 省略時は時点 start）"""
+        end = start + 1 if end is None else end
+        depts = self.teachers.depts.matching(dept) if dept else None
+        dept_ids = self.teachers.dept_ids
+        starts, ids = self.bucket_starts, self.bucket_ids
+        seen, out = set(), []
+        for b in range(start // BUCKET_MIN, (end - 1) // BUCKET_MIN + 1):
+            k = weekday * N_BUCKETS + b
+            for i in ids[starts[k]:starts[k + 1]]:
+                if i in seen:
+                    continue
+                if depts is not None and dept_ids[i] not in depts:
+                    continue
+                for sl in self.slots(i):
+                    if sl.weekday == weekday and sl.start < end and start < sl.end:
+                        seen.add(i)
+                        out.append((self.teachers[i], sl))
+                        break
+        out.sort(key=lambda x: (x[1].approx, x[1].start))
+        return out
+
+
+# ===== 空き時間の問い合わせ（「今オフィスアワー中の先生」「月曜4限に会える情報系の先生」）=====
+_NOW_RE = re.compile(r"(今|いま|現在)")
+# 空き時間を聞いている言い回し。これが無ければ時刻があっても空き時間の問い合わせとはみなさない
+# （「今日のイベント」「月曜の授業」など）。「している」「ている」の「いる」は除く
+_AVAILABILITY_RE = re.compile(r"(空いて|空き|会える|会えます|会いに|会いたい|オフィスアワー|在室|(?<![して])(?:いる|います)|居る)")
+_DEPT_RE = re.compile(r"([一-龥ァ-ヴー]+?)(?:系|学部|学科|コース|プログラム)の")
+
+
+def parse_availability_query(text: str, now: datetime) -> Optional[Tuple[int, int, int, str]]:
+    """
+    (weekday, start, end, dept) を返す。空き時間を聞く言い回し（空いて・会える・オフィスアワー・いる など）が無いか、
+    曜日/時限/時刻/「今」のどれも無ければ None。
+    dept は「情報系の」「工学部の」などから取り出した所属のキーワード（無ければ ""）。
+    """
+    s = unicodedata.normalize("NFKC", text).replace("～", "〜")
+    if not _AVAILABILITY_RE.search(s):
+        return None
+    m_dept = _DEPT_RE.search(s)
+    dept = m_dept.group(1) if m_dept else ""
+
+    days = [WEEKDAYS.index(m.group(0)[0]) for m in _DAY_RE.finditer(s)]
+    spans = _times(s)
+    m_at = re.search(r"(\d{1,2})(?::(\d{2})|時(?:(\d{1,2})分)?)", s) if not spans else None
+
+    if days or spans or m_at:
+        wd = days[0] if days else now.weekday()
+        if spans:
+            return wd, spans[0][0], spans[-1][1], dept
+        if m_at:
+            t = _minutes(*m_at.groups())
+            return wd, t, t + 1, dept
+        return wd, *DEFAULT_HOURS, dept
+    if _NOW_RE.search(s):
+        t = now.hour * 60 + now.minute
+        return now.weekday(), t, t + 1, dept
+    return None
@@ -0,0 +1,248 @@
+"""
+教員・サークルのレコードを列指向で持つ表（TEACHERS / CLUBS）。
+
+JSON の dict をそのまま持つと、1件ごとに dict 本体（キー4つで 200 バイト強）が付く。
+ここでは項目ごとの列にまとめ、1件あたりは列の中の数バイトにする:
+- 文字列の列は flat.StrTable（UTF-8 の blob ＋ 開始位置）。スナップショットから読んだ時は mmap のページを直接読む
+- 所属は DeptTable で小さな整数コードにし、コードの列は flat.Column（u32）に詰める
+- 行は Teacher / Club（表と行番号だけを持つ __slots__ のビュー）として取り出し、属性で読む
+
+列に無いキーと文字列以外の値（null・数値など）は、行番号 → 元の値 の dict（extras）に別に取っておく。
+どのキーが元データにあったかは行ごとのビット（present）で持ち、無かったキーは "" の列値を返すだけで to_dict には出さない。
+
+to_dict() は元の JSON と同じキー・値の dict を返す（全文検索の表示や管理 API 用）。
+"""
+from array import array
+from collections.abc import Sequence
+from typing import Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+from flat import Column, StrTable
+
+
+def _str(v: Any) -> str:
+    if v is None:
+        return ""
+    return v if isinstance(v, str) else str(v)
+
+
+class DeptTable:
+    """所属の表。文字列 ↔ コード（0 から連番）。同じ所属は1つの文字列オブジェクトを共有する"""
+    __slots__ = ("names", "_codes")
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def code(self, name: str) -> int:
+        c = self._codes.get(name)
+        if c is None:
+            c = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return c
+
+    def __getitem__(self, code: int) -> str:
+        return self.names[code]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def matching(self, sub: str) -> FrozenSet[int]:
+        """sub を含む所属のコード（所属での絞り込みは、教員ごとではなくこの表の上で1回だけ照合する）"""
+        return frozenset(c for c, n in enumerate(self.names) if sub in n)
+
+
+class RecordTable(Sequence):
+    """列指向の表。table[i] は行ビュー、スライスは行ビューのリスト"""
+    row_type: Any = None
+    KEYS: Tuple[str, ...] = ()   # 列にする JSON のキー（to_dict の並び）
+
+    def _start(self) -> None:
+        self.present: Any = array("B")                # 行ごとに、KEYS のどれが元データにあったか（ビット）
+        self.extras: Dict[int, Dict[str, Any]] = {}   # 行番号 → 列に無いキー・文字列でない値（元のまま）
+
+    def _freeze(self) -> None:
+        self.present = Column(self.present, "B")
+
+    def _keep(self, i: int, r: dict, aliases: Optional[Dict[str, str]] = None) -> None:
+        """行 i の元データ r のうち、列で表せない部分を覚えておく"""
+        bits = 0
+        extra: Dict[str, Any] = {}
+        for k, v in r.items():
+            key = aliases.get(k, k) if aliases else k
+            j = self.KEYS.index(key) if key in self.KEYS else -1
+            if j < 0 or bits >> j & 1:
+                extra[k] = v
+                continue
+            bits |= 1 << j
+            if not isinstance(v, str):
+                extra[key] = v
+        self.present.append(bits)
+        if extra:
+            self.extras[i] = extra
+
+    def has(self, i: int, key: str) -> bool:
+        return key in self.KEYS and bool(self.present[i] >> self.KEYS.index(key) & 1)
+
+    def row_dict(self, i: int, values: Iterable[str]) -> Dict[str, Any]:
+        """KEYS の並びの列値 values から、元データにあったキーだけの dict を作る"""
+        bits = self.present[i]
+        d: Dict[str, Any] = {k: v for j, (k, v) in enumerate(zip(self.KEYS, values)) if bits >> j & 1}
+        d.update(self.extras.get(i, ()))
+        return d
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.row_type(self, j) for j in range(*i.indices(self._n))]
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return self.row_type(self, i)
+
+    def __iter__(self) -> Iterator[Any]:
+        row = self.row_type
+        return (row(self, i) for i in range(self._n))
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} rows={self._n}>"
+
+
+# ===== 教員 =====
+class Teacher:
+    __slots__ = ("_t", "i")
+
+    def __init__(self, table: "TeacherTable", i: int):
+        self._t = table
+        self.i = i
+
+    @property
+    def name(self) -> str:
+        return self._t.names[self.i]
+
+    @property
+    def dept_id(self) -> int:
+        return self._t.dept_ids[self.i]
+
+    @property
+    def dept(self) -> str:
+        return self._t.depts.names[self._t.dept_ids[self.i]]
+
+    @property
+    def memo(self) -> str:
+        return self._t.memos[self.i]
+
+    @property
+    def link(self) -> str:
+        return self._t.links[self.i]
+
+    def has(self, key: str) -> bool:
+        """元データに key（所属 / 名前 / memo / リンク）があったか"""
+        return self._t.has(self.i, key)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._t.row_dict(self.i, (self.dept, self.name, self.memo, self.link))
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Teacher) and other._t is self._t and other.i == self.i
+
+    def __hash__(self) -> int:
+        return hash((id(self._t), self.i))
+
+    def __repr__(self) -> str:
+        return f"Teacher({self.to_dict()!r})"
+
+
+class TeacherTable(RecordTable):
+    """教員（名前 / 所属 / memo / リンク）。並びは元データのまま"""
+    row_type = Teacher
+    KEYS = ("所属", "名前", "memo", "リンク")
+
+    def __init__(self, rows: List[dict]):
+        self._start()
+        self.depts = DeptTable()
+        names: List[str] = []
+        dept_ids = array("I")
+        memos: List[str] = []
+        links: List[str] = []
+        for r in rows:
+            if not isinstance(r, dict):
+                continue
+            names.append(_str(r.get("名前")))
+            dept_ids.append(self.depts.code(_str(r.get("所属"))))
+            memos.append(_str(r.get("memo")))
+            links.append(_str(r.get("リンク") or r.get("link")))
+            self._keep(len(names) - 1, r, {"link": "リンク"})
+        self._n = len(names)
+        self.names = StrTable(names)
+        self.dept_ids = Column(dept_ids)
+        self.memos = StrTable(memos)
+        self.links = StrTable(links)
+        self._freeze()
+
+
+# ===== サークル =====
+class Club:
+    __slots__ = ("_t", "i")
+
+    def __init__(self, table: "ClubTable", i: int):
+        self._t = table
+        self.i = i
+
+    @property
+    def name(self) -> str:
+        return self._t.cols["name"][self.i]
+
+    @property
+    def day(self) -> str:
+        return self._t.cols["day"][self.i]
+
+    @property
+    def location(self) -> str:
+        return self._t.cols["location"][self.i]
+
+    @property
+    def detail(self) -> str:
+        return self._t.cols["detail"][self.i]
+
+    @property
+    def sns(self) -> str:
+        return self._t.cols["sns"][self.i]
+
+    def has(self, key: str) -> bool:
+        """元データに key（name / day / location / detail / sns）があったか"""
+        return self._t.has(self.i, key)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._t.row_dict(self.i, [col[self.i] for col in self._t.cols.values()])
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Club) and other._t is self._t and other.i == self.i
+
+    def __hash__(self) -> int:
+        return hash((id(self._t), self.i))
+
+    def __repr__(self) -> str:
+        return f"Club({self.to_dict()!r})"
+
+
+class ClubTable(RecordTable):
+    """サークル（name / day / location / detail / sns）。未記載は元データどおり「未記載」の文字列"""
+    row_type = Club
+    FIELDS = ("name", "day", "location", "detail", "sns")
+    KEYS = FIELDS
+
+    def __init__(self, rows: List[dict]):
+        self._start()
+        cols: Dict[str, List[str]] = {k: [] for k in self.FIELDS}
+        for r in rows:
+            if not isinstance(r, dict):
+                continue
+            for k, col in cols.items():
+                col.append(_str(r.get(k)))
+            self._keep(len(cols["name"]) - 1, r)
+        self._n = len(cols["name"])
+        self.cols: Dict[str, StrTable] = {k: StrTable(col) for k, col in cols.items()}
+        self._freeze()
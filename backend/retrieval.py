@@ -0,0 +1,223 @@
+"""
+data_qa / other（LLM 回答）向けの検索とプロンプト用コンテキストの組み立て。
+
+- 各レコードをデータセットごとの射影で1行の短い文に直す（stringify の JSON 全体ではなく、答えに要る項目だけ）
+- その文を文字バイグラムに分けて BM25 で順位付けする（日本語は分かち書きしないので n-gram）
+- 上位から順に、トークン予算に収まるだけ詰めてプロンプトに入れる
+
+索引はデータセット（JSON ファイル）ごとに作り、CompositeRetriever で束ねる。
+IDF は全データセットの文書数・df を合算して計算するので、データセット間でスコアを比べられる。
+射影した文・文書長・ポスティングは flat の列に詰める（スナップショットでは mmap のまま読む）。
+"""
+import math, re, unicodedata
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from flat import Column, Postings, StrTable
+from records import RecordTable
+
+K1 = 1.2
+B = 0.75
+
+_SPLIT_RE = re.compile(r"[^\w一-龥ぁ-んァ-ンー]+")
+_URL_RE = re.compile(r"https?://\S+")
+_HIRAGANA_RE = re.compile(r"[ぁ-ん]+")
+
+
+def _norm(s: str) -> str:
+    return unicodedata.normalize("NFKC", s or "").lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    文字バイグラム（1文字だけの塊はその文字）。
+    ひらがなだけのバイグラム（「した」「いつ」「です」など）は助詞・活用語尾がほとんどなので捨てる。
+    """
+    toks: List[str] = []
+    for run in _SPLIT_RE.split(_norm(text)):
+        if len(run) == 1:
+            grams = [run]
+        else:
+            grams = [run[i:i + 2] for i in range(len(run) - 1)]
+        toks.extend(g for g in grams if not _HIRAGANA_RE.fullmatch(g))
+    return toks
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の見積もり（日本語は1文字≒1トークン、ASCII は4文字≒1トークン）"""
+    ascii_n = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_n) + (ascii_n + 3) // 4
+
+
+# ===== レコード → 1行の射影 =====
+def _rows(raw: Any) -> List[Any]:
+    """dict の配列、または records の表（行は to_dict() で dict に戻す）"""
+    if isinstance(raw, list):
+        return raw
+    if isinstance(raw, RecordTable):
+        return [r.to_dict() for r in raw]
+    return []
+
+
+def _clip(s: Any, n: int) -> str:
+    s = " ".join(str(s or "").split())
+    return s if len(s) <= n else s[: n - 1] + "…"
+
+
+def _project_calendar(raw: Any) -> Iterable[Tuple[Any, str]]:
+    events = raw.get("events", []) if isinstance(raw, dict) else []
+    for i, e in enumerate(events):
+        if not isinstance(e, dict):
+            continue
+        start = e.get("date") or e.get("date_start") or ""
+        end = e.get("end") or e.get("date_end") or ""
+        when = f"{start}〜{end}" if end and end != start else start
+        yield i, f"[学年暦] {_clip(e.get('title'), 60)}: {when}"
+
+
+def _project_teachers(raw: Any) -> Iterable[Tuple[Any, str]]:
+    for i, t in enumerate(_rows(raw)):
+        if not isinstance(t, dict):
+            continue
+        memo = t.get("memo") or ""
+        memo = "研究者DBに掲載" if _URL_RE.fullmatch(memo.strip()) else _clip(_URL_RE.sub("", memo), 80)
+        yield i, f"[教員] {t.get('名前', '')}（{_clip(t.get('所属'), 40)}） オフィスアワー: {memo or '情報なし'}"
+
+
+def _project_clubs(raw: Any) -> Iterable[Tuple[Any, str]]:
+    for i, c in enumerate(_rows(raw)):
+        if not isinstance(c, dict):
+            continue
+        parts = [f"[サークル] {_clip(c.get('name'), 40)}"]
+        for label, key, n in (("活動", "day", 40), ("場所", "location", 40), ("内容", "detail", 80)):
+            v = c.get(key)
+            if v and v != "未記載":
+                parts.append(f"{label}: {_clip(v, n)}")
+        yield i, " / ".join(parts)
+
+
+def _project_generic(raw: Any) -> Iterable[Tuple[Any, str]]:
+    """射影が未定義のデータセット: スカラー値の項目だけを key=value で並べる"""
+    items = enumerate(raw) if isinstance(raw, list) else [("", raw)]
+    for i, item in items:
+        if isinstance(item, dict):
+            kv = [f"{k}={_clip(v, 60)}" for k, v in item.items()
+                  if isinstance(v, (str, int, float)) and not _URL_RE.fullmatch(str(v))]
+            yield i, _clip(" ".join(kv), 200)
+        elif isinstance(item, (str, int, float)):
+            yield i, _clip(item, 200)
+
+
+PROJECTIONS: Dict[str, Callable[[Any], Iterable[Tuple[Any, str]]]] = {
+    "academic_calendar": _project_calendar,
+    "ryukyu_office_hours": _project_teachers,
+    "clubs": _project_clubs,
+}
+
+
+# ===== BM25 =====
+Hit = Tuple[float, str, Any, str]   # (score, dataset, idx, 射影した文)
+
+
+class BM25Index:
+    """1データセット分。文書 = 射影した1行"""
+
+    def __init__(self, name: str, raw: Any):
+        self.name = name
+        idxs = array("q")     # 元データでの位置（dict 1件のデータセットの "" は -1）
+        texts: List[str] = []
+        lengths = array("I")
+        postings: Dict[str, List[Tuple[int, int]]] = {}   # term -> [(doc_id, tf)]
+        for idx, text in (PROJECTIONS.get(name, _project_generic)(raw) if raw is not None else ()):
+            if not text:
+                continue
+            doc_id = len(texts)
+            toks = tokenize(text)
+            idxs.append(-1 if idx == "" else idx)
+            texts.append(text)
+            lengths.append(len(toks))
+            tf: Dict[str, int] = {}
+            for t in toks:
+                tf[t] = tf.get(t, 0) + 1
+            for t, n in tf.items():
+                postings.setdefault(t, []).append((doc_id, n))
+        self.idxs = Column(idxs, "q")
+        self.texts = StrTable(texts)
+        self.lengths = Column(lengths)
+        self.postings = Postings(postings, "II")
+        self.avgdl = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def doc(self, d: int) -> Tuple[Any, str]:
+        """文書 ID → (元データでの位置, 射影した文)"""
+        idx = self.idxs[d]
+        return ("" if idx < 0 else idx), self.texts[d]
+
+    def df(self, term: str) -> int:
+        return self.postings.df(term)
+
+    def score(self, qterms: Dict[str, int], idf: Dict[str, float]) -> Dict[int, float]:
+        """ポスティングに載っている文書だけを採点する"""
+        scores: Dict[int, float] = {}
+        lengths = self.lengths.view
+        for t, qtf in qterms.items():
+            w = idf.get(t, 0.0)
+            if w <= 0:
+                continue
+            for d, tf in self.postings.items(t):
+                norm = K1 * (1 - B + B * lengths[d] / self.avgdl)
+                scores[d] = scores.get(d, 0.0) + qtf * w * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+
+class CompositeRetriever:
+    """データセットごとの BM25Index を束ね、IDF は全体の N と df で計算する"""
+
+    def __init__(self, parts: List[BM25Index]):
+        self.parts = [p for p in parts if len(p)]
+        self.n = sum(len(p) for p in self.parts)
+
+    def __len__(self) -> int:
+        return self.n
+
+    def search(self, query: str, k: int = 8) -> List[Hit]:
+        qterms: Dict[str, int] = {}
+        for t in tokenize(query):
+            qterms[t] = qterms.get(t, 0) + 1
+        idf: Dict[str, float] = {}
+        for t in qterms:
+            df = sum(p.df(t) for p in self.parts)
+            if df:
+                idf[t] = math.log(1 + (self.n - df + 0.5) / (df + 0.5))
+        hits: List[Hit] = []
+        for p in self.parts:
+            for d, sc in p.score(qterms, idf).items():
+                idx, text = p.doc(d)
+                hits.append((sc, p.name, idx, text))
+        hits.sort(key=lambda h: -h[0])
+        return hits[:k]
+
+
+def pack_context(hits: List[Hit], budget: int, rel_cutoff: float = 0.3) -> Tuple[str, List[Hit], int]:
+    """
+    スコア順に、トークン予算に収まるだけ1行ずつ詰める。(本文, 採用した hit, 見積もりトークン数)
+    1位のスコアの rel_cutoff 倍に満たないものは、予算が余っていても入れない（関係の薄い行で水増ししない）。
+    """
+    lines: List[str] = []
+    used: List[Hit] = []
+    total = 0
+    min_score = hits[0][0] * rel_cutoff if hits else 0.0
+    for h in hits:
+        if h[0] < min_score:
+            break
+        line = f"- {h[3]}"
+        cost = estimate_tokens(line) + 1
+        if total + cost > budget:
+            continue   # 長い行は飛ばして、短い次点が入るなら入れる
+        lines.append(line)
+        used.append(h)
+        total += cost
+    return "\n".join(lines), used, total
+
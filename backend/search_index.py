@@ -0,0 +1,126 @@
+"""
+./data/*.json 全レコードに対する文字 n-gram 転置インデックス。
+
+search_data_any が毎回すべてのレコードを json.dumps して部分一致を走査していたのを、
+ロード時に一度だけ文字列化 → n-gram のポスティングリストを作る方式に置き換える。
+検索時は候補レコードだけを照合するので、コーパス全体のサイズではなく候補数に比例する。
+
+- 1文字の語   : ユニグラム表（1文字語も従来どおりヒットさせるため）
+- 2文字の語   : バイグラムのポスティングがそのまま正解集合
+- 3文字以上   : トライグラムのポスティングを積集合 → 実文字列で最終確認
+
+文字列化したレコードとポスティングは flat の列に詰める（スナップショットでは mmap のまま読む）。
+文書 ID → (fname, idx, item) は文書ごとには持たず、データセットの並びと各データセットの先頭の文書 ID から引く。
+"""
+import json
+from array import array
+from bisect import bisect_right
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, List, Tuple
+
+from flat import Column, Postings, StrTable, literal
+
+Hit = Tuple[int, str, Any, Any]  # (score, fname, idx, item)
+
+
+def stringify(val: Any) -> str:
+    if hasattr(val, "to_dict"):
+        val = val.to_dict()   # records の行ビュー
+    try:
+        if isinstance(val, (dict, list)):
+            return json.dumps(val, ensure_ascii=False)
+        return str(val)
+    except Exception:
+        return str(val)
+
+
+def _grams(s: str, n: int) -> Iterable[str]:
+    return {s[i:i + n] for i in range(len(s) - n + 1)}
+
+
+class NgramIndex:
+    """DATA（ファイル名 → list/dict）を1レコード=1文書として索引化する"""
+
+    def __init__(self, data: Dict[str, Any]):
+        # 文書 ID は DATA の走査順に振る（＝従来実装の出力順と一致させる）
+        self.parts: List[Tuple[str, Any, bool]] = []   # (fname, 中身, dict 1件で1文書か)
+        starts = array("I")                           # parts ごとの先頭の文書 ID
+        blobs: List[str] = []
+        postings: Dict[str, List[int]] = {}
+        for fname, content in data.items():
+            if isinstance(content, dict):
+                items: Iterable[Any] = [content]
+            elif isinstance(content, Sequence) and not isinstance(content, str):
+                items = content   # list と records の表
+            else:
+                continue
+            self.parts.append((fname, content, isinstance(content, dict)))
+            starts.append(len(blobs))
+            for item in items:
+                doc_id = len(blobs)
+                blob = stringify(item)
+                blobs.append(blob)
+                for n in (1, 2, 3):
+                    for g in _grams(blob, n):
+                        postings.setdefault(g, []).append(doc_id)
+        self.starts = Column(starts)
+        self.blobs = StrTable(blobs)
+        self.postings = Postings(postings)
+
+    def doc(self, d: int) -> Tuple[str, Any, Any]:
+        """文書 ID → (fname, idx, item)。dict のデータセットは idx が空文字"""
+        p = bisect_right(self.starts.view, d) - 1 if len(self.parts) > 1 else 0
+        fname, content, whole = self.parts[p]
+        if whole:
+            return fname, "", content
+        idx = d - self.starts[p]
+        return fname, idx, content[idx]
+
+    def __len__(self) -> int:
+        return len(self.blobs)
+
+    def candidates(self, term: str) -> List[int]:
+        """term を部分文字列として含む文書 ID（昇順）"""
+        if len(term) <= 2:
+            return self.postings.get(term, [])
+        lists = []
+        for g in _grams(term, 3):
+            p = self.postings.get(g)
+            if not p:
+                return []
+            lists.append(p)
+        lists.sort(key=len)
+        cand = set(lists[0])
+        for p in lists[1:]:
+            cand.intersection_update(p)
+            if not cand:
+                return []
+        blobs, pat = self.blobs, literal(term)
+        return sorted(d for d in cand if blobs.search(pat, d))
+
+    def search(self, terms: List[str]) -> List[Hit]:
+        """各 term を含むかどうかでスコア（含まれる語の数）を付け、降順で返す"""
+        scores: Dict[int, int] = {}
+        for t in terms:
+            for d in self.candidates(t):
+                scores[d] = scores.get(d, 0) + 1
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        return [(sc, *self.doc(d)) for d, sc in ranked]
+
+
+class CompositeIndex:
+    """データセットごとの NgramIndex を束ねて1つの索引として検索する（差し替えは部分単位）"""
+
+    def __init__(self, parts: List[NgramIndex]):
+        self.parts = parts
+
+    def __len__(self) -> int:
+        return sum(len(p) for p in self.parts)
+
+    def search(self, terms: List[str]) -> List[Hit]:
+        hits: List[Hit] = []
+        for p in self.parts:
+            hits.extend(p.search(terms))
+        # 安定ソートなので同点は parts の順 → 各 index 内の順が保たれる
+        hits.sort(key=lambda x: x[0], reverse=True)
+        return hits
@@ -0,0 +1,255 @@
+"""
+会話セッション（複数ターンの文脈）。/api/chat 系に session_id を付けると、前のやり取りを踏まえて答える。
+
+- SessionStore : プロセス内の LRU。件数上限・アイドル TTL・1セッションあたりのバイト上限
+- 退避（任意） : LRU で追い出したセッションと、終了時に残っているセッションを SQLite に書き、
+                 同じ ID で来た時に戻す（アイドル TTL を過ぎたものは捨てる）
+- 履歴         : LLM に渡す時はトークン予算に収まる直近のターンだけを原文で渡し、それより古いターンは
+                 「これまでの会話の要約」1通にまとめる（各ターンの先頭を切り詰めて並べる抽出的な要約。
+                 要約のために LLM は呼ばない）
+- entities     : 直前に特定できた先生・サークルなど（指示語の追質問を LLM なしで答えるために main が使う）
+
+セッションは JSON にできる値だけを持つ（教員の行ビューなどは持たず、名前を覚えておく）。
+SQLite の読み書きはメモリ上の LRU のロックの外で行う。async のハンドラからは aget() を使う（退避先があれば
+スレッドで読み書きして、イベントループで待たない）。
+"""
+import asyncio, json, logging, secrets, sqlite3, threading, time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from retrieval import estimate_tokens
+
+ROLE_LABELS = {"user": "ユーザー", "assistant": "回答"}
+SUMMARY_LINE_CHARS = 60   # 要約に入れる1ターンあたりの文字数
+
+
+def _clip(s: str, n: int) -> str:
+    s = " ".join(s.split())
+    return s if len(s) <= n else s[:n - 1] + "…"
+
+
+def summarize(turns: List[Tuple[str, str]]) -> str:
+    return "\n".join(f"- {ROLE_LABELS.get(r, r)}: {_clip(c, SUMMARY_LINE_CHARS)}" for r, c in turns)
+
+
+@dataclass
+class Session:
+    id: str
+    created: float
+    updated: float
+    turns: List[Tuple[str, str]] = field(default_factory=list)   # (role, content) 古い順
+    summary: str = ""                                            # 溢れた古いターンの要約
+    entities: Dict[str, Any] = field(default_factory=dict)
+
+    def nbytes(self) -> int:
+        """持っている文字列の UTF-8 でのおおよそのバイト数"""
+        return (sum(len(c.encode()) for _, c in self.turns) + len(self.summary.encode())
+                + len(json.dumps(self.entities, ensure_ascii=False).encode()))
+
+    def add(self, role: str, content: str, max_bytes: int) -> None:
+        """ターンを足し、max_bytes を超えた分は古いターンから要約へ畳む（要約自体も max_bytes の 1/4 まで）"""
+        self.turns.append((role, content))
+        while self.turns and self.nbytes() > max_bytes:
+            if len(self.turns) > 2:
+                old, self.turns = self.turns[:2], self.turns[2:]
+                self.summary = f"{self.summary}\n{summarize(old)}".strip()
+            # 要約は新しい行を残して切り詰める
+            cap = max_bytes // 4
+            while len(self.summary.encode()) > cap and "\n" in self.summary:
+                self.summary = self.summary.split("\n", 1)[1]
+            if len(self.summary.encode()) > cap:
+                self.summary = ""
+            if len(self.turns) <= 2:
+                break
+
+    def history(self, budget: int) -> List[Dict[str, str]]:
+        """
+        LLM に渡す履歴（今回の質問は含まない）。直近のターンを新しい方からトークン予算の 3/4 まで原文で入れ、
+        入らなかった古いターンと既存の要約は、残りの予算で要約1通にまとめる
+        """
+        recent: List[Tuple[str, str]] = []
+        used = 0
+        for role, content in reversed(self.turns):
+            cost = estimate_tokens(content) + 4
+            if used + cost > budget * 3 // 4:
+                break
+            recent.append((role, content))
+            used += cost
+        recent.reverse()
+        older = self.turns[:len(self.turns) - len(recent)]
+        lines = [ln for ln in f"{self.summary}\n{summarize(older)}".split("\n") if ln.strip()]
+        # 要約は新しい行から残りの予算に入るだけ
+        kept: List[str] = []
+        left = budget - used - 8
+        for ln in reversed(lines):
+            cost = estimate_tokens(ln) + 1
+            if cost > left:
+                break
+            kept.append(ln)
+            left -= cost
+        out: List[Dict[str, str]] = []
+        if kept:
+            out.append({"role": "system", "content": "これまでの会話の要約:\n" + "\n".join(reversed(kept))})
+        out.extend({"role": r, "content": c} for r, c in recent)
+        return out
+
+
+class SessionStore:
+    """
+    セッションの LRU ＋ アイドル TTL（秒）。スレッドセーフ。
+    spill_path を渡すと、追い出したセッションをそこ（SQLite）に退避して、次に来た時に戻す。
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 1800.0, max_bytes: int = 16384,
+                 spill_path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.spill_path = spill_path
+        self._data: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()       # メモリ上の LRU（短時間だけ持つ）
+        self._db_lock = threading.Lock()    # SQLite の接続（I/O の間持つ。_lock を持ったまま取らない）
+        self._db: Optional[sqlite3.Connection] = None
+        self.counters = {"created": 0, "hits": 0, "expired": 0, "evicted": 0, "spilled": 0, "restored": 0}
+
+    # ---- SQLite への退避（_db_lock を持って呼ぶ）----
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if self.spill_path and self._db is None:
+            try:
+                self._db = sqlite3.connect(self.spill_path, check_same_thread=False)
+                self._db.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, body TEXT NOT NULL, updated REAL NOT NULL)")
+                self._db.execute("DELETE FROM sessions WHERE updated < ?", (time.time() - self.ttl,))
+                self._db.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"session spill disabled ({self.spill_path}): {e}")
+                self.spill_path = None
+                self._db = None
+        return self._db
+
+    def _spill(self, sessions: List[Session]) -> None:
+        if not sessions:
+            return
+        with self._db_lock:
+            db = self._conn()
+            if db is None:
+                return
+            try:
+                db.executemany("INSERT OR REPLACE INTO sessions (id, body, updated) VALUES (?, ?, ?)",
+                               [(s.id, json.dumps(asdict(s), ensure_ascii=False), s.updated) for s in sessions])
+                db.commit()
+                self.counters["spilled"] += len(sessions)
+            except sqlite3.Error as e:
+                logging.warning(f"session spill failed: {e}")
+
+    def _restore(self, sid: str, now: float) -> Optional[Session]:
+        with self._db_lock:
+            db = self._conn()
+            if db is None:
+                return None
+            try:
+                row = db.execute("SELECT body, updated FROM sessions WHERE id = ?", (sid,)).fetchone()
+                if row is None:
+                    return None
+                db.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+                db.commit()
+            except sqlite3.Error as e:
+                logging.warning(f"session restore failed: {e}")
+                return None
+            if now - row[1] > self.ttl:
+                self.counters["expired"] += 1
+                return None
+            d = json.loads(row[0])
+            d["turns"] = [tuple(t) for t in d.get("turns", [])]
+            self.counters["restored"] += 1
+            return Session(**d)
+
+    # ---- 取得 ----
+    def get(self, sid: Optional[str]) -> Session:
+        """sid のセッション。無い・期限切れ・未指定なら新しい ID で作る（返した Session.id をクライアントに返す）"""
+        now = time.time()
+        with self._lock:
+            # 古い方から期限切れを掃除（並びは最終利用順）
+            while self._data:
+                first = next(iter(self._data.values()))
+                if now - first.updated <= self.ttl:
+                    break
+                self._data.popitem(last=False)
+                self.counters["expired"] += 1
+            s = self._data.get(sid) if sid else None
+            if s is not None:
+                self.counters["hits"] += 1
+                s.updated = now
+                self._data.move_to_end(s.id)
+                return s
+        # 退避先からの復元は LRU のロックの外で（SQLite を読む間、record() などを待たせない）
+        restored = self._restore(sid, now) if sid else None
+        with self._lock:
+            # 復元している間に同じ ID の別のリクエストが入れていればそちらを使う
+            s = self._data.get(sid) if sid else None
+            if s is None:
+                s = restored
+            if s is None:
+                s = Session(secrets.token_urlsafe(16), created=now, updated=now)
+                self.counters["created"] += 1
+            s.updated = now
+            self._data[s.id] = s
+            self._data.move_to_end(s.id)
+            evicted = []
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False)[1])
+            self.counters["evicted"] += len(evicted)
+        self._spill(evicted)
+        return s
+
+    async def aget(self, sid: Optional[str]) -> Session:
+        """async のハンドラ用の get()。退避先があれば SQLite の読み書きごとスレッドで"""
+        if not self.spill_path:
+            return self.get(sid)
+        return await asyncio.to_thread(self.get, sid)
+
+    def record(self, s: Session, user_text: str, reply: str) -> None:
+        """1往復分を履歴に足す"""
+        with self._lock:
+            s.add("user", user_text, self.max_bytes)
+            s.add("assistant", reply, self.max_bytes)
+            s.updated = time.time()
+
+    def drop(self, sid: str) -> bool:
+        with self._lock:
+            found = self._data.pop(sid, None) is not None
+        with self._db_lock:
+            db = self._conn()
+            if db is not None:
+                try:
+                    found = db.execute("DELETE FROM sessions WHERE id = ?", (sid,)).rowcount > 0 or found
+                    db.commit()
+                except sqlite3.Error as e:
+                    logging.warning(f"session drop failed: {e}")
+        return found
+
+    def close(self) -> None:
+        """終了時。退避先があれば残っているセッションを書いておく（再起動後も続きから話せる）"""
+        with self._lock:
+            remaining = list(self._data.values())
+        self._spill(remaining)
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            nbytes = sum(s.nbytes() for s in self._data.values())
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_sec": self.ttl,
+            "max_bytes_per_session": self.max_bytes,
+            "bytes": nbytes,
+            "spill_path": self.spill_path,
+            **self.counters,
+        }
@@ -0,0 +1,264 @@
+"""
+データセットの派生構造（正規化済みレコード・各種インデックス）をまとめたバイナリスナップショット。
+
+data_process/compile.py が書き出し、サーバは起動時に mmap で開いて、元の JSON と中身が同じ
+データセットだけをそこから復元する（JSON のパースと索引の再構築を飛ばす）。
+各セクションは pickle（protocol 5）で、オブジェクトが PickleBuffer で出した中身（flat.py の文字列表・数値の列）は
+pickle の外（out-of-band）にそのまま並べる。復元時はそこを mmap の memoryview のまま渡すので、
+その部分はヒープにコピーされず、ファイルのページ（ページキャッシュ）を全ワーカーで共有する。
+pickle 本体から作るオブジェクト（小さな表・オートマトンなど）は従来どおりワーカーごとにヒープへ作られる。
+
+複数ワーカー構成では、親プロセス（compile.py --watch）だけが JSON から作って書き出し、
+ワーカーは DATA_MODE=follow でこれを読み取り専用で開く。書き直すたびに generation を進める
+（前回より大きく、かつミリ秒単位の時刻以上。ファイルを消して作り直しても前と同じ番号にはならない）。
+ワーカーはファイルの同一性（inode・mtime・サイズ）が変わった時に開き直す。
+
+レイアウト（整数はリトルエンディアン）:
+    magic(8) | format(u32) | toc_len(u32) | generation(u64) | toc(JSON, UTF-8) | 0埋め | section ...
+- toc      : {"fingerprint", "python", "created", "generation",
+              "datasets": {名前: {"sha256", "offset", "length", "pickle", "buffers", "hmac"}}}
+- section  : データセット1つ分。先頭は PAGE 境界に揃える。
+             pickle 本体（"pickle" バイト）| 0埋め | buffer ...（各 8 バイト境界。"buffers" はセクション先頭からの [位置, 長さ]）
+- hmac     : セクション全体（＋名前・sha256・buffers）の HMAC-SHA256。pickle.loads の前に必ず照合し、
+             合わないセクションは読まない（JSON から作る）
+
+HMAC の鍵はデータとは別に持つ（環境変数か、DATA_DIR の外の鍵ファイル。main.py の DATA_SNAPSHOT_KEY*）。
+スナップショットや DATA_DIR を書き換えられても、鍵が無ければ通るセクションは作れない。
+鍵が無いプロセスはスナップショットを使わない。
+"""
+import hashlib, hmac, json, logging, mmap, os, pickle, secrets, struct, sys, time
+from typing import Any, Dict, List, Optional, Tuple
+
+MAGIC = b"RKSNAP\x00\x01"
+FORMAT = 3
+PAGE = mmap.ALLOCATIONGRANULARITY
+ALIGN = 8   # out-of-band バッファの境界（memoryview.cast で 8 バイト整数として読む）
+_HEADER = struct.Struct("<8sIIQ")
+
+
+def sha256_of(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def code_fingerprint(paths) -> str:
+    """派生構造を作るコード（*.py）の中身のハッシュ。変わったら古いスナップショットは使わない"""
+    h = hashlib.sha256(f"{sys.version_info[0]}.{sys.version_info[1]}".encode())
+    for p in sorted(paths):
+        with open(p, "rb") as f:
+            h.update(os.path.basename(p).encode() + b"\0" + f.read())
+    return h.hexdigest()
+
+
+def _pad(n: int, align: int = PAGE) -> int:
+    return -n % align
+
+
+# ===== HMAC の鍵 =====
+def read_key(path: str) -> Optional[bytes]:
+    """鍵ファイルの中身（無い・空なら None）"""
+    try:
+        with open(path, "rb") as f:
+            key = f.read().strip()
+    except OSError:
+        return None
+    return key or None
+
+
+def create_key(path: str) -> bytes:
+    """鍵ファイルが無ければランダムな鍵を作る（所有者だけ読める 0600）。あればその中身"""
+    key = read_key(path)
+    if key is not None:
+        return key
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    key = secrets.token_hex(32).encode()
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return read_key(path) or key   # 同時に作られた → そちらを使う
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def _mac(key: bytes, name: str, sha: str, buffers: List[List[int]]) -> "hmac.HMAC":
+    """セクションの HMAC（中身は呼び出し側で update する）。名前・sha256・バッファの位置も含める"""
+    h = hmac.new(key, digestmod=hashlib.sha256)
+    h.update(json.dumps([name, sha, buffers]).encode() + b"\0")
+    return h
+
+
+def _section(name: str, sha: str, obj: Any, key: bytes) -> Tuple[List[bytes], Dict[str, Any]]:
+    """1データセット分のセクション（書く順のバイト列）と toc のエントリ（offset 以外）"""
+    bufs: List[pickle.PickleBuffer] = []
+    body = pickle.dumps(obj, protocol=5, buffer_callback=bufs.append)
+    chunks: List[bytes] = [body]
+    pos = len(body)
+    buffers: List[List[int]] = []
+    for pb in bufs:
+        raw = pb.raw()
+        chunks.append(b"\0" * _pad(pos, ALIGN))
+        pos += _pad(pos, ALIGN)
+        buffers.append([pos, raw.nbytes])
+        chunks.append(raw)
+        pos += raw.nbytes
+    h = _mac(key, name, sha, buffers)
+    for c in chunks:
+        h.update(c)
+    return chunks, {"sha256": sha, "offset": 0, "length": pos, "pickle": len(body),
+                    "buffers": buffers, "hmac": h.hexdigest()}
+
+
+def read_generation(path: str) -> int:
+    """ヘッダの generation だけ読む（無い・壊れている・形式違いは 0）"""
+    try:
+        with open(path, "rb") as f:
+            magic, fmt, _, gen = _HEADER.unpack(f.read(_HEADER.size))
+    except (OSError, struct.error):
+        return 0
+    return gen if magic == MAGIC and fmt == FORMAT else 0
+
+
+def next_generation(path: str) -> int:
+    """
+    次に書く generation。今のファイルより大きく、かつ現在時刻（ミリ秒）以上にする。
+    ファイルが消されて read_generation が 0 に戻っても、前に配った番号と重ならない
+    """
+    return max(read_generation(path) + 1, time.time_ns() // 1_000_000)
+
+
+def write_snapshot(path: str, sections: Dict[str, Tuple[str, Any]], fingerprint: str,
+                   generation: int = 0, key: bytes = b"") -> Dict[str, Any]:
+    """
+    sections: 名前 → (元 JSON の sha256, pickle する値)。key: セクションの HMAC 鍵（読む側と同じもの）。
+    一時ファイルに書いてから置き換える
+    （開いているワーカーは古い inode を mmap したままなので、読んでいる途中で中身が変わることはない）
+    """
+    if not key:
+        raise ValueError("snapshot key is required")
+    built = {n: _section(n, sha, obj, key) for n, (sha, obj) in sections.items()}
+    toc: Dict[str, Any] = {
+        "fingerprint": fingerprint,
+        "python": sys.version.split()[0],
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "generation": generation,
+        "datasets": {n: ent for n, (_, ent) in built.items()},
+    }
+    # toc の長さが offset に依存するので、offset を仮置きして長さを確定させてから埋める
+    head_len = _HEADER.size + len(json.dumps(toc).encode()) + 16 * len(built) + 64
+    offset = head_len + _pad(head_len)
+    for n, (_, ent) in built.items():
+        ent["offset"] = offset
+        offset += ent["length"] + _pad(ent["length"])
+    toc_bytes = json.dumps(toc).encode()
+    assert _HEADER.size + len(toc_bytes) <= head_len
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT, len(toc_bytes), generation))
+        f.write(toc_bytes)
+        for n, (chunks, ent) in built.items():
+            f.write(b"\0" * (ent["offset"] - f.tell()))
+            for c in chunks:
+                f.write(c)
+        f.write(b"\0" * _pad(f.tell()))
+    os.replace(tmp, path)
+    return toc
+
+
+class Snapshot:
+    """
+    mmap したスナップショット。load() は sha256 が一致し、HMAC が通るデータセットだけ復元する。
+    key が無い（None・空）なら開かない
+    """
+
+    def __init__(self, path: str, fingerprint: str, key: Optional[bytes] = None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.key = key
+        self.toc: Dict[str, Any] = {}
+        self.mtime = 0.0
+        self.stamp: Tuple[int, int, int] = (0, 0, 0)   # 開いたファイルの (inode, mtime_ns, サイズ)
+        self.generation = 0
+        self._f = None
+        self._mm: Optional[mmap.mmap] = None
+
+    def refresh(self) -> bool:
+        """ファイルが（再）作成されていれば開き直す。使えるスナップショットがあれば True"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self.close()
+            return False
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stamp != self.stamp:
+            self.close()
+            self.mtime, self.stamp = st.st_mtime, stamp
+            try:
+                self._open()
+            except Exception as e:
+                logging.warning(f"snapshot {self.path} ignored: {e}")
+                self.close()
+                self.mtime, self.stamp = st.st_mtime, stamp   # 同じファイルで毎回警告しない
+        return self._mm is not None
+
+    def _open(self) -> None:
+        if not self.key:
+            raise ValueError("no snapshot key (set DATA_SNAPSHOT_KEY or DATA_SNAPSHOT_KEY_FILE)")
+        f = open(self.path, "rb")
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            f.close()
+            raise
+        self._f, self._mm = f, mm
+        magic, fmt, toc_len, gen = _HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or fmt != FORMAT:
+            raise ValueError(f"unsupported snapshot format {magic!r}/{fmt}")
+        toc = json.loads(mm[_HEADER.size:_HEADER.size + toc_len])
+        if toc.get("fingerprint") != self.fingerprint:
+            raise ValueError("built by different code (re-run data_process/compile.py)")
+        self.toc = toc
+        self.generation = gen
+        logging.info(f"snapshot opened: {self.path} (generation {gen}, {len(toc['datasets'])} datasets, created {toc.get('created')})")
+
+    def names(self) -> Dict[str, str]:
+        """収録データセット → 元 JSON の sha256"""
+        return {n: ent["sha256"] for n, ent in self.toc.get("datasets", {}).items()}
+
+    def load(self, name: str, sha: str) -> Optional[Any]:
+        ent = self.toc.get("datasets", {}).get(name) if self._mm is not None else None
+        if not ent or ent["sha256"] != sha:
+            return None
+        start = ent["offset"]
+        sec = memoryview(self._mm)[start:start + ent["length"]]
+        h = _mac(self.key, name, sha, ent["buffers"])
+        h.update(sec)
+        if not hmac.compare_digest(h.hexdigest(), ent.get("hmac", "")):
+            logging.warning(f"snapshot section {name} failed the integrity check; ignored")
+            return None
+        # out-of-band のバッファは mmap の memoryview のまま渡す（復元したオブジェクトがファイルのページを直接読む）
+        return pickle.loads(sec[:ent["pickle"]], buffers=[sec[o:o + n] for o, n in ent["buffers"]])
+
+    def close(self) -> None:
+        if self._mm is not None:
+            try:
+                self._mm.close()
+            except BufferError:
+                # 復元したオブジェクトがまだページを参照している → 最後の参照が無くなった時に unmap される
+                pass
+        if self._f is not None:
+            self._f.close()
+        self._f = self._mm = None
+        self.toc = {}
+        self.mtime = 0.0
+        self.stamp = (0, 0, 0)
+        self.generation = 0
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "loaded": self._mm is not None,
+            "generation": self.generation,
+            "created": self.toc.get("created"),
+            "datasets": sorted(self.toc.get("datasets", {})),
+        }
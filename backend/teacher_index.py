@@ -0,0 +1,193 @@
+"""
+教員名の検索インデックス。
+
+- AhoCorasick : 全教員名の多パターン・オートマトン。ユーザー文を1回走査するだけで
+                文中に含まれる教員名をすべて拾う（従来の「名前 in text」全件ループの置き換え）
+- TeacherIndex: 上記＋氏名の文字 n-gram（1/2-gram）ポスティング。
+                部分一致（/admin/teachers?like= もここを使う）と候補のランキングを担当
+
+どちらも作り終えたら flat の列（遷移・出力・ポスティング）に詰め直す（スナップショットでは mmap のまま読む）。
+"""
+import re
+from array import array
+from bisect import bisect_left
+from collections import deque
+from typing import Dict, Iterable, List, Set
+
+from flat import Column, Postings, StrTable, csr, literal
+from records import Teacher, TeacherTable
+
+# candidates の重み。漢字の一致を強く、かなは弱く（長音・記号・空白は数えない）
+KANJI_WEIGHT = 3
+KANA_WEIGHT = 1
+BIGRAM_WEIGHT = 2
+HEAD_BONUS = 1
+_KANJI_RE = re.compile(r"[一-龥々〆ヵヶ]")
+# どのカタカナ語にも出てくる文字（「テニスサークル」が外国人名の「クリストファー」に寄らないように）
+_IGNORED_CHARS = frozenset("ーｰ・ 　（）()、,.-")
+
+
+class AhoCorasick:
+    """
+    文字単位の Aho–Corasick。find(text) はヒットしたパターン ID の集合を返す。
+    作る時は dict のトライで、作り終えたら遷移を「ノードごとに文字コード順の (文字, 行き先)」の列に詰める
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[int]] = [[]]
+        patterns = list(patterns)
+        for pid, p in enumerate(patterns):
+            if p:
+                self._insert(p, pid)
+        self._link()
+        self._freeze()
+
+    def _insert(self, p: str, pid: int) -> None:
+        node = 0
+        for ch in p:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = nxt
+        self.out[node].append(pid)
+
+    def _link(self) -> None:
+        q = deque(self.goto[0].values())
+        while q:
+            node = q.popleft()
+            for ch, nxt in self.goto[node].items():
+                q.append(nxt)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                cand = self.goto[f].get(ch, 0)
+                self.fail[nxt] = cand if cand != nxt else 0
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def _freeze(self) -> None:
+        edges = [sorted((ord(ch), nxt) for ch, nxt in g.items()) for g in self.goto]
+        self.edge_starts, self.edge_chars = csr([c for c, _ in e] for e in edges)
+        self.edge_next = Column(array("I", (n for e in edges for _, n in e)))
+        self.fail = Column(self.fail)
+        self.out_starts, self.out_ids = csr(self.out)
+        del self.goto, self.out
+
+    def find(self, text: str) -> Set[int]:
+        hits: Set[int] = set()
+        node = 0
+        starts, chars, nxt = self.edge_starts.view, self.edge_chars.view, self.edge_next.view
+        fail, out_starts, out_ids = self.fail.view, self.out_starts.view, self.out_ids.view
+        for ch in map(ord, text):
+            while True:
+                lo, hi = starts[node], starts[node + 1]
+                j = bisect_left(chars, ch, lo, hi)
+                if j < hi and chars[j] == ch:
+                    node = nxt[j]
+                    break
+                if not node:
+                    break
+                node = fail[node]
+            a, b = out_starts[node], out_starts[node + 1]
+            if b > a:
+                hits.update(out_ids[a:b])
+        return hits
+
+
+class TeacherIndex:
+    """TEACHERS（records.TeacherTable）上の氏名インデックス。返り値は常に元の並び順"""
+
+    def __init__(self, teachers: TeacherTable):
+        self.teachers = teachers
+        self.names: StrTable = teachers.names   # 表の列をそのまま共有する
+
+        # 同名の教員は1パターンにまとめる（パターン ID → 行番号の並び）
+        by_name: Dict[str, List[int]] = {}
+        for i, n in enumerate(self.names):
+            if n:
+                by_name.setdefault(n, []).append(i)
+        self.automaton = AhoCorasick(by_name)
+        self._row_starts, self._row_ids = csr(by_name.values())
+
+        postings: Dict[str, List[int]] = {}
+        for i, n in enumerate(self.names):
+            grams = set(n) | {n[j:j + 2] for j in range(len(n) - 1)}
+            for g in grams:
+                postings.setdefault(g, []).append(i)
+        self.postings = Postings(postings)
+
+    def __len__(self) -> int:
+        return len(self.teachers)
+
+    def names_in(self, text: str) -> List[Teacher]:
+        """text に氏名がそのまま含まれている教員"""
+        starts, ids = self._row_starts, self._row_ids
+        rows = sorted(i for pid in self.automaton.find(text) for i in ids[starts[pid]:starts[pid + 1]])
+        return [self.teachers[i] for i in rows]
+
+    def _contains_ids(self, key: str) -> List[int]:
+        if not key:
+            return list(range(len(self.teachers)))
+        if len(key) <= 2:
+            return self.postings.get(key, [])
+        lists = []
+        for j in range(len(key) - 1):
+            p = self.postings.get(key[j:j + 2])
+            if not p:
+                return []
+            lists.append(p)
+        lists.sort(key=len)
+        cand = set(lists[0])
+        for p in lists[1:]:
+            cand.intersection_update(p)
+        names, pat = self.names, literal(key)
+        return sorted(i for i in cand if names.search(pat, i))
+
+    def contains(self, key: str) -> List[Teacher]:
+        """氏名に key を部分文字列として含む教員"""
+        return [self.teachers[i] for i in self._contains_ids(key)]
+
+    def candidates(self, key: str, limit: int = 5) -> List[str]:
+        """
+        部分一致しない時の候補名。key と共有する文字（漢字 3・かなほか 1、長音や記号は 0）と
+        2-gram（2。長音・記号を含むものは数えない）の重みに、頭文字（姓の1文字目）一致のボーナスを足してランキング。
+        key が2文字以上なら、漢字か 2-gram を共有する候補だけ出す（かなが1文字ずつ当たっただけの名前は出さない）。
+        同点は元の並び順、同名は1件にまとめる。
+        """
+        if not key:
+            return []
+        scores: Dict[int, int] = {}
+        strong: Set[int] = set()
+        for ch in set(key) - _IGNORED_CHARS:
+            kanji = bool(_KANJI_RE.match(ch))
+            w = KANJI_WEIGHT if kanji else KANA_WEIGHT
+            for i in self.postings.get(ch, []):
+                scores[i] = scores.get(i, 0) + w
+                if kanji:
+                    strong.add(i)
+        for bg in {key[j:j + 2] for j in range(len(key) - 1)}:
+            if _IGNORED_CHARS.intersection(bg):
+                continue
+            for i in self.postings.get(bg, []):
+                scores[i] = scores.get(i, 0) + BIGRAM_WEIGHT
+                strong.add(i)
+        if key[0] not in _IGNORED_CHARS:
+            for i in self.postings.get(key[0], []):
+                if self.names[i].startswith(key[0]):
+                    scores[i] += HEAD_BONUS
+        seen, top = set(), []
+        for i, sc in sorted(scores.items(), key=lambda x: (-x[1], x[0])):
+            if len(key) >= 2 and i not in strong:
+                continue
+            n = self.names[i]
+            if n and n not in seen:
+                seen.add(n)
+                top.append(n)
+                if len(top) >= limit:
+                    break
+        return top
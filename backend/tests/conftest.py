@@ -0,0 +1,27 @@
+# backend/ のモジュールはフラットに並んでいるので、backend/ を import パスに入れる
+import os, sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def app_main():
+    """main を LLM・監視・スナップショットなしで import する（main.py は Python 3.12 の構文を使う）"""
+    if sys.version_info < (3, 12):
+        pytest.skip("main.py requires Python 3.12")
+    pytest.importorskip("fastapi")
+    os.environ.update(DATA_WATCH_INTERVAL="0", DATA_SNAPSHOT="", OPENAI_API_KEY="", SESSION_SPILL_PATH="")
+    os.chdir(BACKEND)
+    import main
+    return main
+
+
+@pytest.fixture()
+def client(app_main):
+    from fastapi.testclient import TestClient
+    app_main.RESPONSE_CACHE.clear()
+    with TestClient(app_main.app) as c:
+        yield c
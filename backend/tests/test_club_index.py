@@ -0,0 +1,67 @@
+"""club_index.ClubIndex の検索（同梱の data/clubs.json を使う）"""
+import json, os
+
+import pytest
+
+from club_index import ClubIndex
+from records import ClubTable
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+@pytest.fixture(scope="module")
+def index() -> ClubIndex:
+    with open(os.path.join(DATA_DIR, "clubs.json"), encoding="utf-8") as f:
+        return ClubIndex(ClubTable(json.load(f)))
+
+
+def names(index: ClubIndex, q: str):
+    return [c.name for _, c in index.search(q)]
+
+
+# ===== サークルと関係ない質問には何も返さない =====
+@pytest.mark.parametrize("q", [
+    "井上先生のオフィスアワーは？",
+    "第2クォーター 授業開始",
+    "佐藤教授の研究室",
+    "夏休みはいつ",
+])
+def test_off_topic_returns_nothing(index, q):
+    assert names(index, q) == []
+
+
+# ===== 1語だけ偶然当たったサークルは出さない =====
+def test_exact_name_only(index):
+    assert names(index, "アルティメット") == ["琉大アルティメットサークルRyuul"]
+
+
+def test_genre_without_generic_words(index):
+    got = names(index, "野球部の活動場所")
+    assert got[:2] == ["硬式野球部", "琉球大学医学部準硬式野球部"]
+    assert "琉球大学サークル ヨリドコロ" not in got
+
+
+def test_katakana_long_vowel_does_not_match(index):
+    got = names(index, "アメリカンフットボール")
+    assert got[0] == "琉球大学アメリカンフットボール部"
+    assert not any("バスケットボール" in n for n in got)
+
+
+# ===== 従来どおり当たるもの =====
+@pytest.mark.parametrize("q, top", [
+    ("サッカー部はありますか", "琉球大学全学サッカー部"),
+    ("アメフト部について教えて", "琉球大学アメリカンフットボール部"),
+    ("競技かるたサークルの活動日", "競技かるたサークル"),
+    ("漫画研究会の場所は？", "琉球大学漫画研究会（漫研）"),
+    ("ダイビングのサークルを探しています", "琉球大学医学部ダイビング部"),
+    ("ロボットを作る部活", "琉球大学Robotサークル"),
+    ("TRPGサークル", "TRPGサークル"),
+    ("ヨリドコロ", "琉球大学サークル ヨリドコロ"),
+])
+def test_relevant_top(index, q, top):
+    assert names(index, q)[0] == top
+
+
+def test_weekday_query(index):
+    got = [c for _, c in index.search("土曜日に活動しているサークル")]
+    assert got and all("土" in c.day or "土" in c.detail for c in got)
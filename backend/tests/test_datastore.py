@@ -0,0 +1,44 @@
+"""DataStore の遅延構築をイベントループの上でしないこと"""
+import asyncio, json, os, threading
+
+from datastore import DataStore
+
+
+def _store(tmp_path, built):
+    (tmp_path / "a.json").write_text(json.dumps([{"name": "x"}]), encoding="utf-8")
+
+    def build(raw):
+        built.append(threading.get_ident())
+        return {"rows": raw or []}
+
+    store = DataStore(str(tmp_path), {"a": build}, provides={"a": ["rows"]})
+    store.reload()
+    return store
+
+
+def test_aload_builds_off_loop(tmp_path):
+    built = []
+    store = _store(tmp_path, built)
+    assert not built and not store.current.loaded
+
+    async def run():
+        loop_thread = threading.get_ident()
+        v = await store.aload()
+        return loop_thread, v
+
+    loop_thread, v = asyncio.run(run())
+    assert v.loaded and v.rows == [{"name": "x"}]
+    assert built and loop_thread not in built
+
+
+def test_reload_builds_new_version_before_swap(tmp_path):
+    built = []
+    store = _store(tmp_path, built)
+    store.current.load_all()
+    path = tmp_path / "a.json"
+    path.write_text(json.dumps([{"name": "y"}]), encoding="utf-8")
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    store.reload()
+    # 差し替えた時点で全部できている（リクエスト側で作らない）
+    assert store.current.loaded and store.current.rows == [{"name": "y"}]
@@ -0,0 +1,54 @@
+"""flat の列がスナップショット（pickle protocol 5 の out-of-band バッファ）を通してもコピーされないこと"""
+import pickle
+
+import pytest
+
+from flat import Column, Postings, StrTable, csr, literal
+
+
+def _round_trip(obj):
+    """snapshot.py と同じく、バッファを外に出して memoryview で戻す"""
+    bufs = []
+    data = pickle.dumps(obj, protocol=5, buffer_callback=bufs.append)
+    backing = [bytearray(b.raw()) for b in bufs]
+    return pickle.loads(data, buffers=[memoryview(b) for b in backing]), backing
+
+
+def test_strtable_indexing():
+    t = StrTable(["", "琉球", "abc", "\udc80"])
+    assert len(t) == 4 and list(t) == ["", "琉球", "abc", "\udc80"]
+    assert t[1] == "琉球" and t[-1] == "\udc80" and t[1:3] == ["琉球", "abc"]
+    with pytest.raises(IndexError):
+        t[4]
+    with pytest.raises(IndexError):
+        t[-5]
+    assert bytes(t.raw(1)) == "琉球".encode()
+    assert t.search(literal("球"), 1) and not t.search(literal("球"), 2)
+    # 隣の要素にまたがって当たらない
+    assert not t.search(literal("球a"), 1)
+
+
+def test_postings_lookup():
+    p = Postings({"サッカー": [(0, 1.5), (3, 0.5)], "野球": [(2, 2.0)]}, "Id")
+    assert len(p) == 2 and "野球" in p and "テニス" not in p
+    assert list(p.items("サッカー")) == [(0, 1.5), (3, 0.5)]
+    assert list(p.get("野球")) == [2] and p.get("テニス") == ()
+    assert p.df("サッカー") == 2 and p.df("テニス") == 0
+    assert list(p.items("テニス")) == []
+
+
+def test_round_trip_is_zero_copy():
+    t = StrTable(["教員", "サークル"])
+    p = Postings({"a": [1, 2], "b": [3]})
+    starts, vals = csr([[1, 2], [], [3]])
+    (t2, p2, c2), backing = _round_trip((t, p, Column([7, 8, 9], "H")))
+    assert backing, "out-of-band で出ていない"
+    assert list(t2) == ["教員", "サークル"] and list(p2.get("a")) == [1, 2] and list(c2) == [7, 8, 9]
+    # 復元した列は渡したバッファ（スナップショットでは mmap）をそのまま見ている
+    assert any(c2.view.obj is b for b in backing) and c2.view.format == "H"
+    assert [list(vals[starts[i]:starts[i + 1]]) for i in range(len(starts) - 1)] == [[1, 2], [], [3]]
+
+
+def test_protocol_4_falls_back_to_bytes():
+    t = StrTable(["x", "yz"])
+    assert list(pickle.loads(pickle.dumps(t, protocol=4))) == ["x", "yz"]
@@ -0,0 +1,30 @@
+"""records の列指向の表が元の JSON を失わないこと"""
+from records import ClubTable, TeacherTable
+
+
+def test_teacher_round_trip():
+    rows = [
+        {"所属": "工学部", "名前": "山田", "memo": "月曜4限", "リンク": "https://example.com"},
+        {"所属": "理学部", "名前": "鈴木", "memo": None, "room": "301"},
+        {"名前": "佐藤"},
+    ]
+    t = TeacherTable(rows)
+    assert [r.to_dict() for r in t] == rows
+    assert t[1].memo == "" and t[1].has("memo")
+    assert not t[2].has("memo") and t[2].dept == ""
+
+
+def test_teacher_link_alias():
+    t = TeacherTable([{"所属": "A", "名前": "B", "memo": "", "link": "https://example.com"}])
+    assert t[0].link == "https://example.com"
+    assert t[0].to_dict() == {"所属": "A", "名前": "B", "memo": "", "リンク": "https://example.com"}
+
+
+def test_club_round_trip():
+    rows = [
+        {"name": "天文サークル", "day": "金曜", "location": "未記載", "detail": "観望会", "sns": None},
+        {"name": "TRPGサークル", "tags": ["ゲーム"], "members": 12},
+    ]
+    c = ClubTable(rows)
+    assert [r.to_dict() for r in c] == rows
+    assert c[1].day == "" and not c[1].has("day")
@@ -0,0 +1,32 @@
+"""応答キャッシュのキー（言い回しが近くても答えが違う質問は別のキーになること）"""
+import pytest
+
+
+def ask(client, q: str, category: str = "auto") -> str:
+    r = client.post("/api/chat", json={"content": q, "category": category})
+    assert r.status_code == 200
+    return r.json()["content"]
+
+
+# ===== 区切りだけが違う日付は別の質問 =====
+@pytest.mark.parametrize("first, second", [
+    ("2025-1-11の予定", "2025-11-1の予定"),
+    ("2025/1/11の予定", "2025/11/1の予定"),
+])
+def test_colliding_dates(client, first, second):
+    a = ask(client, first, "calendar")
+    b = ask(client, second, "calendar")
+    assert "2025-01-11" in a
+    assert "2025-11-01" in b and "2025-01-11" not in b
+
+
+def test_same_span_shares_entry(app_main):
+    k1 = app_main.response_cache_key("calendar", "2025-11-1の予定")
+    k2 = app_main.response_cache_key("calendar", "２０２５-１１-０１ の予定は？")
+    assert k1 == k2
+
+
+def test_normalize_keeps_digit_separators():
+    from cache import normalize_query
+    assert normalize_query("2025-1-11の予定") != normalize_query("2025-11-1の予定")
+    assert normalize_query("サッカー部は？") == normalize_query("サッカー部は")
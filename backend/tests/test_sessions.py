@@ -0,0 +1,62 @@
+"""会話セッションの指示語の解決（main.resolve_followup）と SQLite への退避"""
+import asyncio, threading, time
+
+import pytest
+
+from sessions import Session, SessionStore
+
+
+@pytest.fixture()
+def session():
+    now = time.time()
+    return Session("s", now, now, entities={"teacher": "山田", "club": "軽音楽部"})
+
+
+@pytest.mark.parametrize("q, want", [
+    ("その先生の研究室は？", ("山田先生の研究室は？", "teacher")),
+    ("この教授は何曜日にいますか", ("山田先生は何曜日にいますか", "teacher")),
+    ("そのサークルの活動日は？", ("軽音楽部の活動日は？", "clubs")),
+    ("その部の場所は？", ("軽音楽部の場所は？", "clubs")),
+    ("この部活は？", ("軽音楽部は？", "clubs")),
+])
+def test_refers_to_remembered(app_main, session, q, want):
+    assert app_main.resolve_followup(session, q) == want
+
+
+# ===== 「方」「部」などで始まる普通の語は指示語ではない =====
+@pytest.mark.parametrize("q", [
+    "その方法を教えて",
+    "この方向で合ってる？",
+    "その方がいい？",
+    "その部分がわからない",
+    "この部屋はどこ？",
+    "この教員免許の取り方は？",
+])
+def test_ordinary_words_are_not_references(app_main, session, q):
+    assert app_main.resolve_followup(session, q) is None
+
+
+# ===== 退避先（SQLite）の読み書きはイベントループの外で =====
+def test_spill_and_restore_off_loop(tmp_path):
+    store = SessionStore(maxsize=1, spill_path=str(tmp_path / "sessions.db"))
+    threads = []
+    for name in ("_spill", "_restore"):
+        real = getattr(store, name)
+
+        def traced(*a, _real=real):
+            threads.append(threading.get_ident())
+            return _real(*a)
+        setattr(store, name, traced)
+
+    async def run():
+        first = await store.aget(None)
+        store.record(first, "質問", "回答")
+        await store.aget(None)                # maxsize=1 → first を追い出して退避
+        back = await store.aget(first.id)     # 退避先から戻す
+        return threading.get_ident(), first, back
+
+    loop_thread, first, back = asyncio.run(run())
+    assert back.id == first.id and back.turns == [("user", "質問"), ("assistant", "回答")]
+    assert store.counters["spilled"] >= 1 and store.counters["restored"] == 1
+    assert threads and loop_thread not in threads
+    store.close()
@@ -0,0 +1,57 @@
+"""スナップショットのセクションは HMAC が通った時だけ復元すること"""
+import pickle
+
+import pytest
+
+from snapshot import Snapshot, create_key, read_key, write_snapshot
+
+KEY = b"k" * 32
+
+
+@pytest.fixture()
+def snap_path(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    payload = {"rows": ["a", "b"], "buf": pickle.PickleBuffer(b"0123456789abcdef")}
+    write_snapshot(path, {"ds": ("sha", payload)}, "fp", generation=1, key=KEY)
+    return path
+
+
+def test_round_trip_keeps_buffers_on_the_mmap(snap_path):
+    snap = Snapshot(snap_path, "fp", KEY)
+    assert snap.refresh()
+    obj = snap.load("ds", "sha")
+    assert obj["rows"] == ["a", "b"]
+    # out-of-band のバッファはコピーされず、mmap の memoryview のまま
+    assert isinstance(obj["buf"], memoryview) and obj["buf"].tobytes() == b"0123456789abcdef"
+    assert snap.load("ds", "other-sha") is None
+    snap.close()
+
+
+def test_tampered_section_is_not_unpickled(snap_path):
+    snap = Snapshot(snap_path, "fp", KEY)
+    assert snap.refresh()
+    ent = snap.toc["datasets"]["ds"]
+    snap.close()
+    with open(snap_path, "r+b") as f:
+        f.seek(ent["offset"] + ent["buffers"][0][0])
+        f.write(b"X")
+    snap = Snapshot(snap_path, "fp", KEY)
+    assert snap.refresh()
+    assert snap.load("ds", "sha") is None
+    snap.close()
+
+
+def test_wrong_or_missing_key(snap_path):
+    wrong = Snapshot(snap_path, "fp", b"other")
+    assert wrong.refresh() and wrong.load("ds", "sha") is None
+    wrong.close()
+    assert not Snapshot(snap_path, "fp", None).refresh()
+    with pytest.raises(ValueError):
+        write_snapshot(snap_path, {}, "fp", key=b"")
+
+
+def test_create_key(tmp_path):
+    path = str(tmp_path / "keys" / "snapshot.key")
+    assert read_key(path) is None
+    key = create_key(path)
+    assert key and read_key(path) == key and create_key(path) == key
@@ -0,0 +1,34 @@
+"""teacher_index.TeacherIndex の候補名（同梱の data/ryukyu_office_hours.json を使う）"""
+import json, os
+
+import pytest
+
+from records import TeacherTable
+from teacher_index import TeacherIndex
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+@pytest.fixture(scope="module")
+def index() -> TeacherIndex:
+    with open(os.path.join(DATA_DIR, "ryukyu_office_hours.json"), encoding="utf-8") as f:
+        return TeacherIndex(TeacherTable(json.load(f)))
+
+
+# ===== かな1文字ずつ・長音が当たっただけの名前は出さない =====
+@pytest.mark.parametrize("key", ["テニスサークル", "アメリカンフットボール"])
+def test_katakana_words_suggest_nothing(index, key):
+    assert index.candidates(key) == []
+
+
+# ===== 漢字の一致は1文字でも候補にする =====
+def test_shared_kanji(index):
+    assert "眞榮城千夏子" in index.candidates("夏休み")
+
+
+def test_kanji_ranks_first(index):
+    assert index.candidates("山田太郎")[:4] == ["山田健太", "山田義智", "山田孝治", "山田広幸"]
+
+
+def test_katakana_name(index):
+    assert index.candidates("フランク") == ["Delbarre Franck（デルバール フランク）"]
@@ -0,0 +1,107 @@
+"""
+天気（open-meteo）の取得をキャッシュ付きで行う。
+
+- 地名 → 緯度経度   : 既知の都市は表で持ち、それ以外は初回だけジオコーディングして永続メモ化
+- 現在の天気        : 地点ごとに短い TTL でキャッシュ。期限の手前で裏で更新（refresh-ahead）
+- 同時リクエスト    : SingleFlight で地点ごとに上流 1 本にまとめる
+"""
+import asyncio, logging, time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from cache import SingleFlight
+
+GEOCODE_URL = "https://geocoding-api.open-meteo.com/v1/search"
+FORECAST_URL = "https://api.open-meteo.com/v1/forecast"
+
+# 地名 → (緯度, 経度)。main.get_weather の都市リストと揃える
+KNOWN_CITIES: Dict[str, Tuple[float, float]] = {
+    "札幌": (43.0642, 141.3469),
+    "仙台": (38.2682, 140.8694),
+    "東京": (35.6895, 139.6917),
+    "横浜": (35.4478, 139.6425),
+    "名古屋": (35.1815, 136.9066),
+    "京都": (35.0116, 135.7681),
+    "大阪": (34.6937, 135.5023),
+    "神戸": (34.6901, 135.1955),
+    "広島": (34.3853, 132.4553),
+    "福岡": (33.6064, 130.4181),
+    "那覇": (26.2124, 127.6809),
+    "沖縄": (26.3344, 127.8056),
+}
+
+FetchJson = Callable[[str, Dict[str, Any]], Awaitable[dict]]
+
+
+class WeatherService:
+    def __init__(self, fetch_json: FetchJson, ttl: float = 600.0, refresh_ahead: float = 120.0):
+        self.fetch_json = fetch_json
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead
+        self.geocode: Dict[str, Optional[Tuple[float, float]]] = dict(KNOWN_CITIES)
+        self._forecast: Dict[Tuple[float, float], Tuple[float, dict]] = {}  # 座標 -> (取得時刻, current)
+        self._flight = SingleFlight()
+        self.counters = {
+            "geocode_hits": 0, "geocode_misses": 0,
+            "forecast_hits": 0, "forecast_misses": 0, "forecast_refreshes": 0,
+        }
+
+    async def locate(self, name: str) -> Optional[Tuple[float, float]]:
+        if name in self.geocode:
+            self.counters["geocode_hits"] += 1
+            return self.geocode[name]
+        self.counters["geocode_misses"] += 1
+
+        async def fetch():
+            g = await self.fetch_json(GEOCODE_URL, {"name": name, "count": 1, "language": "ja"})
+            res = g.get("results") or []
+            # 見つからなかった地名も覚えておく（毎回問い合わせない）
+            self.geocode[name] = (res[0]["latitude"], res[0]["longitude"]) if res else None
+            return self.geocode[name]
+
+        return await self._flight.do(("geo", name), fetch)
+
+    def _fetch_forecast(self, coord: Tuple[float, float]) -> "asyncio.Task":
+        async def fetch():
+            f = await self.fetch_json(FORECAST_URL, {
+                "latitude": coord[0], "longitude": coord[1], "current": "temperature_2m,weathercode",
+            })
+            cur = f.get("current", {})
+            self._forecast[coord] = (time.monotonic(), cur)
+            return cur
+
+        return self._flight.start(("fc", coord), fetch)
+
+    async def current(self, coord: Tuple[float, float]) -> dict:
+        ent = self._forecast.get(coord)
+        if ent is not None:
+            age = time.monotonic() - ent[0]
+            if age < self.ttl:
+                self.counters["forecast_hits"] += 1
+                if age >= self.ttl - self.refresh_ahead and not self._flight.running(("fc", coord)):
+                    # 期限間近: 今の値を返しつつ裏で更新（失敗しても次回の miss で取り直す）
+                    self.counters["forecast_refreshes"] += 1
+                    self._fetch_forecast(coord).add_done_callback(_log_refresh_error)
+                return ent[1]
+        self.counters["forecast_misses"] += 1
+        return await asyncio.shield(self._fetch_forecast(coord))
+
+    def stats(self) -> Dict[str, Any]:
+        c = self.counters
+
+        def ratio(h: int, m: int) -> float:
+            return round(h / (h + m), 4) if h + m else 0.0
+
+        return {
+            **c,
+            "geocode_hit_ratio": ratio(c["geocode_hits"], c["geocode_misses"]),
+            "forecast_hit_ratio": ratio(c["forecast_hits"], c["forecast_misses"]),
+            "geocode_size": len(self.geocode),
+            "forecast_size": len(self._forecast),
+            "upstream_calls": self._flight.calls,
+            "coalesced": self._flight.coalesced,
+        }
+
+
+def _log_refresh_error(task: "asyncio.Task") -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logging.warning(f"weather refresh failed: {task.exception()}")
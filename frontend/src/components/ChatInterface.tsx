@@ -25,6 +25,8 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({
   const [inputValue, setInputValue] = useState('');
   const [isTyping, setIsTyping] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  // 会話セッション（前のやり取りを踏まえた追質問用）。'' は次の送信で新しく始める
+  const sessionIdRef = useRef('');
 
   const IconComponent =
     Icons[category.icon as keyof typeof Icons] as React.ComponentType<{ size?: number }>;
@@ -49,6 +51,7 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({
       category: category.id,
     };
     setMessages([welcomeMessage]);
+    sessionIdRef.current = '';
   }, [category]);
 
   const sendMessage = async (content: string, type: 'text' | 'voice' | 'image' = 'text') => {
@@ -67,14 +70,69 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({
     setInputValue('');
     setIsTyping(true);
 
+    const botId = (Date.now() + 1).toString();
+
+    // 受信途中のテキストでボットメッセージを作成/更新する
+    const upsertBot = (patch: Partial<Message>) => {
+      setMessages((prev) => {
+        if (prev.some((m) => m.id === botId)) {
+          return prev.map((m) => (m.id === botId ? { ...m, ...patch } : m));
+        }
+        const bot: Message = {
+          id: botId,
+          content: '',
+          sender: 'bot',
+          timestamp: new Date(),
+          category: category.id,
+          ...patch,
+        };
+        return [...prev, bot];
+      });
+    };
+
     try {
-      const response = await fetch(`${API_BASE}/api/chat`, {
+      const response = await fetch(`${API_BASE}/api/chat/stream`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ content, category: category.id, type }),
+        headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+        body: JSON.stringify({ content, category: category.id, type, session_id: sessionIdRef.current }),
       });
+      if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+      // SSE（event: delta / done）を順に読む
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let streamed = '';
+      let data: any = null;
 
-      const data = await response.json();
+      while (data === null) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let sep: number;
+        while ((sep = buffer.indexOf('\n\n')) >= 0) {
+          const block = buffer.slice(0, sep);
+          buffer = buffer.slice(sep + 2);
+          let event = 'message';
+          let payload = '';
+          for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) payload += line.slice(5).trim();
+          }
+          if (!payload) continue;
+          const parsed = JSON.parse(payload);
+          if (event === 'delta') {
+            streamed += parsed.content ?? '';
+            setIsTyping(false);
+            upsertBot({ content: streamed });
+          } else if (event === 'done') {
+            data = parsed;
+          }
+        }
+      }
+      if (data === null) throw new Error('stream closed before done event');
+      if (typeof data.session_id === 'string') sessionIdRef.current = data.session_id;
 
       // 可変な応答を attachments にまとめる
       const attachments: NonNullable<Message['attachments']> = [];
@@ -110,16 +168,12 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({
         }
       }
 
-      const botMessage: Message = {
-        id: (Date.now() + 1).toString(),
+      upsertBot({
         content: data.content,
-        sender: 'bot',
         timestamp: new Date(data.timestamp ?? Date.now()),
         category: data.category ?? category.id,
         attachments: attachments.length ? attachments : undefined,
-      };
-
-      setMessages((prev) => [...prev, botMessage]);
+      });
     } catch (error) {
       console.error('API通信エラー:', error);
       alert('サーバーとの通信に失敗しました。バックエンドが起動しているか確認してください。');